@@ -3,12 +3,208 @@ import make_grow
 import yaml
 import os,sys
 import glob
+import json
 import pandas as pd
 
 import sprout_core.config_core as config_core
 import sprout_core.sprout_core as sprout_core
 
-            
+
+# Settings that do not change how the labels grow, or that are part of the
+# threshold steps, ignored when matching the runs of a sweep
+sweep_ignored_keys = ["thresholds", "upper_thresholds", "dilation_steps", "save_every_n_iters",
+                      "output_folder", "final_grow_output_folder", "num_threads", "is_sort",
+                      "is_make_meshes", "downsample_scale", "step_size",
+                      "checkpoint_every_n_iters", "resume", "share_prefix"]
+
+
+def get_grow_kwargs(config, optional_params):
+    """
+    Parameters of make_grow.grow_mp for one row, without the image, seed and output folder.
+
+    Args:
+        config (dict): Validated config of the row.
+        optional_params (dict): Optional parameters of the row.
+
+    Returns:
+        dict: Keyword arguments of grow_mp.
+    """
+    return dict(
+        boundary_path = optional_params['boundary_path'],
+
+        workspace = None,               
+
+        dilation_steps = config['dilation_steps'],
+        thresholds = config['thresholds'],
+        upper_thresholds = optional_params["upper_thresholds"],
+        num_threads = config['num_threads'],
+        
+        save_every_n_iters = config['save_every_n_iters'],  
+        snapshot_format = optional_params['snapshot_format'],
+        checkpoint_every_n_iters = optional_params['checkpoint_every_n_iters'],
+        resume = optional_params['resume'],
+        touch_rule = config['touch_rule'],             
+        grow_engine = optional_params['grow_engine'],
+        memory_budget_mb = optional_params['memory_budget_mb'],
+        multires_factor = optional_params['multires_factor'],
+        morph_backend = optional_params['morph_backend'],
+        stack_2d = optional_params['stack_2d'],
+
+        grow_to_end = optional_params["grow_to_end"],
+        to_grow_ids = optional_params["to_grow_ids"],
+        
+        final_grow_output_folder = config['output_folder'],
+        
+        # base_name =  optional_params["base_name"],
+        use_simple_naming =  optional_params["use_simple_naming"],    
+
+        is_sort = optional_params['is_sort'],
+        min_growth_size = optional_params['min_growth_size'],
+        no_growth_max_iter = optional_params['no_growth_max_iter'],
+        label_min_growth_size = optional_params['label_min_growth_size'],
+        label_no_growth_max_iter = optional_params['label_no_growth_max_iter'],
+
+        # For mesh making
+        is_make_meshes = optional_params['is_make_meshes'],
+        downsample_scale = optional_params['downsample_scale'],
+        step_size  = optional_params['step_size']
+    )
+
+
+def skip_grown_row(df, index, config, base_name):
+    """
+    With resume, skip a row that was fully grown before, i.e. has a final result but no checkpoint.
+
+    Args:
+        df (pd.DataFrame): Batch table, the outputs of a skipped row are filled in.
+        index: Index of the row.
+        config (dict): Config of the row.
+        base_name (str): Base name of the row's output.
+
+    Returns:
+        bool: True if the row is skipped.
+    """
+    final_output_path = os.path.join(config['output_folder'], f"FINAL_GROW_{base_name}.tif")
+    checkpoint_path = make_grow.get_checkpoint_path(os.path.join(config['output_folder'], base_name),
+                                                    base_name)
+    if os.path.exists(final_output_path) and not os.path.exists(checkpoint_path):
+        print(f"Skipping {config['seg_path']} on {config['img_path']}, it has been grown: {final_output_path}")
+        df.loc[index,'final_output_path'] = final_output_path
+        df.loc[index,'output_folder'] = os.path.join(config['output_folder'], base_name)
+        return True
+    return False
+
+
+def run_shared_image_groups(df, configs, optional_params_list):
+    """
+    Grow the rows with the same image and settings together, see make_grow.grow_mp_multi_seeds.
+
+    Rows that only differ in `seg_path` are grown as one group: the image is
+    loaded and thresholded once, and the seeds are grown concurrently. The
+    outputs are named after the seed files.
+
+    Args:
+        df (pd.DataFrame): Batch table, the outputs and errors of every row are filled in.
+        configs (list[dict]): Validated config of every row.
+        optional_params_list (list[dict]): Optional parameters of every row.
+    """
+    groups = {}
+    for position, config in enumerate(configs):
+        group_key = json.dumps({key: value for key, value in config.items() if key != "seg_path"},
+                               sort_keys=True, default=str)
+        groups.setdefault(group_key, []).append(position)
+
+    for positions in groups.values():
+        config = configs[positions[0]]
+        optional_params = optional_params_list[positions[0]]
+
+        seed_positions = []
+        for position in positions:
+            base_name = config_core.check_and_assign_base_name(None, configs[position]['seg_path'], "grown_result")
+            if optional_params['resume'] and skip_grown_row(df, df.index[position], configs[position], base_name):
+                continue
+            seed_positions.append(position)
+        if not seed_positions:
+            continue
+
+        print(f"Growing {len(seed_positions)} seeds on {config['img_path']}")
+        try:
+            results = make_grow.grow_mp_multi_seeds(
+                img_path = config['img_path'],
+                seg_paths = [configs[position]['seg_path'] for position in seed_positions],
+                output_folders = config['output_folder'],
+                raise_errors = False,
+                **get_grow_kwargs(config, optional_params)
+            )
+        except Exception as e:
+            # The image, boundary or thresholds of the group could not be used
+            print(f"Error occurs when growing on {config['img_path']}")
+            results = [e] * len(seed_positions)
+
+        for position, result in zip(seed_positions, results):
+            index = df.index[position]
+            if isinstance(result, Exception):
+                df.loc[index,'error'] = str(result)
+            else:
+                _, log_dict = result
+                df.loc[index,'final_output_path'] = log_dict['final_output_path']
+                df.loc[index,'output_folder'] = log_dict['output_folder']
+
+
+def count_shared_steps(schedule, other_schedule):
+    """Number of first threshold steps that two schedules have in common."""
+    n_shared = 0
+    while (n_shared < min(len(schedule), len(other_schedule))
+           and schedule[n_shared] == other_schedule[n_shared]):
+        n_shared += 1
+    return n_shared
+
+
+def get_sweep_plan(configs, optional_params_list):
+    """
+    Plan the runs of a sweep so that runs sharing their first threshold steps grow them once.
+
+    Runs on the same image and seed with the same other settings are grouped,
+    and ordered by their threshold steps, so runs sharing the first steps follow
+    each other. Each run keeps its state after the steps that a later run of the
+    group starts with.
+
+    Args:
+        configs (list[dict]): Validated config of every row.
+        optional_params_list (list[dict]): Optional parameters of every row.
+
+    Returns:
+        list[tuple]: (row position, group key, schedule, steps to cache) of every
+        run, in the order to run them.
+    """
+    runs = []
+    for position, (config, optional_params) in enumerate(zip(configs, optional_params_list)):
+        group_key = json.dumps({key: value for key, value in config.items() if key not in sweep_ignored_keys},
+                               sort_keys=True, default=str)
+        schedule = list(zip(*make_grow.get_grow_schedule(config['thresholds'],
+                                                         optional_params['upper_thresholds'],
+                                                         config['dilation_steps'],
+                                                         config['save_every_n_iters'],
+                                                         optional_params['grow_to_end'])))
+        runs.append((group_key, make_grow.get_prefix_key(schedule, len(schedule)), position, schedule))
+    # Runs sharing their first steps are next to each other once sorted
+    runs.sort()
+
+    plan = []
+    for run_id, (group_key, _, position, schedule) in enumerate(runs):
+        # The steps shared with the previous run are cached already
+        n_cached = 0
+        if run_id > 0 and runs[run_id - 1][0] == group_key:
+            n_cached = count_shared_steps(schedule, runs[run_id - 1][3])
+        cache_steps = set()
+        for later_group_key, _, _, later_schedule in runs[run_id + 1:]:
+            if later_group_key != group_key:
+                break
+            n_shared = count_shared_steps(schedule, later_schedule)
+            if n_shared > n_cached:
+                cache_steps.add(n_shared)
+        plan.append((position, group_key, schedule, sorted(cache_steps)))
+    return plan
 
 
 def run_batch_grow(file_path):
@@ -28,47 +224,55 @@ def run_batch_grow(file_path):
     sprout_core.check_tiff_files(df['img_path'])
     sprout_core.check_tiff_files(df['seg_path'])
 
+    ## Initial the config and optional parameters for each row
+    yaml_config.pop("csv_path", None)
+    configs = []
+    optional_params_list = []
     for index, row in df.iterrows():
-        ## Initial the config and optional parameters for each row
-        yaml_config.pop("csv_path", None)
         config = config_core.merge_row_and_yaml_no_conflict(dict(row), yaml_config)
-        optional_params = config_core.validate_input_yaml(config, config_core.input_val_make_grow)    
+        configs.append(config)
+        optional_params_list.append(config_core.validate_input_yaml(config, config_core.input_val_make_grow))
+
+    if yaml_config.get('share_image', False):
+        if yaml_config.get('share_prefix', False):
+            raise ValueError("share_image and share_prefix can not be used together.")
+        run_shared_image_groups(df, configs, optional_params_list)
+        df.to_csv(csv_path + "_running_results.csv", index = False)
+        return
+
+    if yaml_config.get('share_prefix', False):
+        # Grow the threshold steps shared by several runs once, see get_sweep_plan
+        plan = get_sweep_plan(configs, optional_params_list)
+    else:
+        plan = [(position, None, None, []) for position in range(len(configs))]
+
+    prefix_cache = {}
+    for plan_id, (position, group_key, schedule, cache_steps) in enumerate(plan):
+        index = df.index[position]
+        config = configs[position]
+        optional_params = optional_params_list[position]
+
+        if group_key is not None:
+            # Drop the cached states that no later run of the group starts with
+            needed_keys = set()
+            for _, later_group_key, later_schedule, _ in plan[plan_id:]:
+                if later_group_key == group_key:
+                    needed_keys.update(make_grow.get_prefix_key(later_schedule, n_steps)
+                                       for n_steps in range(1, len(later_schedule) + 1))
+            prefix_cache = {key: state for key, state in prefix_cache.items() if key in needed_keys}
+
+        base_name = config_core.check_and_assign_base_name(None, config['img_path'], "grown_result")
+        if optional_params['resume'] and skip_grown_row(df, index, config, base_name):
+            continue
 
         try:
             _, log_dict = make_grow.grow_mp(
                 img_path = config['img_path'] ,
                 seg_path = config['seg_path'],
-                boundary_path = optional_params['boundary_path'],
                 output_folder = config['output_folder'],
-
-                workspace = None,               
-
-                dilation_steps = config['dilation_steps'],
-                thresholds = config['thresholds'],
-                upper_thresholds = optional_params["upper_thresholds"],
-                num_threads = config['num_threads'],
-                
-                save_every_n_iters = config['save_every_n_iters'],  
-                touch_rule = config['touch_rule'],             
-    
-                grow_to_end = optional_params["grow_to_end"],
-                to_grow_ids = optional_params["to_grow_ids"],
-                
-                final_grow_output_folder = config['output_folder'],
-                
-                # base_name =  optional_params["base_name"],
-                use_simple_naming =  optional_params["use_simple_naming"],    
-
-                is_sort = optional_params['is_sort'],
-                min_growth_size = optional_params['min_growth_size'],
-                no_growth_max_iter = optional_params['no_growth_max_iter'],
-
-   
-                # For mesh making
-                is_make_meshes = optional_params['is_make_meshes'],
-                downsample_scale = optional_params['downsample_scale'],
-                step_size  = optional_params['step_size']
-                
+                prefix_cache = prefix_cache if group_key is not None else None,
+                prefix_cache_steps = cache_steps,
+                **get_grow_kwargs(config, optional_params)
             )
 
             df.loc[index,'final_output_path'] = log_dict['final_output_path']
@@ -3,6 +3,7 @@ import make_adaptive_seed
 
 import yaml
 import os,sys
+import threading
 import tifffile
 
 import pandas as pd
@@ -20,6 +21,70 @@ from datetime import datetime
 
 
 
+def _run_row_list(run_row, rows, errors, lock):
+    for index, config, optional_params in rows:
+        try:
+            run_row(config, optional_params)
+        except Exception as e:
+            print(f"Error occurs when processing {config['img_path']}")
+            with lock:
+                errors[index] = str(e)
+
+
+def run_rows(run_row, rows, num_parallel_images=1):
+    """
+    Run the rows of a batch, `num_parallel_images` rows at a time.
+
+    Each thread runs its share of the rows one after the other, and every row
+    keeps its own `num_threads`. Useful for many small (e.g. 2D) images, whose
+    runs do not use all the threads on their own.
+
+    Args:
+        run_row (callable): Runs one row from its config and optional parameters.
+        rows (list): (index, config, optional_params) of every row.
+        num_parallel_images (int): Number of rows run at the same time.
+
+    Returns:
+        dict: Error message of every row that failed, by row index.
+    """
+    errors = {}
+    lock = threading.Lock()
+    num_parallel_images = max(1, min(int(num_parallel_images), len(rows)))
+    sublists = [rows[i::num_parallel_images] for i in range(num_parallel_images)]
+    threads = []
+    for sublist in sublists:
+        thread = threading.Thread(target=_run_row_list, args=(run_row, sublist, errors, lock))
+        threads.append(thread)
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return errors
+
+
+def run_seed_row(config, optional_params):
+    """Run make_seeds for one row of a batch."""
+    _,_ = make_seeds.make_seeds(
+                            img_path= config['img_path'],
+                            
+                            num_threads = config['num_threads'] , 
+                            boundary_path=optional_params['boundary_path'],
+                            
+                            output_folder = config['output_folder'],
+                            erosion_steps = config['erosion_steps'],
+                            thresholds = config['thresholds'],
+                            segments = config['segments'],
+                            
+                            footprints = optional_params['footprints'],
+                            erosion_mode = optional_params['erosion_mode'],
+                            seed_engine = optional_params['seed_engine'],
+                            dry_run = optional_params['dry_run'],
+                            dry_run_downsample = optional_params['dry_run_downsample'],
+                            morph_backend = optional_params['morph_backend'],
+                            
+                            upper_thresholds = optional_params['upper_thresholds']
+                            )
+
+
 def run_batch_seeds(file_path):
     
     _, extension = os.path.splitext(file_path)
@@ -36,38 +101,121 @@ def run_batch_seeds(file_path):
     df = pd.read_csv(csv_path)
     sprout_core.check_tiff_files(df['img_path'])
 
+    ## Initial the config and optional parameters for each row
+    yaml_config.pop("csv_path", None)
+    num_parallel_images = yaml_config.pop("num_parallel_images", 1)
+    rows = []
     for index, row in df.iterrows():
-        ## Initial the config and optional parameters for each row
-        yaml_config.pop("csv_path", None)
         config = config_core.merge_row_and_yaml_no_conflict(dict(row), yaml_config)
         optional_params = config_core.validate_input_yaml(config, config_core.input_val_make_seeds)
-        try:           
-               
-            _,_ = make_seeds.make_seeds(
-                                    img_path= config['img_path'],
-                                    
-                                    num_threads = config['num_threads'] , 
-                                    boundary_path=optional_params['boundary_path'],
-                                    
-                                    output_folder = config['output_folder'],
-                                    erosion_steps = config['erosion_steps'],
-                                    thresholds = config['thresholds'],
-                                    segments = config['segments'],
-                                    
-                                    footprints = optional_params['footprints'],
-                                    
-                                    upper_thresholds = optional_params['upper_thresholds']
-                                    )
-        except Exception as e:
-            print(f"Error occurs when processing {config['img_path']}")
-            df.loc[index,'error'] = str(e)
-            
+        rows.append((index, config, optional_params))
+
+    errors = run_rows(run_seed_row, rows, num_parallel_images)
+    for index, config, _ in rows:
+        if index in errors:
+            df.loc[index,'error'] = errors[index]
         df.loc[index,'output_folder'] = config['output_folder']
 
     df.to_csv(os.path.join(config['output_folder'],
                            os.path.basename(csv_path) + f"_running_results_{datetime.now().strftime('%Y%m%d_%H%M')}.csv"), index = False)    
 
 
+def run_adaptive_seed_row(config, optional_params):
+    """Run make_adaptive_seed for one row of a batch, merging on thresholds or on erosions."""
+    if isinstance(config['thresholds'], int):
+        seed_merging_mode = "ERO"
+    elif isinstance(config['thresholds'], list):
+        if all(isinstance(t, int) for t in config['thresholds']):
+            if len(config['thresholds']) == 1:
+                seed_merging_mode = "ERO"
+                config['thresholds'] = config['thresholds'][0]
+                if optional_params['upper_thresholds'] is not None:
+                    optional_params['upper_thresholds'] = optional_params['upper_thresholds'][0]
+                
+            elif len(config['thresholds']) > 1:
+                seed_merging_mode = "THRE"
+        else:
+            raise ValueError("'thresholds' must be an int or a list of int(s).")
+            
+    if seed_merging_mode == "THRE":
+
+        print("Running make_adaptive_seed_thre")
+        _ ,ori_combine_ids_map , output_dict=make_adaptive_seed.make_adaptive_seed_thre(                           
+                           thresholds=config['thresholds'],
+                            output_folder=config['output_folder'],
+                            erosion_steps=config['erosion_steps'], 
+                            segments= config['segments'],
+                            
+                            num_threads = config['num_threads'],
+                            
+                            img_path = config['img_path'],
+                            boundary_path = optional_params['boundary_path'],    
+                            
+                            background = optional_params["background"],
+                            sort = optional_params["sort"],
+                            
+                                                                
+                            no_split_max_iter =optional_params["no_split_max_iter"],
+                            min_size=optional_params["min_size"],
+                            min_split_ratio = optional_params["min_split_ratio"],
+                            min_split_total_ratio = optional_params["min_split_total_ratio"],
+                            
+                            save_every_iter = optional_params["save_every_iter"],
+
+                                                                
+                            init_segments = optional_params["init_segments"],
+                            footprints = optional_params["footprints"],
+                            
+                            upper_thresholds = optional_params["upper_thresholds"],
+                            split_size_limit= optional_params["split_size_limit"],
+                            split_convex_hull_limit = optional_params["split_convex_hull_limit"],
+                            dry_run = optional_params["dry_run"],
+                            dry_run_downsample = optional_params["dry_run_downsample"],
+                            morph_backend = optional_params["morph_backend"],
+                            
+                                                        
+                    )
+    
+    elif seed_merging_mode=="ERO":
+        print("Running make_seeds_merged")
+
+        
+        _ ,ori_combine_ids_map , output_dict=make_adaptive_seed.make_adaptive_seed_ero(                           
+                               
+                            threshold=config['thresholds'],
+                            output_folder=config['output_folder'],
+                            erosion_steps=config['erosion_steps'], 
+                            segments= config['segments'],
+                            num_threads = config['num_threads'],
+                            
+                            img_path = config['img_path'],
+                            boundary_path = optional_params['boundary_path'],                                            
+                            
+                            background = optional_params["background"],
+                            sort = optional_params["sort"],
+                            
+                                                                
+                            no_split_max_iter =optional_params["no_split_max_iter"],
+                            min_size=optional_params["min_size"],
+                            min_split_ratio = optional_params["min_split_ratio"],
+                            min_split_total_ratio = optional_params["min_split_total_ratio"],
+                            
+                            save_every_iter = optional_params["save_every_iter"],
+                            
+                            init_segments = optional_params["init_segments"],
+                            footprints = optional_params["footprints"],
+                            
+                            upper_threshold = optional_params["upper_thresholds"],
+                            split_size_limit= optional_params["split_size_limit"],
+                            split_convex_hull_limit = optional_params["split_convex_hull_limit"],
+                            dry_run = optional_params["dry_run"],
+                            dry_run_downsample = optional_params["dry_run_downsample"],
+                            morph_backend = optional_params["morph_backend"],
+                            
+                                                                    
+                                )
+
+
 def run_batch_adaptive_seed(file_path):
     _, extension = os.path.splitext(file_path)
     print(f"processing config the file {file_path}")
@@ -83,106 +231,19 @@ def run_batch_adaptive_seed(file_path):
     df = pd.read_csv(csv_path)
     sprout_core.check_tiff_files(df['img_path'])
 
+    ## Initial the config and optional parameters for each row
+    yaml_config.pop("csv_path", None)
+    num_parallel_images = yaml_config.pop("num_parallel_images", 1)
+    rows = []
     for index, row in df.iterrows():
-        ## Initial the config and optional parameters for each row
-        yaml_config.pop("csv_path", None)
         config = config_core.merge_row_and_yaml_no_conflict(dict(row), yaml_config)
         optional_params = config_core.validate_input_yaml(config, config_core.input_val_make_adaptive_seed)
-        
-        
-        try:
-            sub_folder = os.path.basename(input_path)
-            
-            if isinstance(config['thresholds'], int):
-                seed_merging_mode = "ERO"
-            elif isinstance(config['thresholds'], list):
-                if all(isinstance(t, int) for t in config['thresholds']):
-                    if len(config['thresholds']) == 1:
-                        seed_merging_mode = "ERO"
-                        config['thresholds'] = config['thresholds'][0]
-                        if optional_params['upper_thresholds'] is not None:
-                            optional_params['upper_thresholds'] = optional_params['upper_thresholds'][0]
-                        
-                    elif len(config['thresholds']) > 1:
-                        seed_merging_mode = "THRE"
-                else:
-                    raise ValueError("'thresholds' must be an int or a list of int(s).")
-                    
-            if seed_merging_mode == "THRE":
-        
-                print("Running make_adaptive_seed_thre")
-                _ ,ori_combine_ids_map , output_dict=make_adaptive_seed.make_adaptive_seed_thre(                           
-                                   thresholds=config['thresholds'],
-                                    output_folder=config['output_folder'],
-                                    erosion_steps=config['erosion_steps'], 
-                                    segments= config['segments'],
-                                    
-                                    num_threads = config['num_threads'],
-                                    
-                                    img_path = config['img_path'],
-                                    boundary_path = optional_params['boundary_path'],    
-                                    
-                                    background = optional_params["background"],
-                                    sort = optional_params["sort"],
-                                    
-                                                                        
-                                    no_split_max_iter =optional_params["no_split_max_iter"],
-                                    min_size=optional_params["min_size"],
-                                    min_split_ratio = optional_params["min_split_ratio"],
-                                    min_split_total_ratio = optional_params["min_split_total_ratio"],
-                                    
-                                    save_every_iter = optional_params["save_every_iter"],
-
-                                                                        
-                                    init_segments = optional_params["init_segments"],
-                                    footprints = optional_params["footprints"],
-                                    
-                                    upper_thresholds = optional_params["upper_thresholds"],
-                                    split_size_limit= optional_params["split_size_limit"],
-                                    split_convex_hull_limit = optional_params["split_convex_hull_limit"],
-                                    
-                                                                
-                            )
-            
-            elif seed_merging_mode=="ERO":
-                print("Running make_seeds_merged")
+        rows.append((index, config, optional_params))
 
-                
-                _ ,ori_combine_ids_map , output_dict=make_adaptive_seed.make_adaptive_seed_ero(                           
-                                       
-                                    threshold=config['thresholds'],
-                                    output_folder=config['output_folder'],
-                                    erosion_steps=config['erosion_steps'], 
-                                    segments= config['segments'],
-                                    num_threads = config['num_threads'],
-                                    
-                                    img_path = config['img_path'],
-                                    boundary_path = optional_params['boundary_path'],                                            
-                                    
-                                    background = optional_params["background"],
-                                    sort = optional_params["sort"],
-                                    
-                                                                        
-                                    no_split_max_iter =optional_params["no_split_max_iter"],
-                                    min_size=optional_params["min_size"],
-                                    min_split_ratio = optional_params["min_split_ratio"],
-                                    min_split_total_ratio = optional_params["min_split_total_ratio"],
-                                    
-                                    save_every_iter = optional_params["save_every_iter"],
-                                    
-                                    init_segments = optional_params["init_segments"],
-                                    footprints = optional_params["footprints"],
-                                    
-                                    upper_threshold = optional_params["upper_thresholds"],
-                                    split_size_limit= optional_params["split_size_limit"],
-                                    split_convex_hull_limit = optional_params["split_convex_hull_limit"],
-                                    
-                                                                            
-                                        )            
-        except Exception as e:
-            print(f"Error occurs when processing {config['img_path']}")
-            df.loc[index,'error'] = str(e)
-            
+    errors = run_rows(run_adaptive_seed_row, rows, num_parallel_images)
+    for index, config, _ in rows:
+        if index in errors:
+            df.loc[index,'error'] = errors[index]
         df.loc[index,'output_folder'] = config['output_folder']
 
     df.to_csv(os.path.join(config['output_folder'],
@@ -54,7 +54,7 @@ for to_check_id,n_ccomp in zip(to_check_ids, n_ccomps):
     seed, ccomp_sizes = sprout_core.get_ccomps_with_size_order(binary_img, n_ccomp)
     print(f"size of split comps:{ccomp_sizes}")
    
-    seed_offset = np.where(seed != 0, seed + max_id, 0)
+    seed_offset = np.where(seed != 0, seed.astype(np.int64) + max_id, 0)
     print(np.sum(img_output == to_check_id))
     if JUST_SPLIT_ID:
         img_output = img_output + seed_offset
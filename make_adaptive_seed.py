@@ -16,6 +16,7 @@ from scipy.spatial import ConvexHull
 import sprout_core.sprout_core as sprout_core
 import sprout_core.config_core as config_core
 from sprout_core.sprout_core import reorder_segmentation
+from sprout_core.threshold_core import ThresholdLevels
 from multiprocessing import cpu_count
 max_threads = cpu_count()
 
@@ -81,7 +82,7 @@ def detect_inter(ccomp_combine_seed,ero_seed, seed_ids, inter_log , lock):
                 prop = round(inter / np.sum(ccomp_combine_seed),6)*100
                 inter_log["inter_props"] = np.append(inter_log["inter_props"], prop)
 
-def save_seed(seed, output_folder, output_name, return_for_napari=False, seeds_dict=None):
+def save_seed(seed, output_folder, output_name, return_for_napari=False, seeds_dict=None, dry_run=False):
     """
     Save the seed to a specified folder.
 
@@ -90,7 +91,10 @@ def save_seed(seed, output_folder, output_name, return_for_napari=False, seeds_d
         output_folder (str): Folder to save the seed.
         output_name (str): Name of the output file.
         return_for_napari (bool, optional): Whether to save in napari format. Defaults to False.
+        dry_run (bool, optional): If True, the seed is not saved. Defaults to False.
     """
+    if dry_run:
+        return
     output_path = os.path.join(output_folder, output_name)
     print(f"\tSaving {os.path.abspath(output_path)}")
     imwrite(output_path, seed, compression='zlib')
@@ -133,7 +137,10 @@ def make_adaptive_seed_ero(
                         upper_threshold = None,
                         split_size_limit = (None,None),
                         split_convex_hull_limit = (None, None),
-                        return_for_napari = False                    
+                        return_for_napari = False,
+                        dry_run = False,
+                        dry_run_downsample = 1,
+                        morph_backend = None
                       ):
     """
     Erosion-based merged seed generation with multi-threading.
@@ -145,7 +152,8 @@ def make_adaptive_seed_ero(
         erosion_steps (int): Number of erosion iterations.
         segments (int): Number of segments to extract.
         boundary (np.ndarray, optional): Boundary mask. Defaults to None.
-        num_threads (int, optional): Number of threads to use. Defaults to 1.
+        num_threads (int, optional): Number of threads to use, also to erode planar
+            footprints (e.g. 'ball_XY' or 'Z') slice by slice. Defaults to 1.
         background (int, optional): Background value. Defaults to 0.
         sort (bool, optional): Whether to sort output segment IDs. Defaults to True.
         no_split_max_iter (int, optional): Early Stop Check: Limit for consecutive no-split iterations. Defaults to 3.
@@ -161,6 +169,13 @@ def make_adaptive_seed_ero(
         footprints (str, optional): Footprints shape for erosion. Defaults to None.
         split_size_limit (optional): create a split if the region size (np.sum(mask)) is within the limit
         split_convex_hull_limit: create a split if the the convex hull's area/volume is within the limit
+        dry_run (bool, optional): Only compute the split statistics (output_dict), without saving seeds.
+            Defaults to False.
+        dry_run_downsample (int, optional): In a dry run, keep every n-th voxel along each axis.
+            Sizes and erosion steps are then in downsampled voxels. Defaults to 1.
+        morph_backend (str, optional): Backend of the erosion and labelling, 'skimage',
+            'scipy', 'opencv' or 'auto' (see sprout_core.morph_core). Defaults to None,
+            the default backend of each sprout_core helper.
 
     Returns:
         tuple: Merged seeds, original combine ID map, and output dictionary.
@@ -169,7 +184,11 @@ def make_adaptive_seed_ero(
     img = config_core.check_and_load_data(img, img_path, "img")
 
     boundary = config_core.check_and_load_data(boundary, boundary_path, "boundary", must_exist=False)
-    config_core.valid_input_data(img, boundary=boundary)    
+    config_core.valid_input_data(img, boundary=boundary)
+    if dry_run and dry_run_downsample > 1:
+        img = sprout_core.downsample_volume(img, dry_run_downsample)
+        if boundary is not None:
+            boundary = sprout_core.downsample_volume(boundary, dry_run_downsample)    
     
     
     min_split_ratio = min_split_ratio*100
@@ -222,7 +241,10 @@ def make_adaptive_seed_ero(
         "Minimum Split Proportion (%)": min_split_ratio,
         "Minimum Split Sum Proportion (%)": min_split_total_ratio,
         "split_size_limit": split_size_limit,
-        "split_convex_hull_limit": split_convex_hull_limit
+        "split_convex_hull_limit": split_convex_hull_limit,
+        "Dry run": dry_run,
+        "Dry run downsample": dry_run_downsample if dry_run else 1,
+        "Morphology backend": morph_backend
     }
 
     for key, value in values_to_print.items():
@@ -234,25 +256,23 @@ def make_adaptive_seed_ero(
     
     
     
-    if upper_threshold is not None:
-        img = (img>=threshold) & (img<=upper_threshold)
-    else:
-        img = img>=threshold
-
-
+    # The threshold mask is taken from the level volume, with the boundary excluded
+    threshold_levels = ThresholdLevels(img, [threshold], [upper_threshold])
     if boundary is not None:
-        boundary = sprout_core.check_and_cast_boundary(boundary)
-        img[boundary] = False
+        boundary = config_core.check_and_cast_boundary(boundary)
+        threshold_levels.exclude(boundary)
+    img = threshold_levels.mask(threshold, upper_threshold)
+    threshold_levels = None
 
 
 
-    init_seed, _ = sprout_core.get_ccomps_with_size_order(img,segments_list[0])
+    init_seed, _ = sprout_core.get_ccomps_with_size_order(img,segments_list[0], backend=morph_backend)
     
     seeds_dict = {}
     
     output_img_name = f'INTER_thre_{threshold}_{upper_threshold}_ero_0.tif'
     if save_every_iter:
-        save_seed(init_seed, output_folder, output_img_name, return_for_napari=return_for_napari, seeds_dict=seeds_dict)      
+        save_seed(init_seed, output_folder, output_img_name, return_for_napari=return_for_napari, seeds_dict=seeds_dict, dry_run=dry_run)      
         
     
     init_ids = [int(value) for value in np.unique(init_seed) if value != background]
@@ -293,8 +313,9 @@ def make_adaptive_seed_ero(
         output_dict["split_ori_id_filtered"][ero_iter] = {}
         output_dict["split_prop"][ero_iter] = {}
         
-        img = sprout_core.erosion_binary_img_on_sub(img, kernal_size = 1,footprint=footprint_list[ero_iter-1])
-        seed, _ = sprout_core.get_ccomps_with_size_order(img, segments_list[ero_iter])
+        img = sprout_core.erosion_binary_img_on_sub(img, kernal_size = 1,footprint=footprint_list[ero_iter-1],
+                                                   backend=morph_backend, num_threads=num_threads)
+        seed, _ = sprout_core.get_ccomps_with_size_order(img, segments_list[ero_iter], backend=morph_backend)
         seed = seed.astype('uint16')
         
 
@@ -302,7 +323,7 @@ def make_adaptive_seed_ero(
         if save_every_iter:
             output_img_name = f'INTER_thre_{threshold}_{upper_threshold}_ero_{ero_iter}.tif'
             output_dict["cur_seed_name"][threshold] = output_img_name
-            save_seed(seed, output_folder, output_img_name, return_for_napari=return_for_napari, seeds_dict=seeds_dict)
+            save_seed(seed, output_folder, output_img_name, return_for_napari=return_for_napari, seeds_dict=seeds_dict, dry_run=dry_run)
 
 
 
@@ -403,7 +424,7 @@ def make_adaptive_seed_ero(
             output_img_name = f'INTER_adaptive_thre_{threshold}_{upper_threshold}_ero_{ero_iter}.tif'
             combine_seed,_ = reorder_segmentation(combine_seed, min_size=min_size, 
                               sort_ids=sort, top_n=segments_list[-1])
-            save_seed(combine_seed, output_folder, output_img_name, return_for_napari=return_for_napari, seeds_dict=seeds_dict)
+            save_seed(combine_seed, output_folder, output_img_name, return_for_napari=return_for_napari, seeds_dict=seeds_dict, dry_run=dry_run)
             
         
         if no_consec_split_count>=no_split_max_iter:
@@ -424,7 +445,7 @@ def make_adaptive_seed_ero(
     # output_img_name = "FINAL_adaptive_seed.tif" + output_name+'_sorted.tif'
     output_img_name = "FINAL_adaptive_seed.tif"
     
-    save_seed(combine_seed, output_folder, output_img_name, return_for_napari=return_for_napari, seeds_dict=seeds_dict)
+    save_seed(combine_seed, output_folder, output_img_name, return_for_napari=return_for_napari, seeds_dict=seeds_dict, dry_run=dry_run)
     
     # imwrite(output_path, combine_seed, 
     #     compression ='zlib')
@@ -477,7 +498,10 @@ def make_adaptive_seed_thre(
                         split_size_limit = (None, None),
                         split_convex_hull_limit = (None, None),
         
-                        return_for_napari = False  
+                        return_for_napari = False,
+                        dry_run = False,
+                        dry_run_downsample = 1,
+                        morph_backend = None
                     ):
     
     """Perform adaptive seed generation and iterative splitting for image segmentation using thresholding and morphological erosion.
@@ -506,7 +530,8 @@ def make_adaptive_seed_thre(
     boundary_path : str, optional
         Path to the boundary mask file. Used if `boundary` is not provided.
     num_threads : int, default=1
-        Number of threads to use for parallel processing during intersection checks.
+        Number of threads to use for parallel processing during intersection checks,
+        and to erode planar footprints (e.g. 'ball_XY' or 'Z') slice by slice.
     background : int, default=0
         Value representing the background in the segmentation.
     sort : bool, default=True
@@ -535,6 +560,15 @@ def make_adaptive_seed_thre(
         Minimum and maximum convex hull size limits for split segments.
     sub_folder : str, optional
         Subfolder name within `output_folder` for saving results.
+    dry_run : bool, default=False
+        If True, only compute the split statistics (`output_dict` and its CSV), without saving seeds.
+    dry_run_downsample : int, default=1
+        In a dry run, keep every n-th voxel along each axis. Sizes and erosion steps
+        are then in downsampled voxels.
+    morph_backend : str, optional
+        Backend of the erosion and labelling, 'skimage', 'scipy', 'opencv' or 'auto'
+        (see sprout_core.morph_core). Defaults to None, the default backend of each
+        sprout_core helper.
         
     Returns
     -------
@@ -556,7 +590,11 @@ def make_adaptive_seed_thre(
 
     img = config_core.check_and_load_data(img, img_path, "img")
     boundary = config_core.check_and_load_data(boundary, boundary_path, "boundary", must_exist=False)
-    config_core.valid_input_data(img, boundary=boundary)   
+    config_core.valid_input_data(img, boundary=boundary)
+    if dry_run and dry_run_downsample > 1:
+        img = sprout_core.downsample_volume(img, dry_run_downsample)
+        if boundary is not None:
+            boundary = sprout_core.downsample_volume(boundary, dry_run_downsample)   
 
     if num_threads is None:
         num_threads = max(1, max_threads // 2)
@@ -608,7 +646,10 @@ def make_adaptive_seed_thre(
         "Minimum Split Proportion (%)": min_split_ratio,
         "Minimum Split Sum Proportion (%)": min_split_total_ratio,
         "split_size_limit": split_size_limit,
-        "split_convex_hull_limit": split_convex_hull_limit
+        "split_convex_hull_limit": split_convex_hull_limit,
+        "Dry run": dry_run,
+        "Dry run downsample": dry_run_downsample if dry_run else 1,
+        "Morphology backend": morph_backend
     }
 
     for key, value in values_to_print.items():
@@ -616,27 +657,26 @@ def make_adaptive_seed_thre(
 
 
 
-    if upper_thresholds[0] is not None:
-        mask = (img>=thresholds[0]) & (img<=upper_thresholds[0])
-    else:
-        mask = img>=thresholds[0]
-    
+    # Every threshold mask is taken from the level volume, the image is not needed anymore
+    threshold_levels = ThresholdLevels(img, thresholds, upper_thresholds)
+    img = None
     
     if boundary is not None:
-        boundary = sprout_core.check_and_cast_boundary(boundary)
-        img[boundary] = False
+        boundary = config_core.check_and_cast_boundary(boundary)
+        threshold_levels.exclude(boundary)
     
-    for ero_iter in range(1, erosion_steps+1):
-        mask = sprout_core.erosion_binary_img_on_sub(mask, kernal_size = 1,
-                                                     footprint=footprint_list[ero_iter-1])
-    init_seed, _ = sprout_core.get_ccomps_with_size_order(mask,segments_list[0])
+    mask = threshold_levels.mask(thresholds[0], upper_thresholds[0])
+    
+    mask = sprout_core.erosion_binary_img_multi_step(mask, footprint_list[:erosion_steps],
+                                                      backend=morph_backend, num_threads=num_threads)
+    init_seed, _ = sprout_core.get_ccomps_with_size_order(mask,segments_list[0], backend=morph_backend)
     
     seeds_dict = {}
     
     output_img_name = f'INTER_thre_{thresholds[0]}_{upper_thresholds[0]}_ero_{erosion_steps}.tif'
     if save_every_iter:
         save_seed(init_seed, output_folder, output_img_name, 
-                  return_for_napari=return_for_napari, seeds_dict=seeds_dict)
+                  return_for_napari=return_for_napari, seeds_dict=seeds_dict, dry_run=dry_run)
             
     
     init_ids = [int(value) for value in np.unique(init_seed) if value != background]
@@ -673,17 +713,12 @@ def make_adaptive_seed_thre(
         output_dict["split_prop"][threshold] = {}
         
         
-        if upper_threshold is not None:
-            mask = (img>=threshold) & (img<=upper_threshold)
-        else:
-            mask = img>=threshold
-
-        # mask = img>=threshold
+        mask = threshold_levels.mask(threshold, upper_threshold)
         
-        for ero_iter in range(1, erosion_steps+1):
-            mask = sprout_core.erosion_binary_img_on_sub(mask, kernal_size = 1,
-                                                         footprint=footprint_list[ero_iter-1])
-        seed, _ = sprout_core.get_ccomps_with_size_order(mask,segments_list[idx_threshold+1])
+        mask = sprout_core.erosion_binary_img_multi_step(mask, footprint_list[:erosion_steps],
+                                                      backend=morph_backend, num_threads=num_threads)
+        seed, _ = sprout_core.get_ccomps_with_size_order(mask,segments_list[idx_threshold+1],
+                                                          backend=morph_backend)
         seed = seed.astype('uint16')
         
 
@@ -692,7 +727,7 @@ def make_adaptive_seed_thre(
             output_dict["cur_seed_name"][threshold] = output_img_name
             
             save_seed(seed, output_folder, output_img_name, 
-                      return_for_napari=return_for_napari, seeds_dict=seeds_dict)
+                      return_for_napari=return_for_napari, seeds_dict=seeds_dict, dry_run=dry_run)
 
         
         seed_ids = [int(value) for value in np.unique(seed) if value != background]
@@ -826,7 +861,7 @@ def make_adaptive_seed_thre(
             combine_seed,_ = reorder_segmentation(combine_seed, min_size=min_size, sort_ids=sort,
                                                   top_n=segments_list[-1])
             
-            save_seed(combine_seed, output_folder, output_img_name, return_for_napari=return_for_napari, seeds_dict=seeds_dict)
+            save_seed(combine_seed, output_folder, output_img_name, return_for_napari=return_for_napari, seeds_dict=seeds_dict, dry_run=dry_run)
          
     combine_seed,_ = reorder_segmentation(combine_seed, min_size=min_size, sort_ids=sort,
                                           top_n=segments_list[-1])
@@ -835,7 +870,7 @@ def make_adaptive_seed_thre(
     # else:
     #     output_path = os.path.join(output_folder,"FINAL_" + output_name+'.tif')
     output_img_name = "FINAL_adaptive_seed.tif"
-    save_seed(combine_seed, output_folder, output_img_name, return_for_napari=return_for_napari, seeds_dict=seeds_dict)
+    save_seed(combine_seed, output_folder, output_img_name, return_for_napari=return_for_napari, seeds_dict=seeds_dict, dry_run=dry_run)
 
     config_core.save_config_with_output({
         "params": values_to_print},output_folder)
@@ -918,6 +953,9 @@ def run_make_adaptive_seed(file_path):
                                     upper_threshold = optional_params["upper_thresholds"],
                                     split_size_limit= optional_params["split_size_limit"],
                                     split_convex_hull_limit = optional_params["split_convex_hull_limit"],
+                                    dry_run = optional_params["dry_run"],
+                                    dry_run_downsample = optional_params["dry_run_downsample"],
+                                    morph_backend = optional_params["morph_backend"],
                                     
                                     
                                     return_for_napari = False
@@ -960,6 +998,9 @@ def run_make_adaptive_seed(file_path):
                                     upper_thresholds = optional_params["upper_thresholds"],
                                     split_size_limit= optional_params["split_size_limit"],
                                     split_convex_hull_limit = optional_params["split_convex_hull_limit"],
+                                    dry_run = optional_params["dry_run"],
+                                    dry_run_downsample = optional_params["dry_run_downsample"],
+                                    morph_backend = optional_params["morph_backend"],
                                     
                                     return_for_napari=False            
                                     )
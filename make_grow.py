@@ -1,17 +1,24 @@
 # import nibabel as nib
 import os, sys
-from skimage.morphology import ball
+from skimage.morphology import ball, disk, binary_dilation
 import tifffile
 from datetime import datetime
 import yaml
 import numpy as np
 import pandas as pd
 import glob
+import json
+import hashlib
+import shutil
 
 import threading
 
 import sprout_core.sprout_core as sprout_core 
 import sprout_core.config_core as config_core 
+import sprout_core.grow_core as grow_core
+import sprout_core.ooc_core as ooc_core
+from sprout_core.threshold_core import ThresholdLevels
+from sprout_core.mask_core import PackedMask
 import sprout_core.vis_lib as vis_lib
 import make_mesh
 
@@ -67,11 +74,48 @@ def grow_function(result, threshold_binary, label_id_list,touch_rule,non_bg_mask
             # result[dilated_binary_label_id & threshold_binary] = label_id  
             result[dilated_binary_label_id] = label_id  
 
+def grow_function_on_index(result, input_mask, threshold_binary, label_id_list, touch_rule,
+                           label_index, boundary):
+    """
+    Perform the growth operation for each label ID, only inside the bounding box of each label.
+
+    Gives the same result as grow_function followed by the boundary and threshold
+    clean-up in dilation_one_iter_mp, without reading the whole volume per label.
+
+    Args:
+        result (np.ndarray): The mask being grown.
+        input_mask (np.ndarray): The mask before this iteration.
+        threshold_binary (np.ndarray): Binary mask threshold for the guide.
+        label_id_list (list): List of label IDs to grow.
+        touch_rule (str): Rule for handling overlaps (e.g., 'stop').
+        label_index (grow_core.LabelIndex): Index of the labels before this iteration.
+        boundary (np.ndarray): Boundary mask to constrain growth, or None.
+    """
+    footprint = ball(1) if result.ndim == 3 else disk(1)
+    for label_id in label_id_list:
+        # One dilation stays inside the bounding box plus one voxel
+        sub = label_index.slices(label_id, margin=1)
+        label_binary = result[sub] == label_id
+        dilated_binary_label_id = binary_dilation(label_binary, footprint)
+
+        if touch_rule == 'stop':
+            non_bg_sub = input_mask[sub] != 0
+            # Do not take voxels of other labels, and only take background in the threshold
+            dilated_binary_label_id &= ~(non_bg_sub & ~label_binary)
+            dilated_binary_label_id &= threshold_binary[sub] | non_bg_sub
+        if boundary is not None:
+            dilated_binary_label_id &= ~boundary[sub] | label_binary
+
+        with lock:
+            result[sub][dilated_binary_label_id] = label_id
+
+
 def dilation_one_iter_mp(input_mask, threshold_binary, 
                             num_threads,
                              touch_rule = 'stop',
                              to_grow_ids = None,
-                             boundary = None):
+                             boundary = None,
+                             label_index = None):
     """
     Perform one iteration of dilation by using grow_function(...) in multi-threading.
 
@@ -82,11 +126,17 @@ def dilation_one_iter_mp(input_mask, threshold_binary,
         touch_rule (str): Rule for handling overlaps.
         to_grow_ids (list, optional): Specific IDs to grow. Defaults to None.
         boundary (np.ndarray, optional): Boundary mask to constrain growth. Defaults to None.
+        label_index (grow_core.LabelIndex, optional): If given, the ids to grow and the
+            regions to dilate are taken from the index instead of the whole volume,
+            and the index is updated for the grown labels. `to_grow_ids` is then
+            taken from the index.
 
     Returns:
         np.ndarray: The updated mask after one dilation iteration.
     """
-
+    if label_index is not None:
+        return dilation_one_iter_on_index(input_mask, threshold_binary, num_threads,
+                                          touch_rule, label_index, boundary)
 
     unique_ids = np.unique(input_mask)
     # remove the background id
@@ -133,6 +183,240 @@ def dilation_one_iter_mp(input_mask, threshold_binary,
 
     return result
 
+
+def dilation_one_iter_on_index(input_mask, threshold_binary, num_threads,
+                               touch_rule, label_index, boundary):
+    """
+    Perform one iteration of dilation on the label regions of a LabelIndex.
+
+    See dilation_one_iter_mp.
+    """
+    if touch_rule not in ('stop', 'overwrite'):
+        raise ValueError(f"Unknown touch_rule: {touch_rule}. Must be 'stop' or 'overwrite'.")
+
+    label_id_list = label_index.active_ids()
+    result = input_mask.copy()
+    sublists = [label_id_list[i::num_threads] for i in range(num_threads)]
+    threads = []
+    for sublist in sublists:
+        thread = threading.Thread(target=grow_function_on_index, args=(result,
+                                                                       input_mask,
+                                                                       threshold_binary,
+                                                                       sublist,
+                                                                       touch_rule,
+                                                                       label_index,
+                                                                       boundary))
+        threads.append(thread)
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    # Grown labels only changed inside their bounding box plus one voxel.
+    # With 'stop' the other labels did not change, with 'overwrite' they can only shrink
+    if touch_rule == 'stop':
+        changed_ids = label_id_list
+    else:
+        changed_ids = label_index.present_ids()
+    if boundary is not None and not label_index.boundary_cleared:
+        # Grown voxels never enter the boundary, only the seed can be inside it
+        changed_ids = label_index.present_ids()
+        for label_id in changed_ids:
+            sub = label_index.slices(label_id, margin=1)
+            result[sub][boundary[sub]] = 0
+        label_index.boundary_cleared = True
+    for label_id in changed_ids:
+        label_index.refresh(result, label_id, margin=1 if label_index.active[label_id] else 0)
+
+    return result
+
+
+def get_checkpoint_path(output_folder, base_name):
+    """
+    Path of the checkpoint file of a grow run.
+
+    Args:
+        output_folder (str): Output folder of the run, including the base name sub folder.
+        base_name (str): Base name of the run.
+
+    Returns:
+        str: Checkpoint path.
+    """
+    return os.path.join(output_folder, f"CHECKPOINT_{base_name}.npz")
+
+
+def get_grow_schedule(thresholds, upper_thresholds, dilation_steps,
+                      save_every_n_iters=None, grow_to_end=False):
+    """
+    Standardize the threshold steps of a grow run, as grown by grow_mp.
+
+    Args:
+        thresholds (int or list): Lower threshold(s).
+        upper_thresholds (int or list, optional): Upper threshold(s).
+        dilation_steps (int or list): Dilation iterations of each threshold.
+        save_every_n_iters (int or list, optional): Interval(s) for saving
+            intermediate results. Defaults to `dilation_steps`.
+        grow_to_end (bool): If True, every step is grown for up to 200 iterations.
+
+    Returns:
+        tuple: (thresholds, upper_thresholds, dilation_steps, save_every_n_iters),
+        lists with one entry per threshold step.
+    """
+    default_grow_to_end_iter = 200
+
+    # Ensure thresholds and dilation_steps have the same length
+    if isinstance(thresholds, int):
+        thresholds = [thresholds]
+    if isinstance(dilation_steps, int):
+        dilation_steps = [dilation_steps]
+
+    if grow_to_end:
+        dilation_steps = [default_grow_to_end_iter] * len(dilation_steps)
+
+    thresholds, upper_thresholds = config_core.check_and_assign_thresholds(thresholds, upper_thresholds, reverse= True)
+    
+    assert len(thresholds) == len(dilation_steps), f"thresholds and dilation_steps must have the same length, but got {len(thresholds)} and {len(dilation_steps)}."
+    
+    
+    if isinstance(save_every_n_iters, list):
+        assert len(thresholds) == len(save_every_n_iters), f"Save interval list should have the same length as well"
+    if isinstance(save_every_n_iters, int):
+        save_every_n_iters = [save_every_n_iters] * len(thresholds)
+    if save_every_n_iters is None:
+        save_every_n_iters = dilation_steps
+
+    return thresholds, upper_thresholds, dilation_steps, save_every_n_iters
+
+
+def get_prefix_key(schedule, n_steps):
+    """
+    Key of the first `n_steps` threshold steps of a schedule, for `grow_mp(prefix_cache=...)`.
+
+    Args:
+        schedule (list): Tuples of (threshold, upper_threshold, dilation_step,
+            save_every_n_iters) for each step, see get_grow_schedule.
+        n_steps (int): Number of leading steps.
+
+    Returns:
+        str: Cache key.
+    """
+    return json.dumps([list(step) for step in schedule[:n_steps]], default=lambda value: value.item())
+
+
+def get_prefix_settings_key(arrays, settings):
+    """
+    Key of the data and settings a state in `grow_mp(prefix_cache=...)` was grown with.
+
+    A cached state is only continued from by a run with the same key, as
+    `get_prefix_key` only covers the threshold steps.
+
+    Args:
+        arrays (list): Image, seed and boundary (or None). Each is keyed by its
+            shape, dtype and a hash of its content.
+        settings (list): Other settings that change the grown result.
+
+    Returns:
+        str: Settings key.
+    """
+    fingerprints = []
+    for array in arrays:
+        if array is None:
+            fingerprints.append(None)
+            continue
+        array = np.ascontiguousarray(array)
+        fingerprints.append([list(array.shape), str(array.dtype),
+                             hashlib.blake2b(array, digest_size=16).hexdigest()])
+    return json.dumps([fingerprints, settings], default=lambda value: value.tolist())
+
+
+def link_prefix_snapshots(df_log, output_folder):
+    """
+    Bring the intermediate results of a cached prefix into the output folder of this run.
+
+    A run continued from `prefix_cache` starts its log with the entries of the run
+    that grew the prefix, whose results are in that run's output folder. They are
+    hard-linked next to the results of this run (copied where linking fails), and
+    the log entries point to them.
+
+    Args:
+        df_log (list): Log entries of the cached state, updated in place.
+        output_folder (str): Output folder of this run.
+    """
+    for entry in df_log:
+        source = entry['full_path']
+        target = os.path.abspath(os.path.join(output_folder, entry['file_name']))
+        if os.path.abspath(source) == target:
+            continue
+        if not os.path.exists(source):
+            print(f"Intermediate result {source} of the cached prefix no longer exists, it is not linked")
+            continue
+        if os.path.exists(target):
+            os.remove(target)
+        try:
+            os.link(source, target)
+        except OSError:
+            shutil.copy2(source, target)
+        entry['full_path'] = target
+
+
+def get_grow_state(result, threshold_step, next_iter,
+                   count_below_threshold, output_size, df_log, run_key,
+                   frontier_grower=None, label_index=None, last_snapshot_name=None,
+                   copy=False, settings_key=None):
+    """
+    State of grow_mp, to continue a run from it.
+
+    Args:
+        result (np.ndarray): Current grown labels.
+        threshold_step (int): Index of the threshold step to resume in.
+        next_iter (int): Dilation iteration to resume from in this step.
+        count_below_threshold (int): Early stopping counter.
+        output_size (int): Current grown size.
+        df_log (list): Growing log.
+        run_key (str): Settings that must match when resuming.
+        frontier_grower (grow_core.FrontierGrower, optional): Grower of the 'frontier' engine.
+        label_index (grow_core.LabelIndex, optional): Index of the 'per_label' engine.
+        last_snapshot_name (str, optional): Last saved snapshot, for snapshot_format 'delta'.
+        copy (bool): Copy the arrays, for a state kept while the run goes on.
+        settings_key (str, optional): Data and settings of a state kept in a
+            prefix cache, see get_prefix_settings_key.
+
+    Returns:
+        dict: The state, as saved in a checkpoint.
+    """
+    as_array = np.array if copy else np.asarray
+    state = {
+        "result": as_array(result),
+        "threshold_step": threshold_step,
+        "next_iter": next_iter,
+        "count_below_threshold": count_below_threshold,
+        "output_size": output_size,
+        "df_log": json.dumps(df_log, default=lambda value: value.item()),
+        "run_key": run_key,
+    }
+    if frontier_grower is not None:
+        state["arrival"] = as_array(frontier_grower.arrival)
+        state["iteration"] = frontier_grower.iteration
+    if label_index is not None:
+        state["label_active"] = as_array(label_index.active)
+        state["stall_counts"] = as_array(label_index.stall_counts)
+    if last_snapshot_name is not None:
+        state["last_snapshot_name"] = last_snapshot_name
+    if settings_key is not None:
+        state["settings_key"] = settings_key
+    return state
+
+
+def save_grow_checkpoint(checkpoint_path, *args, **kwargs):
+    """
+    Save the state of grow_mp, to resume from it with `resume=True`.
+
+    Args:
+        checkpoint_path (str): Checkpoint path.
+        *args, **kwargs: Passed to get_grow_state.
+    """
+    grow_core.save_checkpoint(checkpoint_path, **get_grow_state(*args, **kwargs))
+
         
 def grow_mp(**kwargs):
     """
@@ -175,8 +459,48 @@ def grow_mp(**kwargs):
         Rule for growth collision. Currently only 'stop' is supported.
     num_threads : int, optional
         Number of parallel threads to use. Defaults to half of available CPUs.
+    grow_engine : str, default='single_pass'
+        How each dilation iteration is computed. 'single_pass' grows every label
+        in one neighbourhood pass, 'per_label' dilates the labels one by one,
+        each inside its bounding box from a `grow_core.LabelIndex`.
+        'frontier' only expands the voxels claimed in the last iteration and
+        saves an arrival map (the iteration each voxel was claimed). It only
+        supports touch_rule 'stop'.
+        'watershed' floods the seeds into each threshold mask in layers of their
+        distance, one layer per iteration, like 'frontier' without the arrival
+        map. Voxels reached by several labels in the same layer go to the
+        largest id, so the result and log are the same as 'single_pass'. It
+        only supports touch_rule 'stop'.
+        'tiled' splits the volume into tiles that are grown in `num_threads`
+        worker processes, with the same result as 'single_pass'.
+        With touch_rule 'overwrite', 'single_pass' and 'tiled' fall back to
+        'per_label', whose overwrite one neighbourhood pass can not reproduce.
+        'multires' needs `grow_to_end=True` and `min_growth_size=0`, grows a
+        copy downsampled by `multires_factor` to the end, and only regrows a
+        narrow band around label interfaces and threshold edges at full
+        resolution. Each threshold step is grown at once, so it can not stop
+        early. It only supports touch_rule 'stop'.
+    multires_factor : int, default=4
+        Downsampling factor per axis for grow_engine 'multires'.
+    morph_backend : str, optional
+        Backend of the grow_engine 'single_pass' neighbourhood pass, 'numpy' or
+        'opencv'. 'opencv' grows 2D images (and the slices of `stack_2d`) with
+        cv2.dilate, with the same result, 3D images still use numpy.
+        Defaults to None (numpy).
+    memory_budget_mb : float, optional
+        If set, grow out of core: the image, seed and boundary files are read
+        slab by slab, the labels are kept in two buffer files in the output
+        folder, and the results are written slab by slab, so the memory used
+        is bounded by this budget (MB) instead of the volume size. The result
+        is the same as grow_engine 'single_pass', which is the only engine
+        supported in this mode.
     save_every_n_iters : int or list[int], optional
         Interval(s) for saving intermediate results. Defaults to `dilation_steps`.
+    snapshot_format : str, default='tif'
+        Format of the intermediate results. 'tif' saves the whole volume in each
+        `INTER_*.tif`. 'delta' saves the seed once as `DELTA_BASE_<base_name>.tif`,
+        and each `INTER_*.npz` only stores the voxels changed since the previous
+        intermediate result, see `grow_core.load_snapshot` to rebuild them.
     grow_to_end : bool, default=False
         If True, grow until no further size increase or mask saturation.
     to_grow_ids : list[int], optional
@@ -187,6 +511,42 @@ def grow_mp(**kwargs):
         Minimum increase in size to consider a growth step meaningful.
     no_growth_max_iter : int, default=3
         Stop early if no meaningful growth occurs for this many iterations.
+    label_min_growth_size : int, optional
+        Per-label early stopping, only for grow_engine 'per_label'. A label that
+        grows by fewer voxels than this for `label_no_growth_max_iter` iterations
+        in a row is frozen and no longer dilated. All labels are active again at
+        the start of each threshold step. Defaults to None (disabled).
+    label_no_growth_max_iter : int, default=3
+        Iterations in a row below `label_min_growth_size` before a label is frozen.
+    checkpoint_every_n_iters : int, optional
+        If set, save a checkpoint (`CHECKPOINT_<base_name>.npz` in the output folder)
+        every N dilation iterations and at the end of each threshold step. It holds
+        the grown labels, the position in the run, the early stopping counters and
+        the log. It is written atomically and removed when the run finishes.
+    resume : bool, default=False
+        If True and a checkpoint exists, continue the run from it instead of
+        starting from the seed. The thresholds, dilation steps, touch rule and
+        engine must be the same as in the checkpointed run.
+    prefix_cache : dict, optional
+        States of runs at the end of threshold steps, keyed by `get_prefix_key`,
+        shared between runs of a parameter sweep on the same image and seed.
+        Without a checkpoint to resume from, the run continues from the longest
+        cached prefix of its threshold steps instead of the seed. A cached
+        state is only used if it was grown from the same image, seed and
+        boundary with the same settings, see `get_prefix_settings_key`;
+        otherwise the run starts from the seed. The intermediate results of
+        the cached steps are linked into the output folder, see
+        `link_prefix_snapshots`.
+    prefix_cache_steps : list[int], optional
+        Numbers of leading threshold steps after which the state of this run is
+        added to `prefix_cache`.
+    threshold_levels : threshold_core.ThresholdLevels, optional
+        Threshold levels of the image, built with all `thresholds` and
+        `upper_thresholds`, e.g. shared by several seeds grown on one image (see
+        grow_mp_multi_seeds). The image is then not needed.
+    stack_2d : bool, default=False
+        If True, the 3D input is a stack of independent 2D images, and every
+        slice is grown on its own in one run, see grow_stack_2d.
     return_for_napari : bool, default=False
         If True, return result as a dictionary of arrays for napari visualization.
     use_simple_naming : bool, default=True
@@ -208,15 +568,22 @@ def grow_mp(**kwargs):
             - "final_output_path": path to the final grown .tif file
             - "log_path": CSV file recording growth steps and sizes
             - "output_folder": directory containing all output files
+            - "arrival_path": arrival iteration map, only for grow_engine 'frontier'
 
     Notes
     -----
     - Intermediate results are saved with prefix `INTER_`, final result with `FINAL_GROW_`.
+    - With grow_engine 'frontier', `ARRIVAL_<base_name>.tif` stores the iteration each voxel
+      was claimed (0 for seeds). The result after iteration k is the final result where
+      arrival <= k, see `grow_core.snapshot_from_arrival`.
     - Growth is constrained by thresholds and optionally by a boundary mask.
     - Growth stops early if saturation is reached or no further meaningful change occurs.
     - If `is_make_meshes` is True, mesh (.ply) files will be generated using marching cubes.
     - The function logs and saves all configurations used for reproducibility.
     """
+    if kwargs.get('stack_2d', False):
+        return grow_stack_2d(**kwargs)
+
     # Extract configuration values from kwargs
     dilation_steps = kwargs.get('dilation_steps', None)
     thresholds = kwargs.get('thresholds', None)  
@@ -224,8 +591,18 @@ def grow_mp(**kwargs):
     
     num_threads = kwargs.get('num_threads', None) 
     save_every_n_iters = kwargs.get('save_every_n_iters', None)  
+    snapshot_format = kwargs.get('snapshot_format', "tif")
+    checkpoint_every_n_iters = kwargs.get('checkpoint_every_n_iters', None)
+    resume = kwargs.get('resume', False)
+    prefix_cache = kwargs.get('prefix_cache', None)
+    prefix_cache_steps = kwargs.get('prefix_cache_steps', None) or []
+    threshold_levels = kwargs.get('threshold_levels', None)
     touch_rule = kwargs.get('touch_rule', "stop")  
+    grow_engine = kwargs.get('grow_engine', "single_pass")
     grow_to_end = kwargs.get('grow_to_end', False)  
+    memory_budget_mb = kwargs.get('memory_budget_mb', None)
+    multires_factor = kwargs.get('multires_factor', 4)
+    morph_backend = kwargs.get('morph_backend', None)
     
     workspace = kwargs.get('workspace', None)
     
@@ -248,6 +625,8 @@ def grow_mp(**kwargs):
     is_sort = kwargs.get('is_sort', False) 
     min_growth_size = kwargs.get('min_growth_size', 50) 
     no_growth_max_iter = kwargs.get('no_growth_max_iter', 3) 
+    label_min_growth_size = kwargs.get('label_min_growth_size', None)
+    label_no_growth_max_iter = kwargs.get('label_no_growth_max_iter', 3)
     
     # For mesh making
     is_make_meshes = kwargs.get('is_make_meshes', False) 
@@ -260,10 +639,6 @@ def grow_mp(**kwargs):
     
     
     
-    default_grow_to_end_iter = 200
-    
-    if grow_to_end:
-        dilation_steps = [default_grow_to_end_iter] * len(dilation_steps)    
     
     if num_threads is None:
         num_threads = max(1, max_threads // 2)
@@ -271,25 +646,52 @@ def grow_mp(**kwargs):
     if num_threads>=max_threads:
         num_threads =  max(1,max_threads-1)
     
+    if grow_engine not in grow_core.support_grow_engines:
+        raise ValueError(f"Unknown grow_engine: {grow_engine}. Must be one of {grow_core.support_grow_engines}.")
+    if grow_engine in ("frontier", "watershed", "multires") and touch_rule != "stop":
+        raise ValueError(f"grow_engine '{grow_engine}' only supports touch_rule 'stop', got {touch_rule}.")
+    if grow_engine == "multires" and not grow_to_end:
+        raise ValueError(f"grow_engine '{grow_engine}' can only be used with grow_to_end=True.")
+    if grow_engine == "multires" and min_growth_size > 0 and no_growth_max_iter is not None:
+        # Each threshold step is grown to the end at once, there are no iterations to stop early at
+        raise ValueError("grow_engine 'multires' can not stop early, set min_growth_size to 0 "
+                         f"(got min_growth_size={min_growth_size} and no_growth_max_iter={no_growth_max_iter}).")
+    if grow_engine == "multires" and (not isinstance(multires_factor, int) or multires_factor < 2):
+        raise ValueError(f"multires_factor must be an integer of at least 2, got {multires_factor}.")
+    if snapshot_format not in ("tif", "delta"):
+        raise ValueError(f"Unknown snapshot_format: {snapshot_format}. Must be 'tif' or 'delta'.")
+    if prefix_cache is not None and (memory_budget_mb is not None or snapshot_format != "tif"):
+        raise ValueError("prefix_cache only supports snapshot_format 'tif', without memory_budget_mb.")
+    if threshold_levels is not None and memory_budget_mb is not None:
+        raise ValueError("threshold_levels can not be used with memory_budget_mb.")
+    if label_min_growth_size is not None and grow_engine != "per_label":
+        raise ValueError(f"label_min_growth_size only supports grow_engine 'per_label', got {grow_engine}.")
+    if morph_backend not in (None, "numpy", "opencv"):
+        raise ValueError(f"Unknown morph_backend: {morph_backend}. Must be 'numpy' or 'opencv'.")
+    if morph_backend == "opencv" and (grow_engine != "single_pass" or memory_budget_mb is not None
+                                      or touch_rule != "stop"):
+        raise ValueError("morph_backend 'opencv' only supports grow_engine 'single_pass' with touch_rule 'stop', "
+                         "without memory_budget_mb.")
+    if memory_budget_mb is not None:
+        if grow_engine != "single_pass":
+            raise ValueError(f"memory_budget_mb only supports grow_engine 'single_pass', got {grow_engine}.")
+        if touch_rule != "stop":
+            raise ValueError(f"memory_budget_mb only supports touch_rule 'stop', got {touch_rule}.")
+        if return_for_napari:
+            raise ValueError("memory_budget_mb can not be used with return_for_napari.")
+        if snapshot_format != "tif":
+            raise ValueError("memory_budget_mb only supports snapshot_format 'tif'.")
+        if checkpoint_every_n_iters is not None or resume:
+            raise ValueError("memory_budget_mb can not be used with checkpoints.")
+    if touch_rule == "overwrite" and grow_engine in ("single_pass", "tiled"):
+        # One neighbourhood pass can not reproduce the per-label overwrite, see grow_core.grow_labels_one_pass
+        print(f"touch_rule 'overwrite' is grown with grow_engine 'per_label' instead of '{grow_engine}'")
+        grow_engine = "per_label"
 
 
-    # Ensure thresholds and dilation_steps have the same length
-    if isinstance(thresholds, int):
-        thresholds = [thresholds]
-    if isinstance(dilation_steps, int):
-        dilation_steps = [dilation_steps]
-
-    thresholds, upper_thresholds = config_core.check_and_assign_thresholds(thresholds, upper_thresholds, reverse= True)
-    
-    assert len(thresholds) == len(dilation_steps), f"thresholds and dilation_steps must have the same length, but got {len(thresholds)} and {len(dilation_steps)}."
-    
-    
-    if isinstance(save_every_n_iters, list):
-        assert len(thresholds) == len(save_every_n_iters), f"Save interval list should have the same length as well"
-    if isinstance(save_every_n_iters, int):
-        save_every_n_iters = [save_every_n_iters] * len(thresholds)
-    if save_every_n_iters is None:
-        save_every_n_iters = dilation_steps
+    thresholds, upper_thresholds, dilation_steps, save_every_n_iters = get_grow_schedule(
+        thresholds, upper_thresholds, dilation_steps, save_every_n_iters, grow_to_end)
+    schedule = list(zip(thresholds, upper_thresholds, dilation_steps, save_every_n_iters))
     
     if workspace is not None:
         img_path = os.path.join(workspace, img_path)
@@ -304,15 +706,34 @@ def grow_mp(**kwargs):
     # loading the image and segmentation mask
 
     
-    img = config_core.check_and_load_data(img, img_path, "img")
-    seg = config_core.check_and_load_data(seg, seg_path, "seg")
-    boundary = config_core.check_and_load_data(boundary, boundary_path, "boundary", must_exist=False)
+    is_ooc = memory_budget_mb is not None
+    if threshold_levels is not None and img is None and img_path is None:
+        # The image is only used through its threshold levels
+        img = threshold_levels.levels
+    img = config_core.check_and_load_data(img, img_path, "img", lazy=is_ooc)
+    seg = config_core.check_and_load_data(seg, seg_path, "seg", lazy=is_ooc)
+    boundary = config_core.check_and_load_data(boundary, boundary_path, "boundary", must_exist=False, lazy=is_ooc)
     
 
     
     
-    config_core.valid_input_data(img, seg=seg, boundary=boundary)
-    boundary = config_core.check_and_cast_boundary(boundary)
+    if is_ooc:
+        # The boundary values are not checked, as it would load the whole boundary
+        # Every non-zero voxel is treated as boundary
+        config_core.valid_input_data(img, seg=seg)
+        if boundary is not None and boundary.shape != img.shape:
+            raise ValueError(f"Image and boundary must have the same shape, got {img.shape} and {boundary.shape}.")
+    else:
+        config_core.valid_input_data(img, seg=seg, boundary=boundary)
+        boundary = config_core.check_and_cast_boundary(boundary)
+    
+    prefix_settings_key = None
+    if prefix_cache is not None:
+        # Cached states of other data or settings can not be continued from
+        prefix_settings_key = get_prefix_settings_key(
+            [img, seg, boundary],
+            [touch_rule, grow_engine, grow_to_end, to_grow_ids, min_growth_size, no_growth_max_iter,
+             label_min_growth_size, label_no_growth_max_iter, multires_factor])
     
     output_folder = os.path.join(output_folder, base_name)
     
@@ -339,8 +760,15 @@ def grow_mp(**kwargs):
             "Output Folder": output_folder,
             "to_grow_ids"  : to_grow_ids,
             "Save every iterations": save_every_n_iters,
+            "snapshot_format": snapshot_format,
+            "checkpoint_every_n_iters": checkpoint_every_n_iters,
+            "resume": resume,
             "num_threads": num_threads,
-            "Early stopping": f"min_growth_size = {min_growth_size} and no_growth_max_iter = {no_growth_max_iter}"
+            "grow_engine": grow_engine,
+            "morph_backend": morph_backend,
+            "memory_budget_mb": memory_budget_mb,
+            "Early stopping": f"min_growth_size = {min_growth_size} and no_growth_max_iter = {no_growth_max_iter}",
+            "Label early stopping": f"label_min_growth_size = {label_min_growth_size} and label_no_growth_max_iter = {label_no_growth_max_iter}"
             }
     print("Start time: "+start_time.strftime("%Y-%m-%d %H:%M:%S"))
     print(f"Growing on: {img_path}")
@@ -356,119 +784,343 @@ def grow_mp(**kwargs):
 
     # create the result array
     # If the input mask has more than 65535 ids, convert it to uint16
-    result = seg.copy()
-    if np.unique(result).size > 255:
-        print("Input mask has more than 65535 ids, converting to uint16")
-        result = result.astype('uint16')
+    if is_ooc:
+        # Two buffer files, each iteration reads one and writes the other
+        slab_size = ooc_core.slab_size_for_budget(img.shape,
+                                                  ooc_core.bytes_per_voxel(np.uint16, img.dtype),
+                                                  memory_budget_mb)
+        print(f"Growing out of core, {slab_size} slices at a time")
+        result = ooc_core.load_seed_to_buffer(seg, os.path.join(output_folder, f"_grow_buffer_a_{base_name}.dat"),
+                                              slab_size)
+        spare = ooc_core.create_buffer(os.path.join(output_folder, f"_grow_buffer_b_{base_name}.dat"),
+                                       result.shape, result.dtype)
+        grow_lut = grow_core.make_grow_lut(np.iinfo(result.dtype).max, to_grow_ids)
+        output_size = int(ooc_core.label_sizes(result, slab_size)[1:].sum())
     else:
-        result = result.astype('uint8')
+        result = seg.copy()
+        if np.unique(result).size > 255:
+            print("Input mask has more than 65535 ids, converting to uint16")
+            result = result.astype('uint16')
+        else:
+            result = result.astype('uint8')
+        # Every threshold mask is taken from the level volume, the image is not needed anymore
+        if threshold_levels is None:
+            threshold_levels = ThresholdLevels(img, thresholds, upper_thresholds)
+        img = None
+    
+    # These engines read the masks slab by slab or box by box, so they are kept
+    # as packed bits (1 bit per voxel) and only the part being grown is unpacked
+    use_packed_masks = not is_ooc and grow_engine in ("single_pass", "per_label")
+    if use_packed_masks and boundary is not None:
+        boundary = PackedMask(boundary)
+    
+    # Settings that a checkpoint must have been made with to be resumed
+    run_key = json.dumps([thresholds, upper_thresholds, dilation_steps, touch_rule, grow_engine])
+    checkpoint_path = get_checkpoint_path(output_folder, base_name)
+    resume_state = None
+    if resume and os.path.exists(checkpoint_path):
+        resume_state = grow_core.load_checkpoint(checkpoint_path)
+        if str(resume_state["run_key"]) != run_key:
+            raise ValueError(f"Checkpoint {checkpoint_path} was made with different thresholds, dilation steps, touch rule or engine.")
+        result = resume_state["result"]
+        df_log = json.loads(str(resume_state["df_log"]))
+        print(f"Resuming from {checkpoint_path}: threshold step {int(resume_state['threshold_step'])}, iteration {int(resume_state['next_iter'])}")
+    elif prefix_cache:
+        # Continue from the longest run of the same first threshold steps, grown before
+        for n_steps in range(len(schedule), 0, -1):
+            cached_state = prefix_cache.get(get_prefix_key(schedule, n_steps))
+            if cached_state is not None and cached_state.get("settings_key") != prefix_settings_key:
+                print(f"The cached result of the first {n_steps} threshold steps was grown "
+                      "with other data or settings, not continuing from it")
+                continue
+            if cached_state is not None:
+                resume_state = cached_state
+                # The cached state is shared, and the engines grow the labels in place
+                result = resume_state["result"].copy()
+                df_log = json.loads(str(resume_state["df_log"]))
+                link_prefix_snapshots(df_log, output_folder)
+                print(f"Continuing from the grown result of the first {n_steps} threshold steps")
+                break
+    
+    if grow_engine in ("frontier", "watershed"):
+        # Grown in place, the labelled size is tracked from the claimed voxels
+        # The watershed flood is the same layered flood, without the arrival map
+        grower = grow_core.FrontierGrower(result, boundary=boundary,
+                                          to_grow_ids=to_grow_ids,
+                                          max_iterations=sum(dilation_steps),
+                                          track_arrival=grow_engine == "frontier")
+        output_size = np.sum(result!=0)
+        if grow_engine == "frontier" and resume_state is not None:
+            grower.arrival[...] = resume_state["arrival"]
+            grower.iteration = int(resume_state["iteration"])
+    elif grow_engine == "tiled":
+        # The labels live in shared memory, the workers count the labelled size
+        grower = grow_core.TiledGrower(result, num_threads,
+                                       touch_rule=touch_rule,
+                                       boundary=boundary,
+                                       to_grow_ids=to_grow_ids)
+        output_size = np.sum(result!=0)
+    elif grow_engine == "per_label":
+        # Ids, regions and sizes of the labels are kept in the index
+        label_index = grow_core.LabelIndex(result, to_grow_ids)
+        output_size = label_index.total_size
+        
+    try:
+        last_snapshot_name = None
+        if snapshot_format == "delta":
+            # Intermediate results only store the changes since the last saved one
+            if resume_state is not None:
+                last_snapshot_name = str(resume_state["last_snapshot_name"])
+                last_snapshot = grow_core.load_snapshot(os.path.join(output_folder, last_snapshot_name))
+            else:
+                last_snapshot = result.copy()
+                last_snapshot_name = f"DELTA_BASE_{base_name}.tif"
+                tifffile.imwrite(os.path.join(output_folder, last_snapshot_name), result, compression ='zlib')
         
-    # Iterate through and make growth results
-    for i, (threshold ,upper_threshold,dilate_iter) in enumerate(zip(thresholds , upper_thresholds,dilation_steps)):
-        # Set the count for check diff for each growing threshold
-        count_below_threshold = 0
+        # Iterate through and make growth results
+        for i, (threshold ,upper_threshold,dilate_iter) in enumerate(zip(thresholds , upper_thresholds,dilation_steps)):
+            # Threshold steps finished before the checkpoint are skipped
+            if resume_state is not None and i < int(resume_state["threshold_step"]):
+                continue
         
+            # Set the count for check diff for each growing threshold
+            count_below_threshold = 0
         
-        threshold_name = "_".join(str(s) for s in thresholds[:i+1])
-        dilate_name = "_".join(str(s) for s in dilation_steps[:i+1])
         
-        if upper_threshold is not None:
-            threshold_binary = (img>=threshold) & (img<=upper_threshold)
-        else:
-            threshold_binary = img >= threshold
+            threshold_name = "_".join(str(s) for s in thresholds[:i+1])
+            dilate_name = "_".join(str(s) for s in dilation_steps[:i+1])
+        
+            if is_ooc:
+                # The threshold mask is made slab by slab when growing
+                full_size = ooc_core.count_threshold(img, threshold, upper_threshold, slab_size)
+            else:
+                if use_packed_masks:
+                    threshold_binary = threshold_levels.packed_mask(threshold, upper_threshold)
+                    full_size = threshold_binary.count()
+                else:
+                    threshold_binary = threshold_levels.mask(threshold, upper_threshold)
+                    full_size = np.sum(threshold_binary)
 
-            
-        full_size = np.sum(threshold_binary)
-        print(f"Size of the threshold {threshold} to {upper_threshold} mask: {full_size}")
-        for i_dilate in range(1, dilate_iter+1):
+            print(f"Size of the threshold {threshold} to {upper_threshold} mask: {full_size}")
+            if grow_engine in ("frontier", "watershed", "tiled"):
+                grower.set_threshold(threshold_binary)
+            if grow_engine == "per_label":
+                # Frozen labels may grow again into the new threshold mask
+                label_index.reactivate()
+        
+            first_iter = 1
+            if resume_state is not None:
+                # Continue the threshold step where the checkpoint was made
+                first_iter = int(resume_state["next_iter"])
+                count_below_threshold = int(resume_state["count_below_threshold"])
+                output_size = int(resume_state["output_size"])
+                input_size = output_size
+                if grow_engine == "per_label" and first_iter > 1:
+                    # The index was rebuilt from the checkpoint, so it can be shorter if the largest id is gone
+                    n_ids = label_index.active.size
+                    label_index.active[...] = resume_state["label_active"][:n_ids]
+                    label_index.stall_counts[...] = resume_state["stall_counts"][:n_ids]
+                resume_state = None
+        
+            dilate_iter_list = range(first_iter, dilate_iter+1)
+            if grow_engine == "multires":
+                # One pass to the end replaces all the dilation iterations of this threshold
+                dilate_iter_list = [dilate_iter] if first_iter <= dilate_iter else []
+            for i_dilate in dilate_iter_list:
 
+                if is_ooc:
+                    input_size = output_size
+                    _, output_size = ooc_core.dilation_one_iter_ooc(result, spare, img,
+                                                                    threshold, upper_threshold,
+                                                                    slab_size,
+                                                                    touch_rule=touch_rule,
+                                                                    grow_lut=grow_lut,
+                                                                    boundary=boundary)
+                    result, spare = spare, result
+                elif grow_engine in ("frontier", "watershed"):
+                    input_size = output_size
+                    output_size = input_size + grower.step()
+                elif grow_engine == "tiled":
+                    input_size = output_size
+                    _, output_size = grower.step()
+                    result = grower.labels
+                elif grow_engine == "per_label":
+                    input_size = output_size
+                    previous_counts = label_index.counts.copy()
+                    result = dilation_one_iter_mp(result, threshold_binary ,
+                                                  num_threads=num_threads,
+                                                    touch_rule = touch_rule,
+                                                    boundary=boundary,
+                                                    label_index=label_index)
+                    output_size = label_index.total_size
+                    if label_min_growth_size is not None:
+                        label_index.freeze_converged(previous_counts,
+                                                     label_min_growth_size,
+                                                     label_no_growth_max_iter)
+                else:
+                    # Get the input size for the log
+                    input_size = np.sum(result!=0)
+                    if grow_engine == "single_pass":
+                        result = grow_core.dilation_one_iter_single_pass(result, threshold_binary,
+                                                                         num_threads=num_threads,
+                                                                         touch_rule = touch_rule,
+                                                                         to_grow_ids=to_grow_ids,
+                                                                         boundary=boundary,
+                                                                         backend=morph_backend)
+                    elif grow_engine == "multires":
+                        result = grow_core.grow_to_end_multires(result, threshold_binary,
+                                                                factor=multires_factor,
+                                                                to_grow_ids=to_grow_ids,
+                                                                boundary=boundary)
+                
+                    # Get the output size for the log
+                    output_size = np.sum(result!=0)
             
-            # Get the input size for the log
-            input_size = np.sum(result!=0)
-            result = dilation_one_iter_mp(result, threshold_binary ,
-                                          num_threads=num_threads,
-                                            touch_rule = touch_rule,
-                                            to_grow_ids=to_grow_ids,
-                                            boundary=boundary)
-            
-            ## Check if output size and input 's diff is bigger than min_growth_size
-
-            # Get the output size for the log
-            output_size = np.sum(result!=0)
-            if output_size - input_size < min_growth_size:
-                count_below_threshold += 1
-            else:
-                count_below_threshold = 0
+                ## Check if output size and input 's diff is bigger than min_growth_size
+                if output_size - input_size < min_growth_size:
+                    count_below_threshold += 1
+                else:
+                    count_below_threshold = 0
                 
-            # Situations to save grow results 
-            # When it ends:
-            # 1. Reach the final iter, 
-            # 2. Not been growing for sometime
-            # 3. Grow to the size of the current threshold  
-            if no_growth_max_iter is None:
-                is_early_stop = False
-            else:
-                is_early_stop = (count_below_threshold >= no_growth_max_iter)
+                # Situations to save grow results 
+                # When it ends:
+                # 1. Reach the final iter, 
+                # 2. Not been growing for sometime
+                # 3. Grow to the size of the current threshold  
+                if no_growth_max_iter is None:
+                    is_early_stop = False
+                else:
+                    is_early_stop = (count_below_threshold >= no_growth_max_iter)
              
-            if (i_dilate% save_every_n_iters[i]==0 or 
-                i_dilate ==dilate_iter or 
-                is_early_stop or
-                (grow_to_end == True and abs(full_size - output_size) < 0.05) ):
+                if (i_dilate% save_every_n_iters[i]==0 or 
+                    i_dilate ==dilate_iter or 
+                    is_early_stop or
+                    (grow_to_end == True and abs(full_size - output_size) < 0.05) ):
                 
 
-                cur_threshold = f"{threshold}_{upper_threshold}"
-                if use_simple_naming:
-                    output_grow_name = f'INTER_{base_name}_{cur_threshold}_{i_dilate}'
+                    cur_threshold = f"{threshold}_{upper_threshold}"
+                    if use_simple_naming:
+                        output_grow_name = f'INTER_{base_name}_{cur_threshold}_{i_dilate}'
 
-                else:
-                    output_grow_name = f'INTER_{base_name}_iter_{i_dilate}_dilate_{dilate_name}_thre_{threshold_name}_{upper_threshold}'
+                    else:
+                        output_grow_name = f'INTER_{base_name}_iter_{i_dilate}_dilate_{dilate_name}_thre_{threshold_name}_{upper_threshold}'
                    
             
-                output_path = os.path.join(output_folder, output_grow_name + ".tif")
-                # Write the log
-                df_log.append({'id': (i*dilate_iter)+i_dilate, 
-                    'grow_size': output_size,
-                    'full_size': full_size,
-                    'cur_threshold': cur_threshold,
-                    "file_name": os.path.basename(output_path),
-                    'full_path': os.path.abspath(output_path),
-                    'cur_dilate_step': i_dilate,
-                    })
+                    snapshot_ext = ".npz" if snapshot_format == "delta" else ".tif"
+                    output_path = os.path.join(output_folder, output_grow_name + snapshot_ext)
+                    # Write the log
+                    df_log.append({'id': (i*dilate_iter)+i_dilate, 
+                        'grow_size': output_size,
+                        'full_size': full_size,
+                        'cur_threshold': cur_threshold,
+                        "file_name": os.path.basename(output_path),
+                        'full_path': os.path.abspath(output_path),
+                        'cur_dilate_step': i_dilate,
+                        })
+                    if grow_engine == "frontier":
+                        # Global iteration, to rebuild this result from the arrival map
+                        df_log[-1]['arrival_iter'] = grower.iteration
+                    if grow_engine == "per_label":
+                        # Labels still being grown in the next iteration
+                        df_log[-1]['active_labels'] = len(label_index.active_ids())
                 
-                # Do not sort intermediate results, as it will cause the ids to change
-                # So will mess up the growing id.
-                # result,_ = sprout_core.reorder_segmentation(result, sort_ids=is_sort)
-                tifffile.imwrite(output_path,  result, compression ='zlib')
-                if return_for_napari:
-                    grows_dict[output_grow_name] =result
+                    # Do not sort intermediate results, as it will cause the ids to change
+                    # So will mess up the growing id.
+                    # result,_ = sprout_core.reorder_segmentation(result, sort_ids=is_sort)
+                    if is_ooc:
+                        ooc_core.write_tiff_by_slab(output_path, result, slab_size)
+                    elif snapshot_format == "delta":
+                        grow_core.save_delta_snapshot(output_path, result, last_snapshot, last_snapshot_name)
+                        last_snapshot_name = os.path.basename(output_path)
+                    else:
+                        tifffile.imwrite(output_path,  result, compression ='zlib')
+                    if return_for_napari:
+                        if grow_engine == "frontier":
+                            # result keeps growing in place, so keep a snapshot from the arrival map
+                            grows_dict[output_grow_name] = grow_core.snapshot_from_arrival(result, grower.arrival,
+                                                                                          grower.iteration)
+                        elif grow_engine in ("watershed", "tiled"):
+                            # result keeps growing in place, or is a shared buffer reused by the next iterations
+                            grows_dict[output_grow_name] = result.copy()
+                        else:
+                            grows_dict[output_grow_name] =result
                 
-                print(f"\tGrown result has been saved {os.path.abspath(output_path)}")
-                print(f"\tIter:{i_dilate}. Last Input size = {input_size} and Output_size = {output_size}")
+                    print(f"\tGrown result has been saved {os.path.abspath(output_path)}")
+                    print(f"\tIter:{i_dilate}. Last Input size = {input_size} and Output_size = {output_size}")
 
                 
-                # Early stopping conditions
-                if count_below_threshold >= no_growth_max_iter:
-                    print(f"\tNot growing for {no_growth_max_iter} iters\nBreaking at iteration {i_dilate} with Input size = {input_size} and Output_size = {output_size}")
-                    break
-                # If grow to end, check if the size is similar to the threshold size
-                # If the size is similar to the threshold size, break
-                if (grow_to_end == True and abs(full_size - output_size) < 0.05) :
-                    print(f"\tGrow size is similar to the threshold size\nBreaking at iteration {i_dilate}: Input size = {input_size}, Output_size = {output_size} and size of threshold binary = {full_size}")
-                    break
+                    # Early stopping conditions
+                    if is_early_stop:
+                        print(f"\tNot growing for {no_growth_max_iter} iters\nBreaking at iteration {i_dilate} with Input size = {input_size} and Output_size = {output_size}")
+                        break
+                    # If grow to end, check if the size is similar to the threshold size
+                    # If the size is similar to the threshold size, break
+                    if (grow_to_end == True and abs(full_size - output_size) < 0.05) :
+                        print(f"\tGrow size is similar to the threshold size\nBreaking at iteration {i_dilate}: Input size = {input_size}, Output_size = {output_size} and size of threshold binary = {full_size}")
+                        break
+            
+                if checkpoint_every_n_iters is not None and i_dilate % checkpoint_every_n_iters == 0:
+                    save_grow_checkpoint(checkpoint_path, result, i, i_dilate+1,
+                                         count_below_threshold, output_size, df_log, run_key,
+                                         frontier_grower=grower if grow_engine == "frontier" else None,
+                                         label_index=label_index if grow_engine == "per_label" else None,
+                                         last_snapshot_name=last_snapshot_name)
             
-        print(f"\tFinish growing. Last Input size = {input_size} and Output_size = {output_size}\n")
+            print(f"\tFinish growing. Last Input size = {input_size} and Output_size = {output_size}\n")
+            if checkpoint_every_n_iters is not None:
+                # Resume from the start of the next threshold step
+                save_grow_checkpoint(checkpoint_path, result, i+1, 1,
+                                     0, output_size, df_log, run_key,
+                                     frontier_grower=grower if grow_engine == "frontier" else None,
+                                     label_index=label_index if grow_engine == "per_label" else None,
+                                     last_snapshot_name=last_snapshot_name)
+            if prefix_cache is not None and i+1 in prefix_cache_steps:
+                # Later runs with the same first threshold steps continue from here
+                prefix_cache[get_prefix_key(schedule, i+1)] = get_grow_state(
+                    result, i+1, 1, 0, output_size, df_log, run_key,
+                    frontier_grower=grower if grow_engine == "frontier" else None,
+                    label_index=label_index if grow_engine == "per_label" else None,
+                    copy=True, settings_key=prefix_settings_key)
     
+        if grow_engine == "tiled":
+            result = grower.close()
+    finally:
+        if grow_engine == "tiled":
+            # Stops the workers and frees the shared memory if growing failed
+            grower.terminate()
+    
+    arrival_path = None
+    if grow_engine == "frontier":
+        arrival_path = os.path.join(output_folder, f"ARRIVAL_{base_name}.tif")
+        tifffile.imwrite(arrival_path, grower.arrival, compression ='zlib')
+        print(f"Arrival iteration map has been saved {os.path.abspath(arrival_path)}")
+
     ## Save the final grow output as the final_<img_name>
     # only sort it in the end
-    result,_ = sprout_core.reorder_segmentation(result, sort_ids=is_sort)
     final_grow_name = f"FINAL_GROW_{base_name}"
     if final_grow_output_folder is not None:
         final_output_path = os.path.join(final_grow_output_folder,f"{final_grow_name}.tif")
     else:
         final_output_path = os.path.join(output_folder,f"{final_grow_name}.tif")
-    tifffile.imwrite(final_output_path, result, compression ='zlib')
-    if return_for_napari:
-        grows_dict[final_grow_name] =result
+    if is_ooc:
+        sort_lut = None
+        if is_sort:
+            sort_lut = ooc_core.sort_lut(ooc_core.label_sizes(result, slab_size), result.dtype)
+        ooc_core.write_tiff_by_slab(final_output_path, result, slab_size, lut=sort_lut)
+        # Remove the buffer files
+        buffer_paths = [result.filename, spare.filename]
+        del result, spare
+        for buffer_path in buffer_paths:
+            os.remove(buffer_path)
+    else:
+        result,_ = sprout_core.reorder_segmentation(result, sort_ids=is_sort)
+        tifffile.imwrite(final_output_path, result, compression ='zlib')
+        if return_for_napari:
+            grows_dict[final_grow_name] =result
+    
+    if os.path.exists(checkpoint_path):
+        # The run is finished, so there is nothing left to resume
+        os.remove(checkpoint_path)
     
 
     total_seconds = (datetime.now() - start_time).total_seconds()
@@ -487,6 +1139,8 @@ def grow_mp(**kwargs):
     # Make meshes  
     if is_make_meshes:  
         tif_files = glob.glob(os.path.join(output_folder, '*.tif'))
+        tif_files = [tif_file for tif_file in tif_files 
+                     if not os.path.basename(tif_file).startswith(("ARRIVAL_", "DELTA_BASE_"))]
 
         for tif_file in tif_files:
             make_mesh.make_mesh_for_tiff(tif_file,output_folder,
@@ -499,12 +1153,373 @@ def grow_mp(**kwargs):
     log_dict = {
         "final_output_path": final_output_path,
         "log_path":log_path,
-        "output_folder": output_folder
+        "output_folder": output_folder,
+        "arrival_path": arrival_path
     }
     
     return grows_dict ,log_dict
 
 
+def grow_stack_2d(**kwargs):
+    """
+    Grow a stack of independent 2D images, e.g. many 2D slides saved as one 3D TIFF.
+
+    Every slice along the first axis is grown on its own, as grow_mp grows a 2D
+    image, with the same thresholds and early stopping for each slice. All slices are grown in one run, split between `num_threads` threads,
+    and a slice stops growing in a threshold step when its own growth stops.
+
+    Called by grow_mp with `stack_2d=True`, and takes the same parameters,
+    except `grow_engine`, `memory_budget_mb`, `snapshot_format`, checkpoints,
+    `prefix_cache` and meshes, which are not supported. Only touch_rule 'stop'
+    is supported.
+
+    Outputs are one stacked volume per saved iteration (`INTER_*.tif`) and
+    `FINAL_GROW_<base_name>.tif`, the growing log of the whole stack
+    `grow_log_<base_name>.csv`, and `grow_log_slices_<base_name>.csv` with the
+    grown size, threshold size, iterations and stop reason of every slice in
+    every threshold step. With `is_sort`, the ids of every slice are sorted on
+    their own.
+
+    Returns
+    -------
+    Same as grow_mp, `log_dict` also has "slice_log_path".
+    """
+    dilation_steps = kwargs.get('dilation_steps', None)
+    thresholds = kwargs.get('thresholds', None)
+    upper_thresholds = kwargs.get('upper_thresholds', None)
+
+    num_threads = kwargs.get('num_threads', None)
+    save_every_n_iters = kwargs.get('save_every_n_iters', None)
+    touch_rule = kwargs.get('touch_rule', "stop")
+    grow_to_end = kwargs.get('grow_to_end', False)
+    threshold_levels = kwargs.get('threshold_levels', None)
+    morph_backend = kwargs.get('morph_backend', None)
+
+    workspace = kwargs.get('workspace', None)
+    img_path = kwargs.get('img_path', None)
+    seg_path = kwargs.get('seg_path', None)
+    boundary_path = kwargs.get('boundary_path', None)
+    img = kwargs.get('img', None)
+    seg = kwargs.get('seg', None)
+    boundary = kwargs.get('boundary', None)
+
+    output_folder = kwargs.get('output_folder', None)
+    final_grow_output_folder = kwargs.get('final_grow_output_folder', None)
+    base_name = kwargs.get('base_name', None)
+    use_simple_naming = kwargs.get('use_simple_naming', True)
+
+    to_grow_ids = kwargs.get('to_grow_ids', None)
+    is_sort = kwargs.get('is_sort', False)
+    min_growth_size = kwargs.get('min_growth_size', 50)
+    no_growth_max_iter = kwargs.get('no_growth_max_iter', 3)
+    return_for_napari = kwargs.get('return_for_napari', False)
+
+    if kwargs.get('grow_engine', "single_pass") != "single_pass":
+        raise ValueError("stack_2d only supports grow_engine 'single_pass'.")
+    if (kwargs.get('memory_budget_mb', None) is not None
+            or kwargs.get('snapshot_format', "tif") != "tif"
+            or kwargs.get('checkpoint_every_n_iters', None) is not None
+            or kwargs.get('resume', False)
+            or kwargs.get('prefix_cache', None) is not None
+            or kwargs.get('is_make_meshes', False)):
+        raise ValueError("stack_2d does not support memory_budget_mb, snapshot_format 'delta', "
+                         "checkpoints, prefix_cache or is_make_meshes.")
+    if touch_rule != 'stop':
+        raise ValueError(f"stack_2d only supports touch_rule 'stop', got {touch_rule}.")
+    if morph_backend not in (None, "numpy", "opencv"):
+        raise ValueError(f"Unknown morph_backend: {morph_backend}. Must be 'numpy' or 'opencv'.")
+
+    thresholds, upper_thresholds, dilation_steps, save_every_n_iters = get_grow_schedule(
+        thresholds, upper_thresholds, dilation_steps, save_every_n_iters, grow_to_end)
+
+    if num_threads is None:
+        num_threads = max(1, max_threads // 2)
+    if num_threads>=max_threads:
+        num_threads =  max(1,max_threads-1)
+
+    if workspace is not None:
+        img_path = os.path.join(workspace, img_path)
+        seg_path = os.path.join(workspace, seg_path)
+        output_folder = os.path.join(workspace, output_folder)
+        if boundary_path is not None:
+            boundary_path = os.path.join(workspace, boundary_path)
+
+    base_name = config_core.check_and_assign_base_name(base_name, img_path, "grown_result")
+
+    if threshold_levels is not None and img is None and img_path is None:
+        # The image is only used through its threshold levels
+        img = threshold_levels.levels
+    img = config_core.check_and_load_data(img, img_path, "img")
+    seg = config_core.check_and_load_data(seg, seg_path, "seg")
+    boundary = config_core.check_and_load_data(boundary, boundary_path, "boundary", must_exist=False)
+    config_core.valid_input_data(img, seg=seg, boundary=boundary)
+    boundary = config_core.check_and_cast_boundary(boundary)
+    if img.ndim != 3:
+        raise ValueError(f"stack_2d needs a 3D stack of 2D images, got {img.ndim}D.")
+
+    output_folder = os.path.abspath(os.path.join(output_folder, base_name))
+    os.makedirs(output_folder, exist_ok=True)
+
+    start_time = datetime.now()
+    print("Start time: "+start_time.strftime("%Y-%m-%d %H:%M:%S"))
+    print(f"Growing a stack of {img.shape[0]} 2D images: {img_path}")
+    print(f"  Grow Thresholds: {thresholds}, upper thresholds: {upper_thresholds}")
+    print(f"  Dilate Iterations: {dilation_steps}, num_threads: {num_threads}, morph_backend: {morph_backend}")
+    print(f"  Output Folder: {output_folder}")
+
+    result = seg.copy()
+    if np.unique(result).size > 255:
+        print("Input mask has more than 65535 ids, converting to uint16")
+        result = result.astype('uint16')
+    else:
+        result = result.astype('uint8')
+    if threshold_levels is None:
+        threshold_levels = ThresholdLevels(img, thresholds, upper_thresholds)
+    img = None
+    grow_lut = grow_core.make_grow_lut(result.max(), to_grow_ids)
+
+    n_slices = result.shape[0]
+    output_sizes = np.count_nonzero(result.reshape(n_slices, -1), axis=1)
+    df_log = []
+    df_slice_log = []
+    grows_dict = {}
+
+    for i, (threshold, upper_threshold, dilate_iter) in enumerate(zip(thresholds, upper_thresholds, dilation_steps)):
+        threshold_name = "_".join(str(s) for s in thresholds[:i+1])
+        dilate_name = "_".join(str(s) for s in dilation_steps[:i+1])
+        cur_threshold = f"{threshold}_{upper_threshold}"
+
+        threshold_binary = threshold_levels.mask(threshold, upper_threshold)
+        full_sizes = np.count_nonzero(threshold_binary.reshape(n_slices, -1), axis=1)
+        print(f"Size of the threshold {threshold} to {upper_threshold} mask: {full_sizes.sum()}")
+
+        # Early stopping of every slice, as a separate 2D run would do
+        count_below_threshold = np.zeros(n_slices, dtype=np.int64)
+        grown_iters = np.zeros(n_slices, dtype=np.int64)
+        stop_reasons = np.full(n_slices, "max_iter", dtype=object)
+        active = np.ones(n_slices, dtype=bool)
+
+        for i_dilate in range(1, dilate_iter+1):
+            slice_ids = np.flatnonzero(active)
+            input_sizes = output_sizes.copy()
+            counts = grow_core.dilation_one_iter_stack_2d(result, threshold_binary, slice_ids,
+                                                          num_threads=num_threads,
+                                                          touch_rule=touch_rule,
+                                                          grow_lut=grow_lut,
+                                                          boundary=boundary,
+                                                          backend=morph_backend)
+            output_sizes[slice_ids] = counts[slice_ids]
+            grown_iters[slice_ids] = i_dilate
+
+            is_below = output_sizes[slice_ids] - input_sizes[slice_ids] < min_growth_size
+            count_below_threshold[slice_ids] = np.where(is_below, count_below_threshold[slice_ids] + 1, 0)
+            if no_growth_max_iter is not None:
+                is_early_stop = active & (count_below_threshold >= no_growth_max_iter)
+                stop_reasons[is_early_stop] = "no_growth"
+                active &= ~is_early_stop
+            if grow_to_end:
+                is_full = active & (np.abs(full_sizes - output_sizes) < 0.05)
+                stop_reasons[is_full] = "full"
+                active &= ~is_full
+
+            if (i_dilate % save_every_n_iters[i] == 0 or
+                i_dilate == dilate_iter or
+                not active.any()):
+                if use_simple_naming:
+                    output_grow_name = f'INTER_{base_name}_{cur_threshold}_{i_dilate}'
+                else:
+                    output_grow_name = f'INTER_{base_name}_iter_{i_dilate}_dilate_{dilate_name}_thre_{threshold_name}_{upper_threshold}'
+                output_path = os.path.join(output_folder, output_grow_name + ".tif")
+                tifffile.imwrite(output_path, result, compression ='zlib')
+                df_log.append({'id': (i*dilate_iter)+i_dilate,
+                    'grow_size': int(output_sizes.sum()),
+                    'full_size': int(full_sizes.sum()),
+                    'cur_threshold': cur_threshold,
+                    "file_name": os.path.basename(output_path),
+                    'full_path': os.path.abspath(output_path),
+                    'cur_dilate_step': i_dilate,
+                    'active_slices': int(active.sum()),
+                    })
+                if return_for_napari:
+                    grows_dict[output_grow_name] = result.copy()
+                print(f"\tIter:{i_dilate}. Grown size = {output_sizes.sum()}, {active.sum()} of {n_slices} slices still growing")
+
+            if not active.any():
+                break
+
+        for slice_id in range(n_slices):
+            df_slice_log.append({'slice': slice_id,
+                'cur_threshold': cur_threshold,
+                'dilate_iters': int(grown_iters[slice_id]),
+                'grow_size': int(output_sizes[slice_id]),
+                'full_size': int(full_sizes[slice_id]),
+                'stop_reason': stop_reasons[slice_id],
+                })
+
+    final_grow_name = f"FINAL_GROW_{base_name}"
+    if final_grow_output_folder is not None:
+        final_output_path = os.path.join(final_grow_output_folder,f"{final_grow_name}.tif")
+    else:
+        final_output_path = os.path.join(output_folder,f"{final_grow_name}.tif")
+    if is_sort:
+        result = grow_core.sort_stack_2d(result)
+    tifffile.imwrite(final_output_path, result, compression ='zlib')
+    if return_for_napari:
+        grows_dict[final_grow_name] = result
+
+    total_seconds = (datetime.now() - start_time).total_seconds()
+    minutes, s = divmod(total_seconds, 60)
+    print(f"Running time:{minutes} minutes {round(s,2)} sec\n")
+
+    log_path = os.path.join(output_folder, f'grow_log_{base_name}.csv')
+    pd.DataFrame(df_log).to_csv(log_path, index = False)
+    slice_log_path = os.path.join(output_folder, f'grow_log_slices_{base_name}.csv')
+    pd.DataFrame(df_slice_log).to_csv(slice_log_path, index = False)
+
+    config_core.save_config_with_output({
+        "params": kwargs},output_folder)
+
+    log_dict = {
+        "final_output_path": final_output_path,
+        "log_path":log_path,
+        "slice_log_path": slice_log_path,
+        "output_folder": output_folder,
+        "arrival_path": None
+    }
+    return grows_dict ,log_dict
+
+
+def grow_mp_multi_seeds(**kwargs):
+    """
+    Grow several seeds on the same image, with the same thresholds.
+
+    The image and the boundary are loaded once, and the threshold masks are
+    taken from one shared `threshold_core.ThresholdLevels`, so the image is not
+    reloaded and the masks are not rebuilt for every seed. The seeds are grown
+    concurrently, one seed per thread.
+
+    Parameters
+    ----------
+    img : np.ndarray, optional
+        Input image. If not provided, `img_path` must be given.
+    img_path : str, optional
+        Path to the image file.
+    segs : list[np.ndarray], optional
+        Seeds to grow. If not provided, `seg_paths` must be given.
+    seg_paths : list[str], optional
+        Paths to the seed files, each is loaded by the thread growing it.
+    boundary : np.ndarray, optional
+        Boundary mask, shared by all seeds.
+    boundary_path : str, optional
+        Path to the boundary mask.
+    output_folders : str or list[str]
+        Output folder of all seeds, or of each seed.
+    base_names : list[str], optional
+        Base name of each seed's output. Defaults to the seed file names, or
+        `grown_result_<i>` for seeds given as arrays.
+    workspace : str, optional
+        Root folder prepended to all the paths.
+    num_threads : int, optional
+        Number of seeds grown at once. Defaults to half of available CPUs.
+    raise_errors : bool, default=True
+        If False, a seed that fails to grow gives its exception in the results,
+        instead of stopping the other seeds.
+    **kwargs
+        Other parameters of grow_mp, used for every seed (`thresholds`,
+        `dilation_steps`, `touch_rule`, ...).
+
+    Returns
+    -------
+    list
+        (grows_dict, log_dict) of grow_mp for each seed, in the order of the seeds.
+    """
+    kwargs = dict(kwargs)
+    workspace = kwargs.pop('workspace', None)
+    img = kwargs.pop('img', None)
+    img_path = kwargs.pop('img_path', None)
+    segs = kwargs.pop('segs', None)
+    seg_paths = kwargs.pop('seg_paths', None)
+    boundary = kwargs.pop('boundary', None)
+    boundary_path = kwargs.pop('boundary_path', None)
+    output_folders = kwargs.pop('output_folders', None)
+    base_names = kwargs.pop('base_names', None)
+    num_threads = kwargs.pop('num_threads', None)
+    raise_errors = kwargs.pop('raise_errors', True)
+
+    if (segs is None) == (seg_paths is None):
+        raise ValueError("Either segs or seg_paths must be provided.")
+    n_seeds = len(segs) if segs is not None else len(seg_paths)
+    if isinstance(output_folders, str):
+        output_folders = [output_folders] * n_seeds
+    if output_folders is None or len(output_folders) != n_seeds:
+        raise ValueError("output_folders must be a folder, or a list with one folder per seed.")
+    if base_names is None:
+        base_names = [config_core.check_and_assign_base_name(None, seg_paths[seed_id] if seg_paths else None,
+                                                             f"grown_result_{seed_id}")
+                      for seed_id in range(n_seeds)]
+    if len(set(zip(output_folders, base_names))) != n_seeds:
+        raise ValueError("Every seed must have a different output folder or base name.")
+
+    if workspace is not None:
+        output_folders = [os.path.join(workspace, folder) for folder in output_folders]
+        if img_path is not None:
+            img_path = os.path.join(workspace, img_path)
+        if seg_paths is not None:
+            seg_paths = [os.path.join(workspace, path) for path in seg_paths]
+        if boundary_path is not None:
+            boundary_path = os.path.join(workspace, boundary_path)
+
+    img = config_core.check_and_load_data(img, img_path, "img")
+    boundary = config_core.check_and_load_data(boundary, boundary_path, "boundary", must_exist=False)
+    config_core.valid_input_data(img, boundary=boundary)
+    boundary = config_core.check_and_cast_boundary(boundary)
+
+    thresholds = kwargs.get('thresholds', None)
+    if isinstance(thresholds, int):
+        thresholds = [thresholds]
+    thresholds, upper_thresholds = config_core.check_and_assign_thresholds(thresholds,
+                                                                           kwargs.get('upper_thresholds', None),
+                                                                           reverse=True)
+    # Packed masks are cached, so each threshold mask is built once for all seeds
+    threshold_levels = ThresholdLevels(img, thresholds, upper_thresholds, cache_masks=True)
+    img = None
+
+    if num_threads is None:
+        num_threads = max(1, max_threads // 2)
+    num_threads = max(1, min(num_threads, n_seeds))
+
+    results = [None] * n_seeds
+
+    def grow_seeds(seed_ids):
+        for seed_id in seed_ids:
+            try:
+                seg = segs[seed_id] if segs is not None else tifffile.imread(seg_paths[seed_id])
+                results[seed_id] = grow_mp(seg=seg,
+                                           boundary=boundary,
+                                           threshold_levels=threshold_levels,
+                                           output_folder=output_folders[seed_id],
+                                           base_name=base_names[seed_id],
+                                           num_threads=1,
+                                           **kwargs)
+            except Exception as e:
+                print(f"Error occurs when growing seed {base_names[seed_id]}: {e}")
+                results[seed_id] = e
+
+    threads = []
+    for thread_id in range(num_threads):
+        thread = threading.Thread(target=grow_seeds, args=(range(thread_id, n_seeds, num_threads),))
+        threads.append(thread)
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if raise_errors:
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+    return results
+
+
 def run_make_grow(file_path):
           
     _, extension = os.path.splitext(file_path)
@@ -529,8 +1544,15 @@ def run_make_grow(file_path):
         num_threads = config['num_threads'],
         
         save_every_n_iters = optional_params['save_every_n_iters'],  
+        snapshot_format = optional_params['snapshot_format'],
+        checkpoint_every_n_iters = optional_params['checkpoint_every_n_iters'],
+        resume = optional_params['resume'],
         touch_rule = config['touch_rule'], 
-        
+        grow_engine = optional_params['grow_engine'],
+        memory_budget_mb = optional_params['memory_budget_mb'],
+        multires_factor = optional_params['multires_factor'],
+        morph_backend = optional_params['morph_backend'],
+        stack_2d = optional_params['stack_2d'],
         
         grow_to_end = optional_params["grow_to_end"],
         to_grow_ids = optional_params["to_grow_ids"],
@@ -543,6 +1565,8 @@ def run_make_grow(file_path):
         is_sort = optional_params['is_sort'],
         min_growth_size = optional_params['min_growth_size'],
         no_growth_max_iter = optional_params['no_growth_max_iter'],
+        label_min_growth_size = optional_params['label_min_growth_size'],
+        label_no_growth_max_iter = optional_params['label_no_growth_max_iter'],
         
         # For mesh making
         is_make_meshes = optional_params['is_make_meshes'],
@@ -18,6 +18,9 @@ max_threads = multiprocessing.cpu_count()
 import sprout_core.sprout_core as sprout_core
 import sprout_core.config_core as config_core
 import sprout_core.vis_lib as vis_lib
+import sprout_core.tree_core as tree_core
+from sprout_core.threshold_core import ThresholdLevels
+import tifffile
 
 
 import json, yaml
@@ -43,8 +46,34 @@ pre_set_sub_folders_2d = [footprint[0] for footprint in pre_set_footprint_list_2
 
 
 
+def scale_log_sizes(log_dict, size_scale):
+    """
+    Scale the sizes of a seed log from downsampled voxels to full-resolution voxels.
+
+    In a dry run with `dry_run_downsample`, every voxel stands for `size_scale`
+    voxels of the full image, so the scaled sizes are estimates. The log records
+    the scale as `size_scale`.
+
+    Args:
+        log_dict (dict): Seed log of one threshold, modified in place.
+        size_scale (int): Full-resolution voxels per downsampled voxel.
+
+    Returns:
+        dict: The scaled log.
+    """
+    if size_scale == 1:
+        return log_dict
+    log_dict["Whole Volume"] = int(log_dict["Whole Volume"]) * size_scale
+    for seed in log_dict["seeds"]:
+        seed["size_ccomp"] = [int(size) * size_scale for size in seed["size_ccomp"]]
+    log_dict["size_scale"] = size_scale
+    return log_dict
+
+
 def gen_seed_mp(volume, thre_fp_pairs, ero_iter , segments , 
-                        boundary = None ,result_dict = None, return_for_napari = False):
+                        boundary = None ,result_dict = None, return_for_napari = False,
+                        threshold_levels = None, erosion_mode = 'iterative', save_seeds = True,
+                        morph_backend = None, slice_threads = 1, log_name = None, size_scale = 1):
     
     
     for threshold_ero_iter_pair in thre_fp_pairs:
@@ -58,8 +87,9 @@ def gen_seed_mp(volume, thre_fp_pairs, ero_iter , segments ,
         output_seed_folder =  threshold_ero_iter_pair[1][1]
         os.makedirs(output_seed_folder, exist_ok=True)
 
-        output_json_path = os.path.join(output_seed_folder,
-                                    f"seed_log_{datetime.now().strftime('%Y%m%d_%H%M')}.json")
+        if log_name is None:
+            log_name = f"seed_log_{datetime.now().strftime('%Y%m%d_%H%M')}.json"
+        output_json_path = os.path.join(output_seed_folder, log_name)
 
         if footprints == 'ball' or footprints == 'default':
             footprints = ['ball'] * ero_iter
@@ -73,7 +103,12 @@ def gen_seed_mp(volume, thre_fp_pairs, ero_iter , segments ,
                                           footprints = footprints,
                                           upper_threshold = upper_threshold,
                                           boundary = boundary,
-                                          is_return_seeds = return_for_napari)
+                                          is_return_seeds = return_for_napari,
+                                          threshold_levels = threshold_levels,
+                                          erosion_mode = erosion_mode,
+                                          save_seeds = save_seeds,
+                                          morph_backend = morph_backend,
+                                          num_threads = slice_threads)
         
 
         # log_dict['input_file'] = file_path
@@ -82,13 +117,101 @@ def gen_seed_mp(volume, thre_fp_pairs, ero_iter , segments ,
                 
         with lock:
             # filename = f'output/json/Bount_ori_run_log_{init_threshold}_{target_threshold}.json'
-            config_core.write_json(output_json_path, log_dict)   
+            config_core.write_json(output_json_path, scale_log_sizes(log_dict, size_scale))
             if return_for_napari and result_dict is not None:
                 result_dict.update(seed_dict)
                 # result_dict[output_seed_folder] = seed_dict
 
 
 
+def gen_seed_tree(threshold_levels, thresholds, fp_folder_pairs, ero_iter, segments,
+                  result_dict = None, return_for_napari = False, save_seeds = True,
+                  log_name = None, size_scale = 1):
+    """
+    Seed generation from graphs of flat zones, for every threshold at once.
+
+    For each footprint list, the threshold levels are eroded step by step (one grey
+    erosion erodes every threshold mask), and the seeds of all thresholds are read
+    from one graph of flat zones per erosion step. Seeds and logs are the same as
+    gen_seed_mp writes.
+
+    Args:
+        threshold_levels (ThresholdLevels): Levels of all thresholds, without upper thresholds.
+        thresholds (list): Lower thresholds.
+        fp_folder_pairs (list): (footprints, output_seed_folder) pairs.
+        ero_iter (int): Number of erosion steps.
+        segments (int): Number of components to keep.
+        result_dict (dict, optional): Collects the seeds for napari.
+        return_for_napari (bool): Whether to return the seeds in `result_dict`.
+        save_seeds (bool): Whether to save the seeds. If False, only the component
+            sizes are read from the trees and logged, and no seed is built.
+        log_name (str, optional): Name of the seed log file in every seed folder.
+            Defaults to a name with the current time.
+        size_scale (int): Factor of the logged sizes, see scale_log_sizes.
+    """
+    for footprints, output_seed_folder in fp_folder_pairs:
+        os.makedirs(output_seed_folder, exist_ok=True)
+        if log_name is None:
+            log_name = f"seed_log_{datetime.now().strftime('%Y%m%d_%H%M')}.json"
+        output_json_path = os.path.join(output_seed_folder, log_name)
+        start_time = datetime.now()
+        print(f"Saving every seeds for thresholds {thresholds} with {ero_iter} erosion from graphs of flat zones")
+        print(f"With the footprints {footprints}")
+
+        log_dicts = {}
+        seed_dict = {}
+        levels = threshold_levels.levels
+        for i_iter in range(0, ero_iter+1):
+            if i_iter!=0:
+                levels = tree_core.erode_levels(levels, footprints[i_iter-1])
+            tree = tree_core.ComponentTree(levels)
+
+            for threshold in thresholds:
+                level = threshold_levels.level(threshold)
+                if i_iter == 0:
+                    log_dicts[threshold] = {"Method": "gen_seed_tree",
+                        "volume_array shape": list(levels.shape),
+                        "threshold": threshold,
+                        "upper threshold": None,
+                        "segments": segments,
+                        "footprints": footprints,
+                        "Whole Volume": tree.volume(level),
+                        "seeds": []
+                        }
+
+                seed_name = f"seed_ero_{i_iter}_thre{threshold}_None_segs_{segments}.tif"
+                seed_file = os.path.join(output_seed_folder, seed_name)
+                if save_seeds or return_for_napari:
+                    seed, ccomp_sizes = tree.seed(level, segments)
+                else:
+                    _, ccomp_sizes = tree.components(level, segments)
+                if save_seeds:
+                    tifffile.imwrite(seed_file, seed.astype('uint16'),
+                                     compression ='zlib')
+                if return_for_napari:
+                    seed_dict[os.path.basename(output_seed_folder) + "_" +seed_name] = seed
+
+                log_dicts[threshold]["seeds"].append({
+                    'ero_iter' : i_iter,
+                    'size_ccomp': ccomp_sizes.tolist(),
+                    'number_of_ccomps': len(ccomp_sizes.tolist()),
+                    'output_seed_dir': output_seed_folder,
+                    'output_path': os.path.abspath(seed_file) if save_seeds else None
+                })
+
+        end_time = datetime.now()
+        print(f"Seeds are saved to {output_seed_folder}")
+        print(f"Log file has been saved to {output_json_path}")
+        with lock:
+            for log_dict in log_dicts.values():
+                log_dict["start_time"] = start_time.strftime("%Y-%m-%d %H:%M:%S")
+                log_dict["end_time"] = end_time.strftime("%Y-%m-%d %H:%M:%S")
+                log_dict["duration"] = str(end_time - start_time)
+                config_core.write_json(output_json_path, scale_log_sizes(log_dict, size_scale))
+            if return_for_napari and result_dict is not None:
+                result_dict.update(seed_dict)
+
+
 def find_seed_by_ero_mp(volume, input_threshold_ero_iter_pairs , segments , 
                         output_seed_folder, output_json_path,  footprints = 'default',
                         boundary = None):
@@ -183,8 +306,38 @@ def make_seeds(**kwargs):
         Number of largest connected components to keep in each seed.
     num_threads : int, optional
         Number of threads for parallel processing. Defaults to half of CPU cores.
+        The threshold/footprint pairs run in parallel, and threads left over erode
+        planar footprints (e.g. 'ball_XY' or 'Z') slice by slice.
     footprints : list[str] or str, optional
         Names of erosion footprints (e.g. 'cube', 'sphere'). Defaults to pre-defined ones.
+    erosion_mode : str, optional
+        'iterative' erodes the threshold mask step by step. 'distance' computes one
+        distance transform of the threshold mask per footprint, and every erosion
+        step is a threshold of it, with the same seeds. Footprints that change
+        between steps or erode with several structures in one step (e.g. '2XZ_1Y')
+        are eroded step by step. Defaults to 'iterative'.
+    seed_engine : str, optional
+        'label' labels every threshold and erosion step on its own. 'component_tree'
+        erodes the threshold levels of all thresholds at once, and reads the seeds
+        of every threshold from one graph of flat zones per erosion step, with the same
+        seeds and logs. It needs nested threshold masks, so no `upper_thresholds`,
+        and footprints that erode with one structure per step. Threads are then
+        used per footprint list. Defaults to 'label'.
+    dry_run : bool, optional
+        If True, only the component counts and sizes are computed: the seed logs
+        and `full_log.png` (the plots of all seed logs) are written as in a normal
+        run, but no seed. Defaults to False.
+    dry_run_downsample : int, optional
+        In a dry run, keep every n-th voxel along each axis, for a quick look at a
+        large volume. Erosion steps are then in downsampled voxels, and the logged
+        sizes are multiplied by `dry_run_downsample**ndim` to estimate the sizes
+        in full-resolution voxels (recorded as `size_scale` in the logs).
+        Defaults to 1 (no downsampling).
+    morph_backend : str, optional
+        Backend of the binary erosion and labelling of the 'label' seed engine:
+        'skimage', 'scipy', 'opencv' or 'auto' (the fastest one on this machine,
+        see sprout_core.morph_core). The seeds are the same. Defaults to None,
+        which is 'skimage'.
     is_make_meshes : bool, optional
         If True, generate 3D meshes from seed masks. Defaults to False.
     downsample_scale : int, optional
@@ -238,6 +391,13 @@ def make_seeds(**kwargs):
     img = config_core.check_and_load_data(img, img_path, "img")
     boundary = config_core.check_and_load_data(boundary, boundary_path, "boundary", must_exist=False)
     config_core.valid_input_data(img, boundary=boundary)
+
+    dry_run = kwargs.get('dry_run', False)
+    dry_run_downsample = kwargs.get('dry_run_downsample', 1)
+    if dry_run and dry_run_downsample > 1:
+        img = sprout_core.downsample_volume(img, dry_run_downsample)
+        if boundary is not None:
+            boundary = sprout_core.downsample_volume(boundary, dry_run_downsample)
     
     # Seed generation related 
     erosion_steps = kwargs.get('erosion_steps', None)
@@ -255,6 +415,15 @@ def make_seeds(**kwargs):
     step_size  = kwargs.get('step_size', 1) 
 
     footprints = kwargs.get('footprints', None)
+    erosion_mode = kwargs.get('erosion_mode', 'iterative')
+    if erosion_mode not in ('iterative', 'distance'):
+        raise ValueError(f"Unknown erosion_mode: {erosion_mode}. Must be 'iterative' or 'distance'.")
+    seed_engine = kwargs.get('seed_engine', 'label')
+    morph_backend = kwargs.get('morph_backend', None)
+    if morph_backend not in (None, 'skimage', 'scipy', 'opencv', 'auto'):
+        raise ValueError(f"Unknown morph_backend: {morph_backend}. Must be 'skimage', 'scipy', 'opencv' or 'auto'.")
+    if seed_engine not in ('label', 'component_tree'):
+        raise ValueError(f"Unknown seed_engine: {seed_engine}. Must be 'label' or 'component_tree'.")
     
     return_for_napari = kwargs.get('return_for_napari', False)
 
@@ -266,7 +435,17 @@ def make_seeds(**kwargs):
 
 
     is_3d = (img.ndim == 3)
+    # Logged sizes of a downsampled dry run are scaled back to full-resolution voxels
+    size_scale = dry_run_downsample ** img.ndim if dry_run else 1
     
+    # Every threshold mask is taken from the level volume, the image is not needed anymore
+    threshold_levels = ThresholdLevels(img, thresholds, upper_thresholds)
+    img = None
+    # The boundary is taken out of every threshold mask once, so no boolean
+    # boundary volume is kept for the threads
+    if boundary is not None:
+        threshold_levels.exclude(config_core.check_and_cast_boundary(boundary))
+        boundary = None
 
 
     log_dict = {
@@ -303,10 +482,25 @@ def make_seeds(**kwargs):
     thre_fp_pairs = list(itertools.product(thresholds_pairs, zip(footprint_list,output_seed_sub_folders)))
     
     sublists = [thre_fp_pairs[i::num_threads] for i in range(num_threads)]   
+    # Threads left over by the threshold/footprint pairs erode the planar footprints slice by slice
+    slice_threads = max(1, num_threads // max(1, min(num_threads, len(thre_fp_pairs))))
+
+    if seed_engine == 'component_tree':
+        if any(upper_threshold is not None for upper_threshold in upper_thresholds):
+            raise ValueError("seed_engine 'component_tree' needs nested threshold masks, "
+                             "upper_thresholds are not supported.")
+        for footprints_of_set in footprint_list:
+            for footprint in footprints_of_set:
+                if sprout_core.get_erosion_structure(footprint, threshold_levels.ndim) is None:
+                    raise ValueError(f"Footprint {footprint} is not supported with seed_engine 'component_tree'.")
+        fp_folder_pairs = list(zip(footprint_list, output_seed_sub_folders))
+        sublists = [fp_folder_pairs[i::num_threads] for i in range(num_threads)]
 
     
 
     start_time = datetime.now()
+    # One seed log per seed folder, also when the threads finish in another minute
+    log_name = f"seed_log_{start_time.strftime('%Y%m%d_%H%M')}.json"
     print(f"""{start_time.strftime("%Y-%m-%d %H:%M:%S")}
     Making erosion seeds for 
         Img: {base_name}
@@ -314,7 +508,9 @@ def make_seeds(**kwargs):
         Is 3D image: {is_3d}
         Threshold for Img {thresholds}
         Upper Thresholds for Img {upper_thresholds}
-        Erode {erosion_steps} iterations
+        Erode {erosion_steps} iterations, erosion mode: {erosion_mode}, seed engine: {seed_engine}
+        Morphology backend: {morph_backend if morph_backend else "skimage"}
+        Dry run: {dry_run}, downsample: {dry_run_downsample if dry_run else 1}
         Keeping {segments} components
         Running in {num_threads} threads
         Output folder: {output_folder}
@@ -331,8 +527,17 @@ def make_seeds(**kwargs):
         #                                                             output_seed_sub_folder,output_json_path, footprints,
         #                                                             boundary))
 
-        thread = threading.Thread(target=gen_seed_mp, args=(img,sublist, erosion_steps, segments,
-                                                                    boundary, seeds_dict, return_for_napari))
+        if seed_engine == 'component_tree':
+            thread = threading.Thread(target=gen_seed_tree, args=(threshold_levels, thresholds, sublist,
+                                                                  erosion_steps, segments,
+                                                                  seeds_dict, return_for_napari,
+                                                                  not dry_run, log_name, size_scale))
+        else:
+            thread = threading.Thread(target=gen_seed_mp, args=(img,sublist, erosion_steps, segments,
+                                                                        boundary, seeds_dict, return_for_napari,
+                                                                        threshold_levels, erosion_mode,
+                                                                        not dry_run, morph_backend,
+                                                                        slice_threads, log_name, size_scale))
         threads.append(thread)
         thread.start()
         
@@ -351,12 +556,11 @@ def make_seeds(**kwargs):
 
     for output_seed_sub_folder in output_seed_sub_folders:
         log_dict["output_seed_sub_folders"].append(output_seed_sub_folder)
-        output_json_path = os.path.join(output_seed_sub_folder,
-                            f"seed_log_{datetime.now().strftime('%Y%m%d_%H%M')}.json")
+        output_json_path = os.path.join(output_seed_sub_folder, log_name)
         log_dict["output_log_files"].append(output_json_path)
 
         # # Make meshes  
-        if is_make_meshes: 
+        if is_make_meshes and not dry_run: 
             tif_files = glob.glob(os.path.join(output_seed_sub_folder, '*.tif'))
 
             for tif_file in tif_files:
@@ -369,6 +573,11 @@ def make_seeds(**kwargs):
     config_core.save_config_with_output({
         "output_dict": log_dict,
         "params": kwargs},output_seed_sub_folder)
+
+    # Written in every run, so a dry run has the same logs and plots as a full run
+    full_log_plot_path = os.path.join(output_folder, base_name, "full_log.png")
+    plot(log_dict, full_log_plot_path)
+    print(f"Seed sizes are plotted in {full_log_plot_path}")
         
     return seeds_dict , log_dict
  
@@ -418,6 +627,11 @@ def run_make_seeds(file_path):
             downsample_scale = optional_params['downsample_scale'],
             step_size  = optional_params['step_size'],
             footprints = optional_params['footprints'],
+            erosion_mode = optional_params['erosion_mode'],
+            seed_engine = optional_params['seed_engine'],
+            dry_run = optional_params['dry_run'],
+            dry_run_downsample = optional_params['dry_run_downsample'],
+            morph_backend = optional_params['morph_backend'],
             base_name = optional_params['base_name'],
             )    
 
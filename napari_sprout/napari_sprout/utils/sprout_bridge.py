@@ -13,6 +13,7 @@ if str(sprout_path) not in sys.path:
 try:
     import sprout_core.sprout_core as sprout_core
     import sprout_core.config_core as config_core
+    import sprout_core.grow_core as grow_core
     SPROUT_AVAILABLE = True
 except ImportError:
     SPROUT_AVAILABLE = False
@@ -71,14 +72,13 @@ class SPROUTBridge:
         
         # Apply boundary if provided
         if boundary is not None:
-            boundary = sprout_core.check_and_cast_boundary(boundary)
+            boundary = config_core.check_and_cast_boundary(boundary)
             volume_label[boundary] = False
         
         # Apply erosion
-        for i in range(ero_iter):
-            volume_label = sprout_core.erosion_binary_img_on_sub(
-                volume_label, footprint=footprint
-            )
+        volume_label = sprout_core.erosion_binary_img_multi_step(
+            volume_label, [footprint] * ero_iter
+        )
         
         # Get connected components
         seed, sizes = sprout_core.get_ccomps_with_size_order(volume_label, segments)
@@ -95,7 +95,8 @@ class SPROUTBridge:
         boundary: Optional[np.ndarray] = None,
         touch_rule: str = 'stop',
         to_grow_ids: Optional[List[int]] = None,
-        callback: Optional[Any] = None
+        callback: Optional[Any] = None,
+        stack_2d: bool = False
     ) -> np.ndarray:
         """
         Grow seeds using SPROUT's growth algorithm.
@@ -120,6 +121,9 @@ class SPROUTBridge:
             Specific IDs to grow
         callback : callable, optional
             Progress callback function
+        stack_2d : bool
+            Grow a 3D image as a stack of independent 2D images,
+            each slice on its own
             
         Returns
         -------
@@ -127,10 +131,12 @@ class SPROUTBridge:
             Grown segmentation
         """
         result = seeds.copy().astype(np.uint8)
+        if stack_2d and touch_rule == 'stop':
+            grow_lut = grow_core.make_grow_lut(result.max(), to_grow_ids)
         
         # Check boundary
         if boundary is not None:
-            boundary = sprout_core.check_and_cast_boundary(boundary)
+            boundary = config_core.check_and_cast_boundary(boundary)
         
         # Iterate through thresholds
         for i, (threshold, dilate_iter) in enumerate(zip(thresholds, dilate_iters)):
@@ -146,11 +152,26 @@ class SPROUTBridge:
             
             # Perform dilation iterations
             for j in range(dilate_iter):
-                result = sprout_core.dilation_one_iter(
-                    result, threshold_binary,
-                    touch_rule=touch_rule,
-                    to_grow_ids=to_grow_ids
-                )
+                if stack_2d and touch_rule == 'stop':
+                    grow_core.dilation_one_iter_stack_2d(
+                        result, threshold_binary,
+                        touch_rule=touch_rule,
+                        grow_lut=grow_lut
+                    )
+                elif stack_2d:
+                    # Overwrite is only grown label by label, one slice at a time
+                    for slice_id in range(result.shape[0]):
+                        result[slice_id] = sprout_core.dilation_one_iter(
+                            result[slice_id], threshold_binary[slice_id],
+                            touch_rule=touch_rule,
+                            to_grow_ids=to_grow_ids
+                        )
+                else:
+                    result = sprout_core.dilation_one_iter(
+                        result, threshold_binary,
+                        touch_rule=touch_rule,
+                        to_grow_ids=to_grow_ids
+                    )
                 
                 if callback:
                     progress = ((i * dilate_iter + j + 1) / 
@@ -158,7 +179,10 @@ class SPROUTBridge:
                     callback(progress)
         
         # Reorder segmentation
-        result, _ = sprout_core.reorder_segmentation(result, sort_ids=True)
+        if stack_2d:
+            result = grow_core.sort_stack_2d(result)
+        else:
+            result, _ = sprout_core.reorder_segmentation(result, sort_ids=True)
         
         return result
     
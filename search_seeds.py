@@ -0,0 +1,377 @@
+import threading
+import os, sys
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import yaml
+
+lock = threading.Lock()
+
+import multiprocessing
+max_threads = multiprocessing.cpu_count()
+
+import sprout_core.sprout_core as sprout_core
+import sprout_core.config_core as config_core
+import sprout_core.tree_core as tree_core
+from sprout_core.threshold_core import ThresholdLevels
+
+
+pre_set_search_footprints = ["ball", "ball_XY", "ball_YZ", "ball_XZ"]
+
+pre_set_search_footprints_2d = ["disk", "X", "Y"]
+
+
+def score_components(sizes, target_segments, min_size=1, max_size=None):
+    """
+    Score the components of one candidate against the target.
+
+    Components count toward the target if their size is within
+    [min_size, max_size]. Candidates are ranked by the distance of that count to
+    `target_segments`, then by the size of the smallest of the (at most
+    `target_segments`) largest counted components, as a bigger smallest seed
+    grows more reliably.
+
+    Args:
+        sizes (np.ndarray): Component sizes, largest first.
+        target_segments (int): Target number of components.
+        min_size (int): Smallest size of a counted component.
+        max_size (int, optional): Largest size of a counted component. If None, no limit.
+
+    Returns:
+        dict: n_components, n_counted, n_oversize (components above max_size),
+        smallest_kept (smallest size of the kept counted components, 0 if none),
+        and score (distance of n_counted to the target, lower is better).
+    """
+    sizes = np.asarray(sizes)
+    oversize = sizes > max_size if max_size is not None else np.zeros(sizes.shape, dtype=bool)
+    counted = sizes[(sizes >= min_size) & ~oversize]
+    kept = counted[:target_segments]
+    return {
+        "n_components": int(sizes.size),
+        "n_counted": int(counted.size),
+        "n_oversize": int(oversize.sum()),
+        "smallest_kept": int(kept[-1]) if kept.size else 0,
+        "score": abs(int(counted.size) - target_segments),
+    }
+
+
+def score_step(tree, threshold_levels, thresholds, footprint, i_iter,
+               target_segments, min_size, max_size, rows):
+    """
+    Score every threshold of one erosion step from its graph of flat zones.
+
+    Args:
+        tree (tree_core.ComponentTree): Component tree of the eroded threshold levels.
+        threshold_levels (ThresholdLevels): Levels of all candidate thresholds.
+        thresholds (list): Thresholds to score.
+        footprint (str): Footprint of the erosion steps.
+        i_iter (int): Number of erosion steps.
+        target_segments (int): Target number of components.
+        min_size (int): Smallest size of a counted component.
+        max_size (int, optional): Largest size of a counted component.
+        rows (list): Collects one row per threshold.
+
+    Returns:
+        list: The thresholds that are still large enough for `target_segments`
+        components of `min_size` voxels. Erosion only removes voxels, so the
+        others can not reach the target at a later step.
+    """
+    still_active = []
+    for threshold in thresholds:
+        level = threshold_levels.level(threshold)
+        volume = tree.volume(level)
+        _, sizes = tree.components(level)
+        row = {"footprint": footprint, "threshold": threshold, "erosion_steps": i_iter,
+               "volume": volume}
+        row.update(score_components(sizes, target_segments, min_size, max_size))
+        rows.append(row)
+        if volume >= target_segments * min_size:
+            still_active.append(threshold)
+    return still_active
+
+
+def search_footprints(levels_0, threshold_levels, thresholds, footprints, max_erosion_steps,
+                      target_segments, min_size, max_size, results):
+    """
+    Evaluate every threshold and erosion step of each footprint.
+
+    The threshold levels are eroded step by step, each step from the previous
+    one, and the components of all still active thresholds are read from one
+    graph of flat zones per step. A threshold is pruned after the first step that
+    leaves it too few voxels to reach the target, and a footprint stops once
+    every threshold is pruned.
+
+    Args:
+        levels_0 (np.ndarray): Threshold levels before erosion.
+        threshold_levels (ThresholdLevels): Levels of all candidate thresholds.
+        thresholds (list): Thresholds still active before erosion.
+        footprints (list): Footprints, each used for every erosion step.
+        max_erosion_steps (int): Largest number of erosion steps.
+        target_segments (int): Target number of components.
+        min_size (int): Smallest size of a counted component.
+        max_size (int, optional): Largest size of a counted component.
+        results (list): Collects one row per evaluated candidate.
+    """
+    rows = []
+    for footprint in footprints:
+        active = list(thresholds)
+        levels = levels_0
+        for i_iter in range(1, max_erosion_steps+1):
+            if not active:
+                print(f"Footprint {footprint}: every threshold pruned after {i_iter-1} erosion steps")
+                break
+            # Levels below every active threshold are background from now on
+            lowest = min(threshold_levels.level(threshold) for threshold in active)
+            levels = tree_core.erode_levels(levels, footprint)
+            levels[levels < lowest] = 0
+            tree = tree_core.ComponentTree(levels)
+            active = score_step(tree, threshold_levels, active, footprint, i_iter,
+                                target_segments, min_size, max_size, rows)
+
+    with lock:
+        results.extend(rows)
+
+
+def search_seeds(**kwargs):
+    """
+    Search thresholds, erosion steps and footprints for seeds with a target number of components.
+
+    Every combination of the candidate thresholds, 0 to `max_erosion_steps`
+    erosion steps and the candidate footprints is scored by how close its number
+    of components (within the size limits) is to `target_segments`. The
+    threshold masks of all candidates come from one threshold level volume, the
+    eroded masks of a footprint are built once per step and shared by all
+    thresholds, and the components of every threshold are read from one
+    graph of flat zones per step (see tree_core.ComponentTree). Thresholds that can no
+    longer hold `target_segments` components are pruned from the later steps.
+
+    The best candidates are written as ready-to-run make_seeds configs.
+
+    Parameters
+    ----------
+    img : np.ndarray, optional
+        Input image array. If not provided, `img_path` must be specified.
+    img_path : str, optional
+        Path to the input image (used if `img` is not provided).
+    boundary : np.ndarray, optional
+        Optional binary mask taken out of every threshold mask.
+    boundary_path : str, optional
+        Path to the boundary mask.
+    workspace : str, optional
+        Root path to prepend to image and output paths.
+    output_folder : str
+        Output directory for the search log and the configs. The configs also
+        use it as their own output folder.
+    base_name : str, optional
+        Prefix for the output folder. Defaults to input image name.
+    thresholds : int or list[int]
+        Candidate lower thresholds.
+    max_erosion_steps : int
+        Largest number of erosion steps. Every number of steps from 0 is a candidate.
+    footprints : str or list[str], optional
+        Candidate footprints, each used for every erosion step. Footprints that
+        erode with several structures in one step (e.g. '2XZ_1Y') are not
+        supported. Defaults to the preset footprints of make_seeds.
+    target_segments : int
+        Target number of components.
+    min_size : int, optional
+        Components smaller than this do not count toward the target. Defaults to 1.
+    max_size : int, optional
+        Components larger than this do not count toward the target. Defaults to None.
+    n_best : int, optional
+        Number of configs to write. Defaults to 3.
+    num_threads : int, optional
+        Number of threads, used per footprint. Defaults to half of CPU cores.
+
+    Returns
+    -------
+    best_configs : list[dict]
+        The make_seeds configs of the best candidates, best first.
+    log_dict : dict
+        Contains:
+            - "search_log": path of the csv with every evaluated candidate
+            - "output_config_files": list of the written config paths
+
+    Notes
+    -----
+    - The config of a candidate keeps `segments` = the number of components above
+      `max_size` plus the counted ones (at most `target_segments`), so that the
+      counted components are in the seeds make_seeds keeps.
+    """
+    img = kwargs.get('img', None)
+    workspace = kwargs.get('workspace', None)
+    img_path = kwargs.get('img_path', None)
+    boundary = kwargs.get('boundary', None)
+    boundary_path = kwargs.get('boundary_path', None)
+    output_folder = kwargs.get('output_folder', None)
+    base_name = kwargs.get('base_name', None)
+
+    config_img_path = img_path
+    config_boundary_path = boundary_path
+    if workspace is not None:
+        img_path = os.path.join(workspace, img_path)
+        if boundary_path is not None:
+            boundary_path = os.path.join(workspace, boundary_path)
+        output_folder = os.path.join(workspace, output_folder)
+    output_folder = os.path.abspath(output_folder)
+
+    base_name = config_core.check_and_assign_base_name(base_name, img_path, "seed")
+
+    img = config_core.check_and_load_data(img, img_path, "img")
+    boundary = config_core.check_and_load_data(boundary, boundary_path, "boundary", must_exist=False)
+    config_core.valid_input_data(img, boundary=boundary)
+
+    thresholds = kwargs.get('thresholds', None)
+    thresholds, _ = config_core.check_and_assign_thresholds(thresholds, None)
+    max_erosion_steps = kwargs.get('max_erosion_steps', None)
+    target_segments = kwargs.get('target_segments', None)
+    min_size = kwargs.get('min_size', 1)
+    max_size = kwargs.get('max_size', None)
+    n_best = kwargs.get('n_best', 3)
+    num_threads = kwargs.get('num_threads', None)
+
+    if max_erosion_steps is None or max_erosion_steps < 0:
+        raise ValueError(f"max_erosion_steps must be at least 0, got {max_erosion_steps}.")
+    if target_segments is None or target_segments < 1:
+        raise ValueError(f"target_segments must be at least 1, got {target_segments}.")
+    if min_size < 1:
+        raise ValueError(f"min_size must be at least 1, got {min_size}.")
+    if max_size is not None and max_size < min_size:
+        raise ValueError(f"max_size ({max_size}) must be at least min_size ({min_size}).")
+
+    footprints = kwargs.get('footprints', None)
+    if footprints is None:
+        footprints = pre_set_search_footprints if img.ndim == 3 else pre_set_search_footprints_2d
+    elif isinstance(footprints, str):
+        footprints = [footprints]
+    for footprint in footprints:
+        if sprout_core.get_erosion_structure(footprint, img.ndim) is None:
+            raise ValueError(f"Footprint {footprint} is not supported for the seed search.")
+
+    if num_threads is None:
+        num_threads = max(1, max_threads // 2)
+    if num_threads >= max_threads:
+        num_threads = max(1, max_threads-1)
+
+    threshold_levels = ThresholdLevels(img, thresholds)
+    img = None
+    if boundary is not None:
+        threshold_levels.exclude(config_core.check_and_cast_boundary(boundary))
+        boundary = None
+
+    start_time = datetime.now()
+    print(f"""{start_time.strftime("%Y-%m-%d %H:%M:%S")}
+    Searching seed parameters for
+        Img: {base_name}
+        boundary: {boundary_path if boundary_path else "None"}
+        Thresholds {thresholds}
+        Footprints {footprints}
+        Up to {max_erosion_steps} erosion steps
+        Target {target_segments} components, sizes [{min_size}, {max_size}]
+        Running in {num_threads} threads
+        Output folder: {output_folder}
+            """)
+
+    # The components before erosion are the same for every footprint, they are
+    # scored once, under the first footprint
+    levels_0 = threshold_levels.levels
+    results = []
+    active = score_step(tree_core.ComponentTree(levels_0), threshold_levels, thresholds, footprints[0], 0,
+                        target_segments, min_size, max_size, results)
+
+    sublists = [footprints[i::num_threads] for i in range(num_threads)]
+    threads = []
+    for sublist in sublists:
+        thread = threading.Thread(target=search_footprints, args=(levels_0, threshold_levels,
+                                                                  active, sublist, max_erosion_steps,
+                                                                  target_segments, min_size, max_size,
+                                                                  results))
+        threads.append(thread)
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    search_folder = os.path.join(output_folder, base_name, "seed_search")
+    os.makedirs(search_folder, exist_ok=True)
+
+    # Best first: closest count, biggest smallest seed, fewest erosion steps
+    df_log = pd.DataFrame(results, columns=["footprint", "threshold", "erosion_steps", "volume",
+                                            "n_components", "n_counted", "n_oversize",
+                                            "smallest_kept", "score"])
+    df_log = df_log.sort_values(["score", "smallest_kept", "erosion_steps", "threshold", "footprint"],
+                                ascending=[True, False, True, True, True], kind="stable")
+    df_log.insert(0, "rank", np.arange(1, len(df_log) + 1))
+    log_path = os.path.join(search_folder, f"seed_search_log_{base_name}.csv")
+    df_log.to_csv(log_path, index=False)
+
+    log_dict = {
+        "search_log": log_path,
+        "output_config_files": []
+    }
+    best_configs = []
+    for row in df_log.head(n_best).itertuples(index=False):
+        config = {
+            "img_path": config_img_path,
+            "num_threads": 1,
+            "thresholds": [np.asarray(row.threshold).item()],
+            "erosion_steps": int(row.erosion_steps),
+            "segments": max(1, int(row.n_oversize) + min(int(row.n_counted), target_segments)),
+            "output_folder": kwargs.get('output_folder', None),
+            "footprints": row.footprint,
+        }
+        if workspace is not None:
+            config["workspace"] = workspace
+        if config_boundary_path is not None:
+            config["boundary_path"] = config_boundary_path
+        config_path = os.path.join(search_folder,
+                                   f"make_seeds_rank_{row.rank}_{row.footprint}_thre{row.threshold}_ero_{row.erosion_steps}.yaml")
+        with open(config_path, "w") as f:
+            f.write(f"# Seed search rank {row.rank}: {row.n_counted} components within the size limits "
+                    f"(target {target_segments}), smallest kept {row.smallest_kept}\n")
+            yaml.safe_dump(config, f, sort_keys=False)
+        best_configs.append(config)
+        log_dict["output_config_files"].append(config_path)
+
+    end_time = datetime.now()
+    print(f"Evaluated {len(df_log)} candidates in {end_time - start_time}")
+    print(f"Search log has been saved to {log_path}")
+    for config_path in log_dict["output_config_files"]:
+        print(f"Ready-to-run config: {config_path}")
+
+    config_core.save_config_with_output({
+        "output_dict": log_dict,
+        "params": kwargs}, search_folder)
+
+    return best_configs, log_dict
+
+
+def run_search_seeds(file_path):
+    _, extension = os.path.splitext(file_path)
+    print(f"processing config the file {file_path}")
+
+    if extension == '.yaml':
+        with open(file_path, 'r') as file:
+            config = yaml.safe_load(file)
+            optional_params = config_core.validate_input_yaml(config, config_core.input_val_search_seeds)
+
+    search_seeds(
+        workspace = optional_params['workspace'],
+        img_path = config['img_path'],
+        boundary_path = optional_params['boundary_path'],
+        output_folder = config['output_folder'],
+        thresholds = config['thresholds'],
+        max_erosion_steps = config['max_erosion_steps'],
+        target_segments = config['target_segments'],
+        footprints = optional_params['footprints'],
+        min_size = optional_params['min_size'],
+        max_size = optional_params['max_size'],
+        n_best = optional_params['n_best'],
+        num_threads = config['num_threads'],
+        base_name = optional_params['base_name'],
+    )
+
+
+if __name__ == "__main__":
+    file_path = sys.argv[1] if len(sys.argv) > 1 else './template/search_seeds.yaml'
+    run_search_seeds(file_path)
@@ -3,6 +3,7 @@ import yaml
 from make_seeds import run_make_seeds
 from make_grow import run_make_grow
 from make_adaptive_seed import run_make_adaptive_seed
+from search_seeds import run_search_seeds
 
 
 from batch_grow import run_batch_grow
@@ -26,6 +27,9 @@ def main():
         For seeds generation:
             python sprout.py --seeds --config path/to/config.yaml
         
+        For seed parameter search
+            python sprout.py --search_seeds --config path/to/config.yaml
+        
         For adaptive seed generation
             python sprout.py --adaptive_seed --config path/to/config.yaml
         
@@ -46,6 +50,7 @@ def main():
     # Mutually exclusive group
     group = parser.add_mutually_exclusive_group(required=True)
     group.add_argument('--seeds', action='store_true', help="Run the seed generation function")
+    group.add_argument('--search_seeds', action='store_true', help="Search seed parameters toward a target number of components")
     group.add_argument('--adaptive_seed', action='store_true', help="Run the adaptive seed generation function")
     group.add_argument('--grow', action='store_true', help="Run the grow function")
     group.add_argument('--sam', action='store_true', help="Run the SAM prediction function")
@@ -78,6 +83,12 @@ def main():
             run_batch_grow(args.config)
         else:
             run_make_grow(args.config)
+    elif args.search_seeds:
+        if not args.config:
+            print("[ERROR] --config is required when using --search_seeds")
+            parser.print_help()
+            exit(1)
+        run_search_seeds(args.config)
     elif args.adaptive_seed:
         
         if not args.config:
@@ -69,7 +69,7 @@ def valid_input_data(img, seg=None, boundary=None):
         if img.shape != boundary.shape:
             raise ValueError(f"Image and boundary must have the same shape, got {img.shape} and {boundary.shape}.")
 
-def check_and_load_data(array, path, name, must_exist=True):
+def check_and_load_data(array, path, name, must_exist=True, lazy=False):
     """
     Load image data from file or return provided array, ensuring only one input source is used.
 
@@ -83,6 +83,8 @@ def check_and_load_data(array, path, name, must_exist=True):
         Name identifier for error messages.
     must_exist : bool, default=True
         If True, raise error if both `array` and `path` are None.
+    lazy : bool, default=False
+        If True, open the file without loading it into memory, see `ooc_core.open_volume`.
 
     Returns
     -------
@@ -101,6 +103,9 @@ def check_and_load_data(array, path, name, must_exist=True):
     if array is not None and path is None:
         return array
     if path is not None:
+        if lazy:
+            from sprout_core.ooc_core import open_volume
+            return open_volume(path)
         return imread(path)
     return array
 
@@ -466,8 +471,8 @@ def save_config_with_output(output_dict, output_dir):
     timestamp = datetime.now().strftime("%Y%m%d_%H%M")
     config_path = os.path.join(output_dir, f"config_{timestamp}.yaml")
 
-    # Set 'img', 'seg', 'boundary' keys to None if they exist and value is not None
-    for k in ("img", "seg", "boundary"):
+    # Set the keys of arrays and shared objects to None if they exist and value is not None
+    for k in ("img", "seg", "boundary", "threshold_levels", "prefix_cache"):
         if k in output_dict['params'] and output_dict['params'][k] is not None:
             output_dict['params'][k] = None
 
@@ -690,6 +695,40 @@ input_val_make_seeds = {
         "required": False,
         "default": None,
         "description": "Footprints for morphological transformation"
+    },
+    "erosion_mode": {
+        "type": str,
+        "required": False,
+        "choices": ["iterative", "distance"],
+        "default": "iterative",
+        "description": "Erode step by step, or threshold one distance transform per footprint"
+    },
+    "seed_engine": {
+        "type": str,
+        "required": False,
+        "choices": ["label", "component_tree"],
+        "default": "label",
+        "description": "Label every threshold, or read all thresholds from one graph of flat zones per erosion step"
+    },
+    "dry_run": {
+        "type": bool,
+        "required": False,
+        "default": False,
+        "description": "Only compute and log the component counts and sizes, without saving seeds"
+    },
+    "dry_run_downsample": {
+        "type": int,
+        "required": False,
+        "min": 1,
+        "default": 1,
+        "description": "Keep every n-th voxel along each axis in a dry run, the logged sizes are scaled by dry_run_downsample^ndim"
+    },
+    "morph_backend": {
+        "type": str,
+        "required": False,
+        "choices": ["skimage", "scipy", "opencv", "auto"],
+        "default": None,
+        "description": "Backend of the binary erosion and labelling, 'auto' picks the fastest on this machine"
     }
 }
 
@@ -698,6 +737,99 @@ input_val_make_seeds = {
 
 
 
+input_val_search_seeds = {
+
+    "img_path": {
+        "type": str,
+        "required": True,
+        "description": "File name",
+        "check_exist": True,
+        "check_extension": (".tif", ".tiff")
+    },
+    "num_threads": {
+        "type": int,
+        "min": 1,
+        "max": psutil.cpu_count(),
+        "required": True,
+        "description": "num of threads"
+    },
+    "thresholds": {
+        "type": (int,list),
+        "subtype": (int, float),
+        "required": True,
+        "min_length": 1,
+        "min": 0,
+        "description": "List of candidate thresholds"
+    },
+    "max_erosion_steps": {
+        "type": int,
+        "min": 0,
+        "max": 1000,
+        "required": True,
+        "description": "Largest number of erosion steps, every number of steps from 0 is a candidate"
+    },
+    "target_segments": {
+        "type": int,
+        "min": 1,
+        "required": True,
+        "description": "Target number of components"
+    },
+    "output_folder": {
+        "type": str,
+        "required": True,
+        "description": "Output directory path as a string."
+    },
+    #### Optional parameters
+    "workspace": {
+        "type": str,
+        "required": False,
+        "default":"",
+        "description": "Workspace folder, default is an empty string"
+    },
+    "boundary_path": {
+        "type": str,
+        "required": False,
+        "default":None,
+        "check_exist": True,
+        "description": "boundary image",
+        "check_extension": (".tif", ".tiff")
+    },
+    "base_name": {
+        "type": str,
+        "required": False,
+        'default': None,
+        "description": "base_name for naming output files and folders."
+    },
+    "footprints": {
+        "type": (str,list),
+        "required": False,
+        "default": None,
+        "description": "Candidate footprints, each used for every erosion step"
+    },
+    "min_size": {
+        "type": int,
+        "required": False,
+        "min": 1,
+        "default": 1,
+        "description": "Components smaller than this do not count toward the target"
+    },
+    "max_size": {
+        "type": int,
+        "required": False,
+        "min": 1,
+        "default": None,
+        "description": "Components larger than this do not count toward the target"
+    },
+    "n_best": {
+        "type": int,
+        "required": False,
+        "min": 1,
+        "default": 3,
+        "description": "Number of best candidates written as make_seeds configs"
+    }
+}
+
+
 input_val_make_grow = {
     "img_path": {
         "type": str,
@@ -758,6 +890,38 @@ input_val_make_grow = {
         "default": None,
         "description": "Save the grow result every n iters"
     }, 
+    "checkpoint_every_n_iters": {
+        "type": int,
+        "min": 1,
+        "required": False,
+        "default": None,
+        "description": "Save a checkpoint every n iters and after each threshold step"
+    },
+    "resume": {
+        "type": bool,
+        "required": False,
+        "default": False,
+        "description": "Resume from the checkpoint of a previous run if there is one"
+    },
+    "share_prefix": {
+        "type": bool,
+        "required": False,
+        "default": False,
+        "description": "For batch_grow sweeps: grow the first threshold steps shared by several runs on the same image and seed once"
+    },
+    "share_image": {
+        "type": bool,
+        "required": False,
+        "default": False,
+        "description": "For batch_grow: grow the rows that only differ in seg_path together, loading and thresholding the image once"
+    },
+    "snapshot_format": {
+        "type": str,
+        "choices": ["tif", "delta"],
+        "required": False,
+        "default": "tif",
+        "description": "Format of the intermediate results: 'tif' saves whole volumes, 'delta' only saves the changed voxels"
+    },
     
     "workspace": {
         "type": str,
@@ -788,6 +952,40 @@ input_val_make_grow = {
         "required": False,
         'default': False
     },    
+    "grow_engine": {
+        "type": str,
+        "choices": ["single_pass", "per_label", "frontier", "watershed", "tiled", "multires"],
+        "required": False,
+        'default': "single_pass",
+        "description": "How each dilation iteration is computed: 'single_pass' grows all labels at once, 'per_label' dilates labels one by one, 'frontier' only expands the last grown voxels, 'watershed' floods the seeds one distance layer per iteration, like 'frontier' without the arrival map, 'tiled' grows tiles of the volume in num_threads processes, 'multires' grows a downsampled copy to the end and refines the interfaces at full resolution (grow_to_end and min_growth_size 0 only)"
+    },
+    "stack_2d": {
+        "type": bool,
+        "required": False,
+        'default': False,
+        "description": "Grow a 3D input as a stack of independent 2D images, every slice on its own"
+    },
+    "multires_factor": {
+        "type": int,
+        "min": 2,
+        "required": False,
+        'default': 4,
+        "description": "Downsampling factor per axis for grow_engine 'multires'"
+    },
+    "morph_backend": {
+        "type": str,
+        "required": False,
+        "choices": ["numpy", "opencv"],
+        "default": None,
+        "description": "Backend of the grow_engine 'single_pass' neighbourhood pass, 'opencv' for 2D images and stack_2d"
+    },
+    "memory_budget_mb": {
+        "type": (int,float),
+        "min": 1,
+        "required": False,
+        'default': None,
+        "description": "Grow out of core: keep the volumes on disk and grow them slab by slab within this memory budget (MB)"
+    },
     "final_grow_output_folder": {
         "type": str,
         "required": False,
@@ -834,6 +1032,20 @@ input_val_make_grow = {
         'default': 50,
         "description": "The minimum difference to consider there is a growth in a dilation iteration"
     },    
+    "label_min_growth_size": {
+        "type": int,
+        "min": 1,
+        "required": False,
+        'default': None,
+        "description": "Freeze a label when it grows by fewer voxels than this for label_no_growth_max_iter iterations (grow_engine 'per_label' only)"
+    },    
+    "label_no_growth_max_iter": {
+        "type": int,
+        "min": 1,
+        "required": False,
+        'default': 3,
+        "description": "Consecutive iterations below label_min_growth_size before a label is frozen"
+    },    
     
     "is_make_meshes": {
         "type": bool,
@@ -1018,6 +1230,26 @@ input_val_make_adaptive_seed = {
         "min_length": 2,
         "description": "create a split if the the convex hull's area/volume is within the limit"
     },  
+    "dry_run": {
+        "type": bool,
+        "required": False,
+        "default": False,
+        "description": "Only compute the split statistics, without saving seeds"
+    },
+    "dry_run_downsample": {
+        "type": int,
+        "required": False,
+        "min": 1,
+        "default": 1,
+        "description": "Keep every n-th voxel along each axis in a dry run"
+    },
+    "morph_backend": {
+        "type": str,
+        "required": False,
+        "choices": ["skimage", "scipy", "opencv", "auto"],
+        "default": None,
+        "description": "Backend of the binary erosion and labelling, 'auto' picks the fastest on this machine"
+    },
    
 }
 
@@ -0,0 +1,1009 @@
+import os
+import numpy as np
+import tifffile
+import threading
+import multiprocessing
+from multiprocessing import shared_memory
+from scipy import ndimage
+
+import sprout_core.morph_core as morph_core
+
+
+support_grow_engines = ["single_pass", "per_label", "frontier", "watershed", "tiled", "multires"]
+
+
+def make_grow_lut(max_label, to_grow_ids=None):
+    """
+    Build a lookup table telling whether a label id is allowed to grow.
+
+    Args:
+        max_label (int): The largest label id in the mask.
+        to_grow_ids (list, optional): Label ids to grow. If None, all non-zero ids grow.
+
+    Returns:
+        np.ndarray or None: Boolean table indexed by label id, or None if every label grows.
+    """
+    if to_grow_ids is None:
+        return None
+    grow_lut = np.zeros(int(max_label) + 1, dtype=bool)
+    to_grow_ids = np.asarray(to_grow_ids, dtype=np.int64)
+    to_grow_ids = to_grow_ids[(to_grow_ids > 0) & (to_grow_ids <= max_label)]
+    grow_lut[to_grow_ids] = True
+    return grow_lut
+
+
+def neighbour_max(labels, axes=None, backend=None):
+    """
+    Maximum label over each voxel and its face neighbours.
+
+    This is the label-image equivalent of a binary dilation with ``ball(1)`` in 3D
+    or ``disk(1)`` in 2D, done for every label at once.
+
+    Args:
+        labels (np.ndarray): 2D or 3D label array.
+        axes (tuple, optional): Axes of the neighbours, e.g. ``(1, 2)`` for a
+            ``disk(1)`` in every slice of a stack. Defaults to all axes.
+        backend (str, optional): 'opencv' runs 2D images and the slices of a
+            stack (``axes=(1, 2)``) with cv2.dilate, see morph_core.neighbour_max_2d.
+            Defaults to numpy, which is also used in 3D.
+
+    Returns:
+        np.ndarray: Array of the same shape and dtype as ``labels``.
+    """
+    if backend == 'opencv':
+        if labels.ndim == 2 and (axes is None or tuple(axes) == (0, 1)):
+            return morph_core.neighbour_max_2d(labels)
+        if labels.ndim == 3 and axes is not None and tuple(axes) == (1, 2):
+            out = np.empty_like(labels)
+            for slice_id in range(labels.shape[0]):
+                out[slice_id] = morph_core.neighbour_max_2d(labels[slice_id])
+            return out
+
+    out = labels.copy()
+    ndim = labels.ndim
+    if axes is None:
+        axes = range(ndim)
+    for axis in axes:
+        lower = [slice(None)] * ndim
+        upper = [slice(None)] * ndim
+        lower[axis] = slice(0, -1)
+        upper[axis] = slice(1, None)
+        lower = tuple(lower)
+        upper = tuple(upper)
+        # Propagate towards higher and lower indices along this axis
+        np.maximum(out[upper], labels[lower], out=out[upper])
+        np.maximum(out[lower], labels[upper], out=out[lower])
+    return out
+
+
+def grow_labels_one_pass(labels, threshold_binary,
+                         touch_rule='stop',
+                         grow_lut=None,
+                         boundary=None,
+                         axes=None,
+                         backend=None):
+    """
+    Grow every label by one voxel in a single neighbourhood pass.
+
+    When several labels reach the same voxel in the same iteration, the largest
+    label id wins, which is what the per-label loop gives when the ids are
+    processed in ascending order.
+
+    Only touch_rule 'stop' is supported. With 'overwrite' the per-label loop
+    dilates each label from what the smaller ids left of it, and ignores the
+    threshold mask, which one neighbourhood pass can not reproduce.
+
+    Args:
+        labels (np.ndarray): Label mask to grow. Not modified.
+        threshold_binary (np.ndarray): Voxels that background can be grown into.
+        touch_rule (str): Must be 'stop', labels never take voxels from other labels.
+        grow_lut (np.ndarray, optional): Lookup table from make_grow_lut.
+        boundary (np.ndarray, optional): Voxels that are always cleared.
+        axes (tuple, optional): Axes to grow along, see neighbour_max.
+        backend (str, optional): Backend of neighbour_max, None or 'opencv'.
+
+    Returns:
+        tuple: (grown labels, number of voxels whose label changed)
+    """
+    if touch_rule != 'stop':
+        raise ValueError(f"One-pass growth only supports touch_rule 'stop', got {touch_rule}.")
+
+    if grow_lut is None:
+        grow_src = labels
+    else:
+        grow_src = np.where(grow_lut[labels], labels, 0).astype(labels.dtype, copy=False)
+
+    candidate = neighbour_max(grow_src, axes=axes, backend=backend)
+
+    claim = (labels == 0) & threshold_binary
+    claim &= (candidate != 0) & (candidate != labels)
+    if boundary is not None:
+        claim &= ~boundary
+
+    # A masked copy, without building the index arrays of the claimed voxels
+    result = labels.copy()
+    np.copyto(result, candidate, where=claim)
+    if boundary is not None:
+        result[boundary] = 0
+
+    return result, int(np.count_nonzero(claim))
+
+
+def _grow_slab(input_mask, result, threshold_binary, touch_rule, grow_lut, boundary,
+               start, stop, counts, slab_id, backend=None, batch_size=2**24):
+    # Grow the slab a few slices at a time, so packed masks are only unpacked for
+    # `batch_size` voxels. Each part is read with a one-voxel halo along axis 0,
+    # and only its inner part is written back.
+    batch_slices = max(1, batch_size // max(1, int(np.prod(input_mask.shape[1:]))))
+    n_changed = 0
+    for part_start in range(start, stop, batch_slices):
+        part_stop = min(part_start + batch_slices, stop)
+        halo_start = max(part_start - 1, 0)
+        halo_stop = min(part_stop + 1, input_mask.shape[0])
+        sub_boundary = None if boundary is None else boundary[halo_start:halo_stop]
+
+        grown, _ = grow_labels_one_pass(input_mask[halo_start:halo_stop],
+                                        threshold_binary[halo_start:halo_stop],
+                                        touch_rule=touch_rule,
+                                        grow_lut=grow_lut,
+                                        boundary=sub_boundary,
+                                        backend=backend)
+
+        inner = grown[part_start - halo_start: part_stop - halo_start]
+        n_changed += int(np.count_nonzero(inner != input_mask[part_start:part_stop]))
+        result[part_start:part_stop] = inner
+    counts[slab_id] = n_changed
+
+
+def dilation_one_iter_single_pass(input_mask, threshold_binary,
+                                  num_threads=1,
+                                  touch_rule='stop',
+                                  to_grow_ids=None,
+                                  boundary=None,
+                                  grow_lut=None,
+                                  return_count=False,
+                                  backend=None,
+                                  batch_size=2**24):
+    """
+    Perform one dilation iteration for all labels at once.
+
+    The volume is split into slabs along the first axis, and each slab is grown
+    in its own thread. Slabs are written to disjoint parts of the output, so no
+    lock is needed. A thread grows its slab `batch_size` voxels at a time, so
+    the temporary arrays, and the unpacked part of a `mask_core.PackedMask`
+    threshold or boundary, do not grow with the volume.
+
+    Args:
+        input_mask (np.ndarray): The mask being grown.
+        threshold_binary (np.ndarray): Binary mask threshold for the guide.
+        num_threads (int): Number of threads to use.
+        touch_rule (str): Must be 'stop', see grow_labels_one_pass.
+        to_grow_ids (list, optional): Specific IDs to grow. Defaults to None.
+        boundary (np.ndarray, optional): Boundary mask to constrain growth. Defaults to None.
+        grow_lut (np.ndarray, optional): Precomputed lookup table, used instead of to_grow_ids.
+        return_count (bool): If True, also return the number of changed voxels.
+        backend (str, optional): 'opencv' grows 2D images with cv2.dilate, see neighbour_max.
+        batch_size (int): Number of voxels grown at once by a thread, rounded to whole slices.
+
+    Returns:
+        np.ndarray: The updated mask after one dilation iteration.
+        Also the number of changed voxels if `return_count` is True.
+    """
+    if touch_rule != 'stop':
+        raise ValueError(f"One-pass growth only supports touch_rule 'stop', got {touch_rule}.")
+
+    if grow_lut is None and to_grow_ids is not None:
+        grow_lut = make_grow_lut(input_mask.max(), to_grow_ids)
+
+    n_slices = input_mask.shape[0]
+    num_threads = max(1, min(int(num_threads), n_slices))
+    bounds = np.linspace(0, n_slices, num_threads + 1).astype(int)
+
+    result = np.empty_like(input_mask)
+    counts = [0] * num_threads
+    threads = []
+    for slab_id in range(num_threads):
+        thread = threading.Thread(target=_grow_slab, args=(input_mask, result,
+                                                           threshold_binary,
+                                                           touch_rule,
+                                                           grow_lut,
+                                                           boundary,
+                                                           bounds[slab_id],
+                                                           bounds[slab_id + 1],
+                                                           counts,
+                                                           slab_id,
+                                                           backend,
+                                                           batch_size))
+        threads.append(thread)
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    if return_count:
+        return result, sum(counts)
+    return result
+
+
+def _grow_stack_slices(labels, threshold_binary, slice_ids, touch_rule, grow_lut, boundary,
+                       counts, batch_size, backend=None):
+    # Slices only grow within themselves, so they are grown in place, a batch at a time
+    for start in range(0, len(slice_ids), batch_size):
+        batch = slice_ids[start:start + batch_size]
+        grown, _ = grow_labels_one_pass(labels[batch], threshold_binary[batch],
+                                        touch_rule=touch_rule,
+                                        grow_lut=grow_lut,
+                                        boundary=None if boundary is None else boundary[batch],
+                                        axes=(1, 2),
+                                        backend=backend)
+        labels[batch] = grown
+        counts[batch] = np.count_nonzero(grown.reshape(len(batch), -1), axis=1)
+
+
+def dilation_one_iter_stack_2d(labels, threshold_binary, slice_ids=None,
+                               num_threads=1,
+                               touch_rule='stop',
+                               grow_lut=None,
+                               boundary=None,
+                               batch_size=16,
+                               backend=None):
+    """
+    Perform one dilation iteration on a stack of independent 2D images.
+
+    Every slice along the first axis is grown on its own with ``disk(1)``, the
+    same as `dilation_one_iter_single_pass` on the 2D slice. The slices are
+    split between threads, and grown in place.
+
+    Args:
+        labels (np.ndarray): 3D stack of label masks, changed in place.
+        threshold_binary (np.ndarray): Binary mask threshold for the guide.
+        slice_ids (np.ndarray, optional): Slices to grow. Defaults to all slices.
+        num_threads (int): Number of threads to use.
+        touch_rule (str): Must be 'stop', see grow_labels_one_pass.
+        grow_lut (np.ndarray, optional): Lookup table from make_grow_lut.
+        boundary (np.ndarray, optional): Boundary mask to constrain growth.
+        batch_size (int): Number of slices grown at once by a thread.
+        backend (str, optional): 'opencv' grows the slices with cv2.dilate, see neighbour_max.
+
+    Returns:
+        np.ndarray: Number of labelled voxels of every slice, 0 for the slices
+        that were not grown.
+    """
+    if touch_rule != 'stop':
+        raise ValueError(f"One-pass growth only supports touch_rule 'stop', got {touch_rule}.")
+    if labels.ndim != 3:
+        raise ValueError(f"A stack of 2D images must be 3D, got {labels.ndim}D.")
+    if slice_ids is None:
+        slice_ids = np.arange(labels.shape[0])
+
+    counts = np.zeros(labels.shape[0], dtype=np.int64)
+    num_threads = max(1, min(int(num_threads), len(slice_ids)))
+    threads = []
+    for thread_id in range(num_threads):
+        thread = threading.Thread(target=_grow_stack_slices, args=(labels, threshold_binary,
+                                                                   slice_ids[thread_id::num_threads],
+                                                                   touch_rule, grow_lut, boundary,
+                                                                   counts, batch_size, backend))
+        threads.append(thread)
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return counts
+
+
+def sort_stack_2d(labels):
+    """
+    Sort the label ids of every slice of a stack by size, each slice on its own.
+
+    Every slice gets the ids `sprout_core.reorder_segmentation` gives it.
+
+    Args:
+        labels (np.ndarray): 3D stack of label masks.
+
+    Returns:
+        np.ndarray: The sorted stack.
+    """
+    result = np.empty_like(labels)
+    for slice_id, labels_slice in enumerate(labels):
+        sizes = np.bincount(labels_slice.ravel())
+        ids = np.flatnonzero(sizes)
+        ids = ids[ids != 0]
+        # Stable sort keeps the smaller id first for equal sizes
+        ids = ids[np.argsort(-sizes[ids], kind='stable')]
+        lut = np.zeros(sizes.size, dtype=labels.dtype)
+        lut[ids] = np.arange(1, ids.size + 1)
+        result[slice_id] = lut[labels_slice]
+    return result
+
+
+class LabelIndex:
+    """
+    Per-label bounding boxes, voxel counts and active flags, kept up to date during growth.
+
+    The index is built once from the seed. After each iteration only the region of
+    each label is re-read, so the ids to grow, the region to dilate and the grown
+    size are known without passes over the whole volume.
+
+    Bounding boxes are stored as ``bbox_min`` (inclusive) and ``bbox_max`` (exclusive)
+    per label id and axis. Labels that stopped growing can be frozen with
+    `freeze_converged`, they are then skipped until `reactivate` is called.
+    """
+
+    def __init__(self, labels, to_grow_ids=None):
+        self.shape = labels.shape
+        self.ndim = labels.ndim
+        self.build(labels, to_grow_ids)
+
+    def build(self, labels, to_grow_ids=None):
+        """
+        Build the index from a label array, with one pass over the volume.
+
+        Args:
+            labels (np.ndarray): Label array.
+            to_grow_ids (list, optional): Label ids to grow. If None, all non-zero ids grow.
+        """
+        max_label = int(labels.max())
+        self.counts = np.bincount(labels.ravel(), minlength=max_label + 1).astype(np.int64)
+        self.counts[0] = 0
+        self.bbox_min = np.zeros((max_label + 1, self.ndim), dtype=np.int64)
+        self.bbox_max = np.zeros((max_label + 1, self.ndim), dtype=np.int64)
+        for label_id, obj in enumerate(ndimage.find_objects(labels), start=1):
+            if obj is not None:
+                self.bbox_min[label_id] = [sl.start for sl in obj]
+                self.bbox_max[label_id] = [sl.stop for sl in obj]
+
+        self.growable = make_grow_lut(max_label, to_grow_ids)
+        if self.growable is None:
+            self.growable = np.ones(max_label + 1, dtype=bool)
+            self.growable[0] = False
+        self.active = self.growable & (self.counts > 0)
+        # Iterations in a row each label grew less than the minimum growth
+        self.stall_counts = np.zeros(max_label + 1, dtype=np.int64)
+        self.boundary_cleared = False
+
+    @property
+    def total_size(self):
+        """Number of labelled voxels."""
+        return int(self.counts.sum())
+
+    def active_ids(self):
+        """Ids of the labels that are present and can grow."""
+        return np.flatnonzero(self.active)
+
+    def freeze_converged(self, previous_counts, min_growth_size, max_iter):
+        """
+        Freeze the labels that stopped growing.
+
+        Args:
+            previous_counts (np.ndarray): ``counts`` before the last iteration.
+            min_growth_size (int): A label growing by fewer voxels in an iteration
+                counts as not growing.
+            max_iter (int): Number of iterations in a row without growing before
+                a label is frozen.
+
+        Returns:
+            int: Number of labels that were frozen.
+        """
+        stalled = (self.counts - previous_counts) < min_growth_size
+        self.stall_counts = np.where(stalled & self.active, self.stall_counts + 1, 0)
+        to_freeze = self.active & (self.stall_counts >= max_iter)
+        self.active &= ~to_freeze
+        return int(np.count_nonzero(to_freeze))
+
+    def reactivate(self):
+        """Make every present label that can grow active again, e.g. for a new threshold."""
+        self.active = self.growable & (self.counts > 0)
+        self.stall_counts[:] = 0
+
+    def present_ids(self):
+        """Ids of all labels that are present."""
+        return np.flatnonzero(self.counts)
+
+    def slices(self, label_id, margin=0):
+        """
+        Bounding box of a label as a tuple of slices.
+
+        Args:
+            label_id (int): Label id.
+            margin (int): Voxels added on every side, clipped to the volume.
+
+        Returns:
+            tuple: Slices of the bounding box.
+        """
+        return tuple(slice(max(int(lo) - margin, 0), min(int(hi) + margin, dim))
+                     for lo, hi, dim in zip(self.bbox_min[label_id], self.bbox_max[label_id], self.shape))
+
+    def refresh(self, labels, label_id, margin=0):
+        """
+        Update the count and bounding box of a label from its region.
+
+        A label that grew by at most ``margin`` voxels is still inside its old
+        bounding box plus ``margin``, so only that region is read.
+
+        Args:
+            labels (np.ndarray): Label array after growing.
+            label_id (int): Label id.
+            margin (int): How far the label may have grown since the last update.
+        """
+        sub = self.slices(label_id, margin)
+        label_binary = labels[sub] == label_id
+        count = int(np.count_nonzero(label_binary))
+        self.counts[label_id] = count
+        if count == 0:
+            self.active[label_id] = False
+            self.bbox_min[label_id] = 0
+            self.bbox_max[label_id] = 0
+            return
+
+        for axis in range(self.ndim):
+            other_axes = tuple(a for a in range(self.ndim) if a != axis)
+            present = np.flatnonzero(np.any(label_binary, axis=other_axes))
+            self.bbox_min[label_id, axis] = sub[axis].start + present[0]
+            self.bbox_max[label_id, axis] = sub[axis].start + present[-1] + 1
+
+
+class FrontierGrower:
+    """
+    Grow labels by expanding only the active frontier voxels.
+
+    The frontier holds the voxels claimed in the last iteration, so the cost of an
+    iteration is proportional to the voxels that are actually grown. The iteration
+    at which every voxel was claimed is recorded in ``arrival``; seed voxels and
+    voxels that were never claimed keep 0.
+
+    Only the 'stop' touch rule is supported. The labels are grown in place.
+    With ``track_arrival=False`` no arrival map is kept, and ``arrival`` is None.
+    """
+
+    def __init__(self, labels, boundary=None, to_grow_ids=None, max_iterations=65535,
+                 track_arrival=True):
+        if not labels.flags.c_contiguous:
+            raise ValueError("FrontierGrower needs a C-contiguous label array.")
+
+        self.labels = labels
+        self.shape = labels.shape
+        self.labels_flat = labels.reshape(-1)
+        self.boundary = boundary
+        self.grow_lut = make_grow_lut(labels.max(), to_grow_ids)
+
+        self.arrival = None
+        if track_arrival:
+            arrival_dtype = np.uint16 if max_iterations <= np.iinfo(np.uint16).max else np.uint32
+            self.arrival = np.zeros(self.shape, dtype=arrival_dtype)
+            self.arrival_flat = self.arrival.reshape(-1)
+        self.iteration = 0
+
+        self.strides = [int(np.prod(self.shape[axis + 1:])) for axis in range(labels.ndim)]
+        self.claimable_flat = None
+        self.frontier = np.array([], dtype=np.int64)
+        # Labels inside the boundary still grow in the first iteration, then are cleared
+        self.boundary_pending = boundary is not None
+
+    def _is_growable(self, label_values):
+        if self.grow_lut is None:
+            return label_values != 0
+        return self.grow_lut[label_values]
+
+    def set_threshold(self, threshold_binary):
+        """
+        Set the mask that can be grown into, and rebuild the frontier for it.
+
+        Args:
+            threshold_binary (np.ndarray): Binary mask threshold for the guide.
+        """
+        claimable = threshold_binary & (self.labels == 0)
+        if self.boundary is not None:
+            claimable &= ~self.boundary
+        self.claimable_flat = threshold_binary.reshape(-1)
+        if self.boundary is not None:
+            self.claimable_flat = self.claimable_flat & ~self.boundary.reshape(-1)
+
+        # Labelled voxels that touch a claimable voxel
+        touch_free = neighbour_max(claimable.view(np.uint8)).view(bool)
+        self.frontier = np.flatnonzero(touch_free & self._is_growable(self.labels))
+
+    def _neighbours(self, idx):
+        coords = np.unravel_index(idx, self.shape)
+        nb_idx = []
+        nb_src = []
+        for axis, stride in enumerate(self.strides):
+            coord = coords[axis]
+            for step in (-1, 1):
+                valid = (coord + step >= 0) & (coord + step < self.shape[axis])
+                nb_idx.append(idx[valid] + step * stride)
+                nb_src.append(idx[valid])
+        return np.concatenate(nb_idx), np.concatenate(nb_src)
+
+    def step(self):
+        """
+        Grow the frontier by one voxel.
+
+        Returns:
+            int: Change in the number of labelled voxels in this iteration.
+        """
+        self.iteration += 1
+        if self.frontier.size == 0 and not self.boundary_pending:
+            return 0
+
+        nb_idx, nb_src = self._neighbours(self.frontier)
+        free = self.claimable_flat[nb_idx] & (self.labels_flat[nb_idx] == 0)
+        nb_idx = nb_idx[free]
+        nb_label = self.labels_flat[nb_src[free]]
+
+        # The largest label wins when several labels reach the same voxel
+        order = np.lexsort((nb_label, nb_idx))
+        nb_idx = nb_idx[order]
+        nb_label = nb_label[order]
+        last = np.ones(nb_idx.size, dtype=bool)
+        last[:-1] = nb_idx[1:] != nb_idx[:-1]
+        new_idx = nb_idx[last]
+
+        self.labels_flat[new_idx] = nb_label[last]
+        if self.arrival is not None:
+            self.arrival_flat[new_idx] = self.iteration
+        self.frontier = new_idx
+
+        n_claimed = int(new_idx.size)
+        if self.boundary_pending:
+            n_claimed -= int(np.count_nonzero(self.labels[self.boundary]))
+            self.labels[self.boundary] = 0
+            self.boundary_pending = False
+
+        return n_claimed
+
+
+def snapshot_from_arrival(labels, arrival, iteration):
+    """
+    Rebuild the grown labels as they were after a given iteration.
+
+    Args:
+        labels (np.ndarray): Labels grown by FrontierGrower.
+        arrival (np.ndarray): Arrival iteration map from FrontierGrower.
+        iteration (int): Global iteration to rebuild.
+
+    Returns:
+        np.ndarray: The labels claimed up to and including ``iteration``.
+    """
+    return np.where(arrival <= iteration, labels, 0).astype(labels.dtype, copy=False)
+
+
+def grow_to_end_watershed(labels, threshold_binary, to_grow_ids=None, boundary=None):
+    """
+    Grow labels until they fill the reachable part of the threshold mask.
+
+    The labels are flooded from the seeds in layers of their (face-connected)
+    geodesic distance, with the first-in first-out frontier of FrontierGrower.
+    A voxel that several labels reach in the same layer goes to the largest id,
+    so the result is the same as repeated dilation with the 'stop' rule.
+
+    Args:
+        labels (np.ndarray): Label mask to grow. Not modified.
+        threshold_binary (np.ndarray): Voxels that background can be grown into.
+        to_grow_ids (list, optional): Specific IDs to grow. Defaults to None.
+        boundary (np.ndarray, optional): Voxels that are always cleared.
+
+    Returns:
+        np.ndarray: The grown labels, same dtype as ``labels``.
+    """
+    result = np.ascontiguousarray(labels).copy()
+    return grow_to_end_frontier(result, threshold_binary, to_grow_ids=to_grow_ids,
+                                boundary=boundary)
+
+
+# Arrays of the TiledGrower shared memory, attached once in every worker process
+_tile_arrays = {}
+_tile_shms = []
+
+
+def _attach_tile_worker(spec, grow_lut, touch_rule):
+    for key, (shm_name, shape, dtype) in spec.items():
+        shm = shared_memory.SharedMemory(name=shm_name)
+        _tile_shms.append(shm)
+        _tile_arrays[key] = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    _tile_arrays["grow_lut"] = grow_lut
+    _tile_arrays["touch_rule"] = touch_rule
+
+
+def _grow_tile_worker(task):
+    src_key, dst_key, start, stop = task
+    counts = [0]
+    _grow_slab(_tile_arrays[src_key], _tile_arrays[dst_key],
+               _tile_arrays["threshold"],
+               _tile_arrays["touch_rule"],
+               _tile_arrays["grow_lut"],
+               _tile_arrays.get("boundary"),
+               start, stop, counts, 0)
+    return counts[0], int(np.count_nonzero(_tile_arrays[dst_key][start:stop]))
+
+
+class TiledGrower:
+    """
+    Grow labels on tiles of the volume in a pool of worker processes.
+
+    The volume is split into tiles along the first axis. The labels live in two
+    shared memory buffers: in every iteration each worker reads its tile plus a
+    one-voxel halo from the current buffer and writes the inner tile to the other
+    one, then the buffers are swapped. The halo is therefore always read from the
+    previous iteration, and the result is the same as `dilation_one_iter_single_pass`.
+
+    Call `close` when done to get the grown labels and free the shared memory.
+    If growing fails, `terminate` stops the workers and frees the shared memory
+    without waiting. Used as a context manager, `terminate` is called on exit,
+    and does nothing after `close`.
+    """
+
+    def __init__(self, labels, num_workers, touch_rule='stop', boundary=None, to_grow_ids=None):
+        if touch_rule != 'stop':
+            raise ValueError(f"One-pass growth only supports touch_rule 'stop', got {touch_rule}.")
+
+        self.shape = labels.shape
+        n_slices = self.shape[0]
+        num_workers = max(1, min(int(num_workers), n_slices))
+        bounds = np.linspace(0, n_slices, num_workers + 1).astype(int)
+        self.tiles = [(bounds[i], bounds[i + 1]) for i in range(num_workers)]
+
+        self._shms = {}
+        self._arrays = {}
+        self.pool = None
+        try:
+            self._new_shared("labels_a", labels)
+            self._new_shared("labels_b", labels)
+            self._new_shared("threshold", np.zeros(self.shape, dtype=bool))
+            if boundary is not None:
+                self._new_shared("boundary", boundary.astype(bool, copy=False))
+
+            spec = {key: (shm.name, self.shape, self._arrays[key].dtype)
+                    for key, shm in self._shms.items()}
+            self.pool = multiprocessing.Pool(processes=num_workers,
+                                             initializer=_attach_tile_worker,
+                                             initargs=(spec,
+                                                       make_grow_lut(labels.max(), to_grow_ids),
+                                                       touch_rule))
+        except BaseException:
+            # Buffers already made would otherwise stay in /dev/shm
+            self._free_shared()
+            raise
+        self.src_key = "labels_a"
+        self.dst_key = "labels_b"
+
+    def _new_shared(self, key, array):
+        shm = shared_memory.SharedMemory(create=True, size=max(int(array.nbytes), 1))
+        shared = np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)
+        shared[...] = array
+        self._shms[key] = shm
+        self._arrays[key] = shared
+
+    @property
+    def labels(self):
+        """The labels after the last iteration. Only valid until the next `step` or `close`."""
+        return self._arrays[self.src_key]
+
+    def set_threshold(self, threshold_binary):
+        """
+        Set the mask that can be grown into.
+
+        Args:
+            threshold_binary (np.ndarray): Binary mask threshold for the guide.
+        """
+        self._arrays["threshold"][...] = threshold_binary
+
+    def step(self):
+        """
+        Grow all tiles by one iteration.
+
+        Returns:
+            tuple: (number of voxels whose label changed, number of labelled voxels)
+        """
+        tasks = [(self.src_key, self.dst_key, start, stop) for start, stop in self.tiles]
+        counts = self.pool.map(_grow_tile_worker, tasks)
+        self.src_key, self.dst_key = self.dst_key, self.src_key
+        n_changed = sum(c[0] for c in counts)
+        n_labelled = sum(c[1] for c in counts)
+        return n_changed, n_labelled
+
+    def close(self):
+        """
+        Stop the workers and free the shared memory.
+
+        Returns:
+            np.ndarray: A copy of the grown labels.
+        """
+        result = self.labels.copy()
+        self.pool.close()
+        self.pool.join()
+        self._free_shared()
+        return result
+
+    def terminate(self):
+        """
+        Stop the workers without waiting for their tasks, and free the shared memory.
+        """
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+        self._free_shared()
+
+    def _free_shared(self):
+        self.pool = None
+        self._arrays = {}
+        for shm in self._shms.values():
+            shm.close()
+            shm.unlink()
+        self._shms = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.terminate()
+
+
+def save_delta_snapshot(path, result, previous, previous_name):
+    """
+    Save the voxels that changed since the previous snapshot.
+
+    The snapshot is a ``.npz`` file with the flat indices and new labels of the
+    changed voxels, the name of the previous snapshot in the same folder, and the
+    shape of the volume. ``previous`` is updated in place to ``result``.
+
+    Args:
+        path (str): Output ``.npz`` path.
+        result (np.ndarray): Current labels.
+        previous (np.ndarray): Labels of the previous snapshot, updated in place.
+        previous_name (str): File name of the previous snapshot.
+
+    Returns:
+        int: Number of changed voxels.
+    """
+    index = np.flatnonzero(result != previous)
+    index_dtype = np.uint32 if result.size <= np.iinfo(np.uint32).max else np.uint64
+    labels = result.reshape(-1)[index]
+    np.savez(path,
+             index=index.astype(index_dtype),
+             labels=labels,
+             previous=np.array(previous_name),
+             shape=np.array(result.shape))
+    previous.reshape(-1)[index] = labels
+    return int(index.size)
+
+
+def load_snapshot(path):
+    """
+    Load a grow snapshot, rebuilding it if it is delta encoded.
+
+    A ``.npz`` snapshot is rebuilt by starting from the first ``.tif`` found
+    when following the previous snapshots, and applying every delta in order.
+
+    Args:
+        path (str): Path to an ``INTER_*.tif`` or ``INTER_*.npz`` snapshot.
+
+    Returns:
+        np.ndarray: Labels of the snapshot.
+    """
+    folder = os.path.dirname(path)
+    chain = []
+    while path.endswith(".npz"):
+        chain.append(path)
+        with np.load(path) as delta:
+            path = os.path.join(folder, str(delta["previous"]))
+
+    result = tifffile.imread(path)
+    flat = result.reshape(-1)
+    for delta_path in reversed(chain):
+        with np.load(delta_path) as delta:
+            flat[delta["index"]] = delta["labels"]
+    return result
+
+
+def save_checkpoint(path, **state):
+    """
+    Save a grow checkpoint atomically.
+
+    The arrays are written to a temporary file that is then renamed over ``path``,
+    so an interrupted write never leaves a broken checkpoint.
+
+    Args:
+        path (str): Checkpoint path (``.npz``).
+        **state: Arrays and scalars to store.
+    """
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(f, **state)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(path):
+    """
+    Load a grow checkpoint saved by `save_checkpoint`.
+
+    Args:
+        path (str): Checkpoint path.
+
+    Returns:
+        dict: The stored arrays, scalars are 0-d arrays.
+    """
+    with np.load(path) as checkpoint:
+        return {key: checkpoint[key] for key in checkpoint.files}
+
+
+def _block_reduce(array, factor, reduce_func, pad_value=0):
+    # Reduce non-overlapping blocks of `factor` voxels per axis, padding the edges
+    pad = [(0, (-dim) % factor) for dim in array.shape]
+    if any(after for _, after in pad):
+        array = np.pad(array, pad, constant_values=pad_value)
+    blocks_shape = []
+    for dim in array.shape:
+        blocks_shape += [dim // factor, factor]
+    return reduce_func(array.reshape(blocks_shape), axis=tuple(range(1, 2 * array.ndim, 2)))
+
+
+def _block_expand(array, factor, shape):
+    # Repeat every voxel `factor` times per axis, cropped to `shape`, in one allocation
+    expanded = np.empty([dim * factor for dim in array.shape], dtype=array.dtype)
+    blocks_shape = []
+    for dim in array.shape:
+        blocks_shape += [dim, factor]
+    expanded.reshape(blocks_shape)[...] = array[(slice(None), None) * array.ndim]
+    return expanded[tuple(slice(0, dim) for dim in shape)]
+
+
+def _label_edges(labels):
+    # Voxels with a face neighbour of another label, or of the background
+    edges = np.zeros(labels.shape, dtype=bool)
+    ndim = labels.ndim
+    for axis in range(ndim):
+        lower = [slice(None)] * ndim
+        upper = [slice(None)] * ndim
+        lower[axis] = slice(0, -1)
+        upper[axis] = slice(1, None)
+        lower = tuple(lower)
+        upper = tuple(upper)
+        differ = labels[lower] != labels[upper]
+        edges[lower] |= differ
+        edges[upper] |= differ
+    return edges
+
+
+def _drop_unseeded(result, seeds, new):
+    # Clear the new voxels that are not face-connected to a seed voxel of their label.
+    # Each label is labelled on its own, inside its bounding box, in the smallest
+    # dtype that holds the components of the box.
+    structure = ndimage.generate_binary_structure(result.ndim, 1)
+    for label_id, box in enumerate(ndimage.find_objects(result), start=1):
+        if box is None:
+            continue
+        label_mask = result[box] == label_id
+        grown = new[box] & label_mask
+        if not grown.any():
+            continue
+        components = np.empty(label_mask.shape, dtype=np.min_scalar_type(label_mask.size))
+        n_components = ndimage.label(label_mask, structure=structure, output=components)
+        seeded = np.zeros(n_components + 1, dtype=bool)
+        seeded[components[seeds[box] == label_id]] = True
+        grown &= ~seeded[components]
+        new[box][grown] = False
+        result[box][grown] = 0
+
+
+def grow_to_end_frontier(labels, threshold_binary, to_grow_ids=None, boundary=None):
+    """
+    Grow labels with FrontierGrower until no voxel is claimed anymore.
+
+    Args:
+        labels (np.ndarray): Label mask to grow, grown in place. Must be C-contiguous.
+        threshold_binary (np.ndarray): Voxels that background can be grown into.
+        to_grow_ids (list, optional): Specific IDs to grow. Defaults to None.
+        boundary (np.ndarray, optional): Voxels that are always cleared.
+
+    Returns:
+        np.ndarray: The grown labels.
+    """
+    grower = FrontierGrower(labels, boundary=boundary, to_grow_ids=to_grow_ids,
+                            track_arrival=False)
+    grower.set_threshold(threshold_binary)
+    grower.step()
+    while grower.frontier.size != 0:
+        grower.step()
+    return labels
+
+
+def grow_to_end_multires(labels, threshold_binary, factor=4, to_grow_ids=None, boundary=None):
+    """
+    Grow labels until they fill the reachable threshold mask, coarse to fine.
+
+    1. The labels (block maximum), the threshold mask (block majority) and the
+       boundary (any voxel) are downsampled by `factor`, and grown to the end.
+    2. The coarse labels are upsampled onto the background of the threshold mask.
+       Upsampled voxels that are not connected to their label's seed at full
+       resolution are dropped.
+    3. Upsampled voxels within `factor` voxels of a label interface or threshold
+       edge are reset, and everything left is grown to the end at full resolution
+       from there, so only a narrow band is grown voxel by voxel.
+
+    The grown region is the same as full-resolution growth. Label interfaces can
+    move by a few voxels where labels meet far from their seeds.
+
+    Args:
+        labels (np.ndarray): Label mask to grow. Not modified.
+        threshold_binary (np.ndarray): Voxels that background can be grown into.
+        factor (int): Downsampling factor per axis.
+        to_grow_ids (list, optional): Specific IDs to grow. Defaults to None.
+        boundary (np.ndarray, optional): Voxels that are always cleared.
+
+    Returns:
+        np.ndarray: The grown labels, same dtype as ``labels``.
+    """
+    claimable = labels == 0
+    claimable &= threshold_binary
+    if boundary is not None:
+        claimable &= ~boundary
+
+    # 1. Coarse growth
+    coarse_labels = np.ascontiguousarray(_block_reduce(labels, factor, np.max))
+    coarse_threshold = _block_reduce(threshold_binary.view(np.uint8), factor, np.mean) >= 0.5
+    coarse_boundary = None
+    if boundary is not None:
+        coarse_boundary = _block_reduce(boundary, factor, np.any)
+    grow_to_end_frontier(coarse_labels, coarse_threshold, to_grow_ids=to_grow_ids,
+                         boundary=coarse_boundary)
+    grow_lut = make_grow_lut(labels.max(), to_grow_ids)
+    if grow_lut is not None:
+        # Ids that are not grown are dropped before upsampling
+        coarse_labels[~grow_lut[coarse_labels]] = 0
+
+    # 2. Upsample onto the free voxels, and drop pieces cut off from the seed at full resolution
+    upsampled = _block_expand(coarse_labels, factor, labels.shape)
+    new = claimable
+    new &= upsampled != 0
+    result = labels.copy()
+    np.copyto(result, upsampled, where=new)
+    upsampled = None
+    _drop_unseeded(result, labels, new)
+
+    # 3. Reset a band around interfaces and edges, then grow it at full resolution
+    band = ndimage.binary_dilation(_label_edges(result), iterations=factor)
+    new &= band
+    band = None
+    result[new] = 0
+
+    grow_to_end_frontier(result, threshold_binary, to_grow_ids=to_grow_ids, boundary=boundary)
+    if boundary is not None:
+        result[boundary] = 0
+    return result
+
+
+if __name__ == "__main__":
+    # Results and logs of grow_engine 'watershed' must be the same as 'single_pass',
+    # also when several labels reach a voxel in the same iteration
+    import tempfile
+    import pandas as pd
+    import make_grow
+
+    rng = np.random.default_rng(0)
+    img = ndimage.gaussian_filter(rng.random((12, 60, 80)), 2)
+    img = (255 * (img - img.min()) / (img.max() - img.min())).astype(np.uint8)
+    seg = np.zeros(img.shape, dtype=np.uint8)
+    # Seeds an even number of voxels apart, so they meet in ties
+    for label_id, (z, y, x) in enumerate(rng.integers(0, 6, (40, 3)) * 2, start=1):
+        seg[z, 2 + 9 * y // 2, 2 + 12 * x // 2] = label_id
+    boundary = np.zeros(img.shape, dtype=bool)
+    boundary[:, 30, 10:70] = True
+
+    def run_engine(grow_engine, output_folder):
+        grows, log = make_grow.grow_mp(img=img, seg=seg, boundary=boundary, output_folder=output_folder,
+                                       base_name="tied", thresholds=[150, 110], dilation_steps=[4, 6],
+                                       save_every_n_iters=[1, 1], grow_to_end=True, num_threads=1,
+                                       grow_engine=grow_engine, return_for_napari=True)
+        log = pd.read_csv(log["log_path"]).drop(columns=["file_name", "full_path"])
+        return grows, log
+
+    with tempfile.TemporaryDirectory() as output_folder:
+        pass_grows, pass_log = run_engine("single_pass", os.path.join(output_folder, "single_pass"))
+        flood_grows, flood_log = run_engine("watershed", os.path.join(output_folder, "watershed"))
+    assert pass_grows.keys() == flood_grows.keys()
+    for name in pass_grows:
+        assert np.array_equal(pass_grows[name], flood_grows[name]), name
+    assert pass_log.equals(flood_log)
+    print("Results and logs of the watershed engine match the single_pass engine")
@@ -0,0 +1,84 @@
+import numpy as np
+
+
+# Number of set bits of every byte value
+_POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.int64)
+
+
+class PackedMask:
+    """
+    Boolean volume stored as packed bits, 8 voxels per byte along the last axis.
+
+    Blocks are unpacked on demand with ``mask[slices]``, so code that reads a
+    boolean mask slab by slab (e.g. `grow_core.dilation_one_iter_single_pass`)
+    or box by box (the per-label grow) can take a PackedMask instead, and only
+    the block being processed is held at 1 byte per voxel.
+
+    Only slices with step 1 are supported for indexing. Setting values is only
+    supported for slices along the first axis.
+
+    Args:
+        mask (np.ndarray, optional): Boolean mask to pack. If None, `shape` must
+            be given and the mask is empty.
+        shape (tuple, optional): Shape of an empty mask.
+        slab_size (int): Number of slices along the first axis packed at once.
+    """
+
+    def __init__(self, mask=None, shape=None, slab_size=16):
+        if mask is None:
+            if shape is None:
+                raise ValueError("Either mask or shape must be given.")
+            self.shape = tuple(int(s) for s in shape)
+        else:
+            self.shape = tuple(mask.shape)
+        if len(self.shape) < 2:
+            raise ValueError(f"PackedMask needs a 2D or 3D mask, got shape {self.shape}.")
+        self.ndim = len(self.shape)
+        n_bytes = (self.shape[-1] + 7) // 8
+        self.bits = np.zeros(self.shape[:-1] + (n_bytes,), dtype=np.uint8)
+
+        if mask is not None:
+            for start in range(0, self.shape[0], slab_size):
+                stop = min(start + slab_size, self.shape[0])
+                self[start:stop] = mask[start:stop]
+
+    @property
+    def nbytes(self):
+        return self.bits.nbytes
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        if len(key) > self.ndim or not all(isinstance(k, slice) for k in key):
+            raise ValueError("PackedMask only supports indexing with slices.")
+        key = key + (slice(None),) * (self.ndim - len(key))
+        last_start, last_stop, step = key[-1].indices(self.shape[-1])
+        if any(k.step not in (None, 1) for k in key) or step != 1:
+            raise ValueError("PackedMask only supports slices with step 1.")
+        last_stop = max(last_start, last_stop)
+
+        # Unpack the bytes covering the requested voxels of the last axis
+        byte_start = last_start // 8
+        byte_stop = (last_stop + 7) // 8
+        block = np.unpackbits(self.bits[key[:-1] + (slice(byte_start, byte_stop),)],
+                              axis=-1, bitorder='little').view(bool)
+        offset = byte_start * 8
+        return block[..., last_start - offset:last_stop - offset]
+
+    def __setitem__(self, key, value):
+        if not isinstance(key, slice):
+            raise ValueError("PackedMask only supports setting slices along the first axis.")
+        value = np.asarray(value, dtype=bool)
+        self.bits[key] = np.packbits(value, axis=-1, bitorder='little')
+
+    def unpack(self):
+        """Whole mask as a boolean array."""
+        return self[:]
+
+    def count(self):
+        """Number of set voxels."""
+        return int(np.bincount(self.bits.ravel(), minlength=256) @ _POPCOUNT)
+
+    def any(self):
+        """Whether any voxel is set."""
+        return bool(self.bits.any())
@@ -0,0 +1,486 @@
+import threading
+import time
+
+import numpy as np
+from scipy import ndimage
+from skimage import measure
+from skimage.morphology import binary_dilation, binary_erosion
+
+import sprout_core.roi_core as roi_core
+
+
+class MorphologyBackend:
+    """
+    Binary erosion, dilation, closing and connected component labelling.
+
+    Every backend gives the same results as the scikit-image functions used in
+    sprout_core: the outside of the mask counts as foreground for erosion and
+    as background for dilation, and components are labelled with full
+    connectivity by default, numbered in the order of their first voxel.
+
+    Args of erode/dilate:
+        mask (np.ndarray): Binary mask, 2D or 3D.
+        structure (np.ndarray): Structuring element, odd size along every axis.
+        iterations (int): Number of times the structure is applied.
+        out (np.ndarray, optional): Output array, must not share memory with `mask`.
+    """
+
+    name = None
+
+    def erode(self, mask, structure, iterations=1, out=None):
+        raise NotImplementedError
+
+    def dilate(self, mask, structure, iterations=1, out=None):
+        raise NotImplementedError
+
+    def close(self, mask, structure, out=None):
+        """Dilation then erosion with the same structure."""
+        with roi_core.work_buffer_scope():
+            dilated = self.dilate(mask, structure, out=roi_core.work_buffer(mask.shape, slot=2))
+            return self.erode(dilated, structure, out=out)
+
+    def label(self, mask, connectivity=None):
+        """
+        Label the connected components of a mask.
+
+        Args:
+            mask (np.ndarray): Binary mask.
+            connectivity (int, optional): Maximum number of orthogonal steps
+                between neighbours, as in skimage.measure.label. Defaults to mask.ndim.
+
+        Returns:
+            np.ndarray: Labels, 0 for the background.
+        """
+        raise NotImplementedError
+
+    def label_with_sizes(self, mask, connectivity=None):
+        """
+        Label the connected components of a mask, and count their voxels.
+
+        Args:
+            mask (np.ndarray): Binary mask.
+            connectivity (int, optional): See label.
+
+        Returns:
+            tuple: (labels, sizes), `sizes[i]` is the number of voxels of label
+            i, `sizes[0]` the background.
+        """
+        labels = self.label(mask, connectivity)
+        return labels, np.bincount(labels.ravel())
+
+
+def _iterate(func, mask, structure, iterations, out):
+    # One call per iteration, alternating between two work buffers
+    if out is None:
+        out = np.empty(mask.shape, dtype=bool)
+    with roi_core.work_buffer_scope():
+        for i_iter in range(iterations):
+            target = out if i_iter == iterations - 1 else roi_core.work_buffer(mask.shape, slot=3 + i_iter % 2)
+            func(mask, structure, out=target)
+            mask = target
+    return out
+
+
+class SkimageBackend(MorphologyBackend):
+    """scikit-image, the backend sprout_core has always used."""
+
+    name = 'skimage'
+
+    def erode(self, mask, structure, iterations=1, out=None):
+        return _iterate(binary_erosion, mask, structure, iterations, out)
+
+    def dilate(self, mask, structure, iterations=1, out=None):
+        return _iterate(binary_dilation, mask, structure, iterations, out)
+
+    def label(self, mask, connectivity=None):
+        return measure.label(mask, background=0, return_num=False, connectivity=connectivity)
+
+
+class ScipyBackend(MorphologyBackend):
+    """scipy.ndimage, repeated erosions run in one C loop with `iterations`."""
+
+    name = 'scipy'
+
+    def erode(self, mask, structure, iterations=1, out=None):
+        if out is None:
+            out = np.empty(mask.shape, dtype=bool)
+        ndimage.binary_erosion(mask, structure=structure, iterations=iterations,
+                               border_value=1, output=out)
+        return out
+
+    def dilate(self, mask, structure, iterations=1, out=None):
+        if out is None:
+            out = np.empty(mask.shape, dtype=bool)
+        ndimage.binary_dilation(mask, structure=structure, iterations=iterations, output=out)
+        return out
+
+    def label(self, mask, connectivity=None):
+        connectivity = mask.ndim if connectivity is None else connectivity
+        labels, _ = ndimage.label(mask, structure=ndimage.generate_binary_structure(mask.ndim, connectivity))
+        return labels
+
+
+def _cv2():
+    try:
+        import cv2
+    except ImportError as e:
+        raise ImportError("The 'opencv' morphology backend needs OpenCV (pip install opencv-python).") from e
+    return cv2
+
+
+def _slice_decomposition(structure):
+    # A 3D structure as the kernel of its middle slice along the first axis, plus
+    # the offsets of the other slices along that axis, if they only hold their
+    # centre voxel (e.g. 'ball', 'ball_XZ', 'Z'), or None
+    centre = tuple(size // 2 for size in structure.shape)
+    offsets = []
+    for index in range(structure.shape[0]):
+        plane = structure[index]
+        if index == centre[0] or not plane.any():
+            continue
+        if plane.sum() != 1 or not plane[centre[1:]]:
+            return None
+        offsets.append(index - centre[0])
+    return structure[centre[0]], offsets
+
+
+class OpenCVBackend(MorphologyBackend):
+    """
+    OpenCV, on 2D masks and slice by slice on 3D masks.
+
+    A 3D structure runs slice by slice along the first axis when it is the
+    kernel of its middle slice plus single voxels straight above and below, as
+    every 3D footprint of sprout_core with kernel size 1: the slices are eroded
+    (dilated) with cv2, and combined with the neighbouring slices. Other 3D
+    structures and 3D labelling use the scipy backend.
+    """
+
+    name = 'opencv'
+
+    def __init__(self):
+        self._fallback = ScipyBackend()
+
+    def _morph(self, op, mask, structure, iterations, out):
+        cv2 = _cv2()
+        if out is None:
+            out = np.empty(mask.shape, dtype=bool)
+        erode = (op == 'erode')
+        func = cv2.erode if erode else cv2.dilate
+        if mask.ndim == 2:
+            kernel, offsets = structure, []
+        else:
+            decomposition = _slice_decomposition(structure)
+            if decomposition is None:
+                fallback = self._fallback.erode if erode else self._fallback.dilate
+                return fallback(mask, structure, iterations=iterations, out=out)
+            kernel, offsets = decomposition
+        if not erode:
+            # scipy (and so skimage) reflects the structure for dilation, OpenCV does not
+            kernel = kernel[::-1, ::-1]
+            offsets = [-offset for offset in offsets]
+        kernel = np.ascontiguousarray(kernel, dtype=np.uint8)
+
+        # cv2 works on contiguous uint8 images, 0 or 1
+        src = np.ascontiguousarray(mask, dtype=np.uint8)
+        if mask.ndim == 2:
+            out[...] = func(src, kernel, iterations=iterations)
+            return out
+        if not offsets:
+            # Slices are independent, all iterations in one call per slice
+            for index in range(src.shape[0]):
+                out[index] = func(src[index], kernel, iterations=iterations)
+            return out
+
+        # Outside of the volume, the neighbouring slices are foreground for the
+        # erosion and background for the dilation, so they are skipped
+        combine = np.bitwise_and if erode else np.bitwise_or
+        for i_iter in range(iterations):
+            result = np.empty_like(src) if i_iter < iterations - 1 else None
+            for index in range(src.shape[0]):
+                slice_result = func(src[index], kernel)
+                for offset in offsets:
+                    if 0 <= index + offset < src.shape[0]:
+                        combine(slice_result, src[index + offset], out=slice_result)
+                if result is None:
+                    out[index] = slice_result
+                else:
+                    result[index] = slice_result
+            src = result
+        return out
+
+    def erode(self, mask, structure, iterations=1, out=None):
+        return self._morph('erode', mask, structure, iterations, out)
+
+    def dilate(self, mask, structure, iterations=1, out=None):
+        return self._morph('dilate', mask, structure, iterations, out)
+
+    def label(self, mask, connectivity=None):
+        if mask.ndim != 2:
+            return self._fallback.label(mask, connectivity)
+        cv2 = _cv2()
+        connectivity = 2 if connectivity is None else connectivity
+        # Wu's algorithm numbers components in raster order, as skimage does
+        _, labels = cv2.connectedComponentsWithAlgorithm(np.ascontiguousarray(mask, dtype=np.uint8),
+                                                         8 if connectivity == 2 else 4,
+                                                         cv2.CV_32S, cv2.CCL_WU)
+        return labels
+
+    def label_with_sizes(self, mask, connectivity=None):
+        if mask.ndim != 2:
+            return self._fallback.label_with_sizes(mask, connectivity)
+        cv2 = _cv2()
+        connectivity = 2 if connectivity is None else connectivity
+        # The sizes come with the labelling, without a pass over the labels
+        _, labels, stats, _ = cv2.connectedComponentsWithStatsWithAlgorithm(
+            np.ascontiguousarray(mask, dtype=np.uint8), 8 if connectivity == 2 else 4,
+            cv2.CV_32S, cv2.CCL_WU)
+        return labels, stats[:, cv2.CC_STAT_AREA].astype(np.int64)
+
+
+# Label dtypes cv2.dilate works on
+_cv2_dilate_dtypes = (np.uint8, np.uint16, np.int16, np.float32, np.float64)
+
+
+def neighbour_max_2d(labels):
+    """
+    Maximum label over each pixel and its 4 neighbours, with OpenCV.
+
+    Same as grow_core.neighbour_max on a 2D label image, as one cv2.dilate with
+    a cross kernel. Labels of other dtypes are dilated as uint16 if they fit,
+    otherwise as float64, which holds every label id exactly.
+
+    Args:
+        labels (np.ndarray): 2D label array.
+
+    Returns:
+        np.ndarray: Array of the same shape and dtype as `labels`.
+    """
+    cv2 = _cv2()
+    kernel = cv2.getStructuringElement(cv2.MORPH_CROSS, (3, 3))
+    if labels.dtype.type in _cv2_dilate_dtypes:
+        work = np.ascontiguousarray(labels)
+    elif labels.size and labels.min() >= 0 and labels.max() <= np.iinfo(np.uint16).max:
+        work = labels.astype(np.uint16)
+    else:
+        work = labels.astype(np.float64)
+    # Outside of the image counts as the smallest value, so it never wins
+    return cv2.dilate(work, kernel).astype(labels.dtype, copy=False)
+
+
+backends = {backend.name: backend for backend in (SkimageBackend(), ScipyBackend(), OpenCVBackend())}
+
+
+def planar_axis(structure):
+    """
+    Axis along which a 3D structure only holds its middle slice.
+
+    Eroding (dilating) with such a structure is independent between the slices
+    along that axis, e.g. the first axis for 'ball_XY' and 'X'. The first such
+    axis is returned, as its slices are the most contiguous in memory.
+
+    Args:
+        structure (np.ndarray): Structuring element, odd size along every axis.
+
+    Returns:
+        int: The axis, or None if the structure is not planar or is 2D.
+    """
+    if structure.ndim != 3:
+        return None
+    for axis in range(3):
+        if not np.delete(structure, structure.shape[axis] // 2, axis=axis).any():
+            return axis
+    return None
+
+
+def _morph_slab(func, mask, structure, iterations, axis, start, stop, batch_size):
+    # Slices are independent, so they are eroded (dilated) a batch at a time
+    # into a work buffer of this thread, and copied back
+    batch_size = max(1, batch_size // (mask.size // mask.shape[axis]))
+    with roi_core.work_buffer_scope():
+        for batch_start in range(start, stop, batch_size):
+            batch = mask[(slice(None),) * axis + (slice(batch_start, min(batch_start + batch_size, stop)),)]
+            batch[...] = func(batch, structure, iterations=iterations,
+                              out=roi_core.work_buffer(batch.shape, slot=5))
+
+
+def _morph_slices(op, backend, mask, structure, iterations, num_threads, batch_size):
+    axis = planar_axis(structure)
+    if axis is None:
+        raise ValueError("The structure is not planar, it cannot be applied slice by slice.")
+    func = backend.erode if op == 'erode' else backend.dilate
+
+    n_slices = mask.shape[axis]
+    num_threads = max(1, min(int(num_threads), n_slices))
+    bounds = np.linspace(0, n_slices, num_threads + 1).astype(int)
+    if num_threads == 1:
+        _morph_slab(func, mask, structure, iterations, axis, 0, n_slices, batch_size)
+        return mask
+
+    threads = []
+    for slab_id in range(num_threads):
+        thread = threading.Thread(target=_morph_slab, args=(func, mask, structure, iterations, axis,
+                                                            bounds[slab_id], bounds[slab_id + 1],
+                                                            batch_size))
+        threads.append(thread)
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return mask
+
+
+def erode_slices(mask, structure, iterations=1, backend=None, num_threads=1, footprint=None,
+                 batch_size=2**24):
+    """
+    Erode a 3D mask in place, slice by slice, with a planar structure.
+
+    The slices along the planar_axis of the structure are independent, so they
+    are eroded in batches of slices, and the only temporary is the size of one
+    batch instead of the whole mask. The slices are split into one slab per thread.
+
+    Args:
+        mask (np.ndarray): 3D binary mask (bool), modified in place.
+        structure (np.ndarray): Planar structuring element, see planar_axis.
+        iterations (int): Number of times the structure is applied.
+        backend (str, optional): Morphology backend, see get_backend.
+        num_threads (int): Number of threads.
+        footprint (str, optional): Footprint name of the structure, for backend 'auto'.
+        batch_size (int): Number of voxels eroded at once by a thread, rounded
+            down to whole slices, at least one.
+
+    Returns:
+        np.ndarray: The eroded mask.
+    """
+    return _morph_slices('erode', get_backend(backend, footprint, mask.ndim), mask, structure,
+                         iterations, num_threads, batch_size)
+
+
+def dilate_slices(mask, structure, iterations=1, backend=None, num_threads=1, footprint=None,
+                  batch_size=2**24):
+    """
+    Dilate a 3D mask in place, slice by slice, with a planar structure.
+
+    Same as erode_slices, with a dilation.
+    """
+    return _morph_slices('dilate', get_backend(backend, footprint, mask.ndim), mask, structure,
+                         iterations, num_threads, batch_size)
+
+
+_fastest = {}
+_fastest_lock = threading.Lock()
+
+
+def available_backends():
+    """Names of the backends that can run here, OpenCV only if it is installed."""
+    names = []
+    for name in backends:
+        if name == 'opencv':
+            try:
+                _cv2()
+            except ImportError:
+                continue
+        names.append(name)
+    return names
+
+
+def benchmark_backends(ndim, footprints=None, shape=None, repeats=3, seed=0):
+    """
+    Time every available backend on a synthetic mask.
+
+    Args:
+        ndim (int): 2 or 3.
+        footprints (list, optional): Footprint names, see
+            sprout_core.get_erosion_structure. None is the connected component
+            labelling. Defaults to every footprint of that dimensionality and None.
+        shape (tuple, optional): Shape of the mask. Defaults to (64, 256, 256)
+            in 3D and (1024, 1024) in 2D.
+        repeats (int): Number of runs, the best one is kept.
+        seed (int): Random seed of the mask.
+
+    Returns:
+        dict: {footprint: {backend name: seconds}}, one erosion per run, or one
+        labelling for footprint None.
+    """
+    from sprout_core.sprout_core import get_erosion_structure
+
+    if footprints is None:
+        if ndim == 3:
+            footprints = ['ball', 'cube', 'ball_XY', 'ball_XZ', 'ball_YZ', 'X', 'Y', 'Z', None]
+        else:
+            footprints = ['ball', 'square', 'X', 'Y', None]
+    if shape is None:
+        shape = (64, 256, 256) if ndim == 3 else (1024, 1024)
+    rng = np.random.default_rng(seed)
+    mask = ndimage.uniform_filter(rng.random(shape), size=5) > 0.5
+
+    timings = {}
+    for footprint in footprints:
+        structure = None if footprint is None else get_erosion_structure(footprint, ndim)
+        timings[footprint] = {}
+        for name in available_backends():
+            backend = backends[name]
+            out = np.empty(shape, dtype=bool)
+            best = np.inf
+            for _ in range(repeats):
+                start = time.perf_counter()
+                if structure is None:
+                    backend.label(mask)
+                else:
+                    backend.erode(mask, structure, out=out)
+                best = min(best, time.perf_counter() - start)
+            timings[footprint][name] = best
+    return timings
+
+
+def fastest_backend(footprint, ndim):
+    """
+    Fastest backend on this host for a footprint and dimensionality.
+
+    The backends are timed once per footprint and dimensionality with
+    benchmark_backends, and the choice is kept for the rest of the process.
+
+    Args:
+        footprint (str): Footprint name, or None for the labelling.
+        ndim (int): 2 or 3.
+
+    Returns:
+        str: Backend name.
+    """
+    key = (footprint, ndim)
+    with _fastest_lock:
+        if key not in _fastest:
+            timings = benchmark_backends(ndim, footprints=[footprint])[footprint]
+            _fastest[key] = min(timings, key=timings.get)
+        return _fastest[key]
+
+
+def get_backend(name, footprint=None, ndim=3, default='skimage'):
+    """
+    Backend by name.
+
+    Args:
+        name (str): 'skimage', 'scipy', 'opencv' or 'auto'. 'auto' picks the
+            fastest backend for `footprint` and `ndim` (see fastest_backend).
+            None is the `default` backend.
+        footprint (str, optional): Footprint name for 'auto', None for the labelling.
+        ndim (int): Dimensionality for 'auto'.
+        default (str): Backend used when `name` is None.
+
+    Returns:
+        MorphologyBackend: The backend.
+    """
+    if name is None:
+        name = default
+    if name == 'auto':
+        name = fastest_backend(footprint, ndim)
+    if name not in backends:
+        raise ValueError(f"Unknown morphology backend: {name}. Must be one of {list(backends) + ['auto']}.")
+    return backends[name]
+
+
+if __name__ == "__main__":
+    for ndim in (2, 3):
+        print(f"{ndim}D, seconds per erosion (None: labelling)")
+        for footprint, timings in benchmark_backends(ndim).items():
+            fastest = min(timings, key=timings.get)
+            row = ", ".join(f"{name} {seconds:.4f}" for name, seconds in timings.items())
+            print(f"  {str(footprint):8s} {row} -> {fastest}")
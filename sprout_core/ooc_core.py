@@ -0,0 +1,242 @@
+import numpy as np
+import tifffile
+
+from sprout_core.grow_core import grow_labels_one_pass
+
+
+class TiffSlabReader:
+    """
+    Read a TIFF stack slice by slice, for files that cannot be memory-mapped
+    (e.g. compressed TIFFs).
+
+    Only slices along the first axis are supported, e.g. ``reader[10:20]``.
+    """
+
+    def __init__(self, path):
+        self.tif = tifffile.TiffFile(path)
+        series = self.tif.series[0]
+        self.shape = tuple(series.shape)
+        self.dtype = series.dtype
+        self.ndim = len(self.shape)
+        self.pages = series.pages
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            raise ValueError("TiffSlabReader only supports slicing along the first axis.")
+        start, stop, _ = key.indices(self.shape[0])
+        if self.ndim == 2:
+            return self.pages[0].asarray()[start:stop]
+        return np.stack([self.pages[i].asarray() for i in range(start, stop)]).reshape(
+            (stop - start,) + self.shape[1:])
+
+    def close(self):
+        self.tif.close()
+
+
+def open_volume(path):
+    """
+    Open a TIFF file without loading it into memory.
+
+    Args:
+        path (str): Path to the TIFF file.
+
+    Returns:
+        np.memmap or TiffSlabReader: A read-only memory map if the file is
+        uncompressed and contiguous, else a slice by slice reader.
+    """
+    try:
+        return tifffile.memmap(path, mode='r')
+    except ValueError:
+        return TiffSlabReader(path)
+
+
+def slab_size_for_budget(shape, bytes_per_voxel, memory_budget_mb):
+    """
+    Number of slices along the first axis that fit in the memory budget.
+
+    Args:
+        shape (tuple): Shape of the volume.
+        bytes_per_voxel (int): Estimated peak bytes used per voxel of a slab.
+        memory_budget_mb (float): Memory budget in MB.
+
+    Returns:
+        int: Slab size, at least 1.
+    """
+    slice_bytes = bytes_per_voxel * int(np.prod(shape[1:]))
+    # Two extra halo slices are read with every slab
+    return max(1, int(memory_budget_mb * 1024 ** 2 // slice_bytes) - 2)
+
+
+def iter_slabs(n_slices, slab_size):
+    """Yield (start, stop) of consecutive slabs along the first axis."""
+    for start in range(0, n_slices, slab_size):
+        yield start, min(start + slab_size, n_slices)
+
+
+def threshold_slab(img, start, stop, threshold, upper_threshold=None):
+    """Binary threshold mask of ``img[start:stop]``."""
+    img_slab = np.asarray(img[start:stop])
+    if upper_threshold is not None:
+        return (img_slab >= threshold) & (img_slab <= upper_threshold)
+    return img_slab >= threshold
+
+
+def boundary_slab(boundary, start, stop):
+    """Boolean boundary mask of ``boundary[start:stop]``, or None."""
+    if boundary is None:
+        return None
+    return np.asarray(boundary[start:stop]) != 0
+
+
+def count_threshold(img, threshold, upper_threshold, slab_size):
+    """Number of voxels in the threshold mask, counted slab by slab."""
+    return sum(int(np.count_nonzero(threshold_slab(img, start, stop, threshold, upper_threshold)))
+               for start, stop in iter_slabs(img.shape[0], slab_size))
+
+
+def create_buffer(path, shape, dtype):
+    """Create a writable memory-mapped raw file used as a grow buffer."""
+    return np.memmap(path, dtype=dtype, mode='w+', shape=tuple(shape))
+
+
+def dilation_one_iter_ooc(src, dst, img, threshold, upper_threshold, slab_size,
+                          touch_rule='stop',
+                          grow_lut=None,
+                          boundary=None):
+    """
+    Perform one dilation iteration slab by slab, between two on-disk buffers.
+
+    Each slab of ``src`` is read with a one-voxel halo, grown with the threshold
+    mask computed from the same slab of ``img``, and written to ``dst``. The
+    result is the same as `grow_core.dilation_one_iter_single_pass`.
+
+    Args:
+        src (np.memmap): Labels before the iteration.
+        dst (np.memmap): Buffer the grown labels are written to.
+        img (np.ndarray or np.memmap or TiffSlabReader): Guide image.
+        threshold (int): Lower threshold.
+        upper_threshold (int or None): Upper threshold.
+        slab_size (int): Number of slices grown at once.
+        touch_rule (str): Must be 'stop', see grow_core.grow_labels_one_pass.
+        grow_lut (np.ndarray, optional): Lookup table from `grow_core.make_grow_lut`.
+        boundary (np.ndarray or np.memmap or TiffSlabReader, optional): Boundary mask.
+
+    Returns:
+        tuple: (number of voxels whose label changed, number of labelled voxels)
+    """
+    n_slices = src.shape[0]
+    n_changed = 0
+    n_labelled = 0
+    for start, stop in iter_slabs(n_slices, slab_size):
+        halo_start = max(start - 1, 0)
+        halo_stop = min(stop + 1, n_slices)
+        labels = np.asarray(src[halo_start:halo_stop])
+        grown, _ = grow_labels_one_pass(labels,
+                                        threshold_slab(img, halo_start, halo_stop,
+                                                       threshold, upper_threshold),
+                                        touch_rule=touch_rule,
+                                        grow_lut=grow_lut,
+                                        boundary=boundary_slab(boundary, halo_start, halo_stop))
+        inner = grown[start - halo_start: stop - halo_start]
+        n_changed += int(np.count_nonzero(inner != labels[start - halo_start: stop - halo_start]))
+        n_labelled += int(np.count_nonzero(inner))
+        dst[start:stop] = inner
+    dst.flush()
+    return n_changed, n_labelled
+
+
+def write_tiff_by_slab(path, volume, slab_size, lut=None):
+    """
+    Write a volume to a zlib-compressed TIFF, one slab at a time.
+
+    Args:
+        path (str): Output path.
+        volume (np.ndarray or np.memmap): Volume to write.
+        slab_size (int): Number of slices read at once.
+        lut (np.ndarray, optional): Lookup table applied to the labels before writing.
+    """
+    if volume.ndim == 2:
+        # A 2D image is a single page
+        slab = np.asarray(volume)
+        tifffile.imwrite(path, slab if lut is None else lut[slab], compression='zlib')
+        return
+
+    def pages():
+        for start, stop in iter_slabs(volume.shape[0], slab_size):
+            slab = np.asarray(volume[start:stop])
+            if lut is not None:
+                slab = lut[slab]
+            for page in slab:
+                yield page
+
+    dtype = volume.dtype if lut is None else lut.dtype
+    tifffile.imwrite(path, pages(), shape=volume.shape, dtype=dtype, compression='zlib')
+
+
+def label_sizes(volume, slab_size):
+    """Voxel count of every label id, counted slab by slab."""
+    sizes = np.zeros(1, dtype=np.int64)
+    for start, stop in iter_slabs(volume.shape[0], slab_size):
+        slab_sizes = np.bincount(np.asarray(volume[start:stop]).ravel())
+        if slab_sizes.size > sizes.size:
+            slab_sizes[:sizes.size] += sizes
+            sizes = slab_sizes
+        else:
+            sizes[:slab_sizes.size] += slab_sizes
+    return sizes
+
+
+def sort_lut(sizes, dtype):
+    """
+    Lookup table giving the ids sorted by size, as `sprout_core.reorder_segmentation`.
+
+    Args:
+        sizes (np.ndarray): Voxel count of every label id, from `label_sizes`.
+        dtype (np.dtype): Dtype of the labels.
+
+    Returns:
+        np.ndarray: Table mapping old ids to new ids, 0 stays 0.
+    """
+    lut = np.zeros(sizes.size, dtype=dtype)
+    ids = np.flatnonzero(sizes)
+    ids = ids[ids != 0]
+    # Stable sort keeps the smaller id first for equal sizes
+    ids = ids[np.argsort(-sizes[ids], kind='stable')]
+    lut[ids] = np.arange(1, ids.size + 1)
+    return lut
+
+
+def load_seed_to_buffer(seg, buffer_path, slab_size):
+    """
+    Copy the seed into an on-disk buffer, with the dtype used by `make_grow.grow_mp`.
+
+    Args:
+        seg (np.ndarray or np.memmap or TiffSlabReader): Seed labels.
+        buffer_path (str): Path of the buffer file.
+        slab_size (int): Number of slices read at once.
+
+    Returns:
+        np.memmap: Buffer holding the seed.
+    """
+    unique_ids = np.zeros(0, dtype=np.int64)
+    for start, stop in iter_slabs(seg.shape[0], slab_size):
+        unique_ids = np.union1d(unique_ids, np.unique(np.asarray(seg[start:stop])))
+    if unique_ids.size > 255:
+        print("Input mask has more than 65535 ids, converting to uint16")
+        dtype = np.uint16
+    else:
+        dtype = np.uint8
+
+    buffer = create_buffer(buffer_path, seg.shape, dtype)
+    for start, stop in iter_slabs(seg.shape[0], slab_size):
+        buffer[start:stop] = np.asarray(seg[start:stop]).astype(dtype)
+    buffer.flush()
+    return buffer
+
+
+def bytes_per_voxel(label_dtype, img_dtype):
+    """Estimated peak bytes per voxel while growing a slab."""
+    # labels in/out, neighbour max, grow source and the copy of the result,
+    # the image, and about six boolean masks
+    return 5 * np.dtype(label_dtype).itemsize + np.dtype(img_dtype).itemsize + 6
+
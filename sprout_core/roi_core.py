@@ -0,0 +1,147 @@
+import contextlib
+import threading
+
+import numpy as np
+
+
+# Work buffers of every thread, by slot
+_work = threading.local()
+
+
+def foreground_bounds(mask):
+    """
+    Bounding box of the foreground of a mask, from axis projections.
+
+    The first axis is found from one projection of the whole mask, and every
+    next axis from the projection of the part of the mask within the bounds
+    found so far, so no index array of the foreground voxels is built.
+    As in ``np.argwhere(mask == True)``, only voxels equal to True (or 1) count.
+
+    Args:
+        mask (np.ndarray): Mask, 2D or 3D.
+
+    Returns:
+        list: (min, max) index of every axis, inclusive, or None if the mask is empty.
+    """
+    if mask.dtype != bool:
+        mask = mask == True
+    bounds = []
+    sub = mask
+    for axis in range(mask.ndim):
+        other_axes = tuple(range(1, sub.ndim))
+        ids = np.flatnonzero(sub.any(axis=other_axes) if other_axes else sub)
+        if ids.size == 0:
+            return None
+        bounds.append((int(ids[0]), int(ids[-1])))
+        # The next axes only need the slices within the bounds of this one
+        sub = sub[ids[0]:ids[-1]+1].any(axis=0) if sub.ndim > 1 else sub
+    return bounds
+
+
+def foreground_region(mask, margin):
+    """
+    Slices of the bounding box of the foreground, grown by a margin.
+
+    Args:
+        mask (np.ndarray): Mask, 2D or 3D.
+        margin (int): Number of voxels added on every side, clipped to the mask.
+
+    Returns:
+        tuple: Slices of the region, or None if the mask is empty.
+    """
+    bounds = foreground_bounds(mask)
+    if bounds is None:
+        return None
+    return tuple(slice(max(lo - margin, 0), min(hi + margin, size - 1) + 1)
+                 for (lo, hi), size in zip(bounds, mask.shape))
+
+
+def work_buffer(shape, slot=0, dtype=bool):
+    """
+    Scratch array of the calling thread, reused until its work buffer scope ends.
+
+    Every thread keeps one flat buffer per slot, grown when a larger array is
+    needed, so the passes of a morphology helper do not allocate a new array
+    each. The array is only valid until the next call with the same slot, and
+    until the outermost work_buffer_scope of the thread ends.
+
+    Args:
+        shape (tuple): Shape of the array.
+        slot (int): Buffer slot, for operations that need more than one buffer.
+        dtype (np.dtype): Data type of the array.
+
+    Returns:
+        np.ndarray: Array view of the buffer, with undefined values.
+    """
+    buffers = getattr(_work, "buffers", None)
+    if buffers is None:
+        buffers = _work.buffers = {}
+    size = int(np.prod(shape))
+    key = (slot, np.dtype(dtype))
+    buffer = buffers.get(key)
+    if buffer is None or buffer.size < size:
+        buffer = buffers[key] = np.empty(size, dtype=dtype)
+    return buffer[:size].reshape(shape)
+
+
+def release_work_buffers():
+    """Free the work buffers of the calling thread."""
+    _work.buffers = {}
+
+
+@contextlib.contextmanager
+def work_buffer_scope():
+    """
+    Keep the work buffers of the calling thread until the outermost scope ends.
+
+    The morphology helpers run in a scope, so their buffers are freed when they
+    return. Callers that run helpers in a loop can wrap the loop in a scope of
+    their own to reuse the buffers between the calls.
+    """
+    _work.depth = getattr(_work, "depth", 0) + 1
+    try:
+        yield
+    finally:
+        _work.depth -= 1
+        if _work.depth == 0:
+            release_work_buffers()
+
+
+def crop_to_buffer(mask, region, slot=0):
+    """
+    Copy a region of a mask into a boolean work buffer.
+
+    Args:
+        mask (np.ndarray): Mask.
+        region (tuple): Slices of the region.
+        slot (int): Buffer slot.
+
+    Returns:
+        np.ndarray: Boolean copy of the region, in the work buffer of `slot`.
+    """
+    view = mask[region]
+    buffer = work_buffer(view.shape, slot=slot)
+    np.not_equal(view, 0, out=buffer)
+    return buffer
+
+
+if __name__ == "__main__":
+    # The morphology helpers must not leave work buffers behind in the calling thread
+    # The helpers use the imported module, not this __main__ one
+    import sprout_core.roi_core as roi_core
+    import sprout_core.sprout_core as sprout_core
+
+    mask = np.zeros((20, 40, 40), dtype=bool)
+    mask[4:16, 8:30, 10:34] = True
+    helpers = {
+        "dilation_binary_img_on_sub": lambda m: sprout_core.dilation_binary_img_on_sub(m, margin=2, kernal_size=2),
+        "erosion_binary_img_on_sub": lambda m: sprout_core.erosion_binary_img_on_sub(m, kernal_size=2),
+        "erosion_binary_img_on_sub ball_XY": lambda m: sprout_core.erosion_binary_img_on_sub(m, footprint='ball_XY'),
+        "erosion_binary_img_on_sub 2XZ_1Y": lambda m: sprout_core.erosion_binary_img_on_sub(m, footprint='2XZ_1Y'),
+        "closing_binary_img_on_sub": lambda m: sprout_core.closing_binary_img_on_sub(m, margin=2, kernal_size=2),
+        "keep_ccomps": lambda m: sprout_core.keep_ccomps(m, top_n=1),
+    }
+    for name, helper in helpers.items():
+        helper(mask.copy())
+        assert not getattr(roi_core._work, "buffers", {}), name
+    print("Work buffers are freed when the morphology helpers return")
@@ -5,7 +5,11 @@ from datetime import datetime
 import os
 import tifffile
 
-from scipy.ndimage import binary_fill_holes
+from scipy.ndimage import binary_fill_holes, distance_transform_cdt
+
+import sprout_core.config_core as config_core
+import sprout_core.roi_core as roi_core
+import sprout_core.morph_core as morph_core
 
 
 
@@ -128,173 +132,280 @@ fp_Y_2d = np.array([[0, 1, 0],
                     [0, 1, 0],
                     [0, 1, 0]],  dtype=np.uint8)
 
-def get_sub_binary_image_by_pos(image_3d, margin):
+def downsample_volume(volume, factor):
+    """
+    Downsample a volume by keeping every `factor`-th voxel along each axis.
 
+    Args:
+        volume (np.ndarray): Image, mask or label volume.
+        factor (int): Downsampling factor, 1 keeps the volume as it is.
 
-    # Find the indices where the image is 1
-    indices = np.argwhere(image_3d == True)
+    Returns:
+        np.ndarray: Downsampled view of the volume.
+    """
+    if factor < 1:
+        raise ValueError(f"Downsampling factor must be at least 1, got {factor}.")
+    return volume[(slice(None, None, factor),) * volume.ndim]
 
 
-    is_3d = (image_3d.ndim == 3)
-    if is_3d:
-        # Get the min and max indices along each dimension
-        min_z, min_y, min_x = indices.min(axis=0)
-        max_z, max_y, max_x = indices.max(axis=0)
-    else:
-        # Get the min and max indices along each dimension
-        min_y, min_x = indices.min(axis=0)
-        max_y, max_x = indices.max(axis=0)
-    # print(f"Bounding box for 3D image: x_min={min_x}, x_max={max_x}, y_min={min_y}, y_max={max_y}, z_min={min_z}, z_max={max_z}")
+def get_sub_binary_image_by_pos(image_3d, margin):
+    """
+    Crop a binary image to the bounding box of its foreground, grown by a margin.
 
-    if is_3d:
-        # Adjust the bounding box with the margin
-        min_z = max(min_z - margin, 0)
-        max_z = min(max_z + margin, image_3d.shape[0] - 1)
-        min_y = max(min_y - margin, 0)
-        max_y = min(max_y + margin, image_3d.shape[1] - 1)
-        min_x = max(min_x - margin, 0)
-        max_x = min(max_x + margin, image_3d.shape[2] - 1)
-        subset_3d = image_3d[min_z:max_z+1, min_y:max_y+1, min_x:max_x+1]
-        max_min_ids = [min_z, max_z, min_y ,max_y, min_x, max_x]
-    else:
-        min_y = max(min_y - margin, 0)
-        max_y = min(max_y + margin, image_3d.shape[0] - 1)
-        min_x = max(min_x - margin, 0)
-        max_x = min(max_x + margin, image_3d.shape[1] - 1)
-        subset_3d = image_3d[min_y:max_y+1, min_x:max_x+1]
-        max_min_ids = [ min_y ,max_y, min_x, max_x]
-    
+    The bounding box is taken from axis projections (see roi_core.foreground_bounds).
 
-    # print(f"original image shape:{image_3d.shape}, subset shape:{subset_3d.shape}")
-    
-    
-    return subset_3d, max_min_ids
+    Args:
+        image_3d (np.ndarray): Binary image, 2D or 3D.
+        margin (int): Number of voxels added on every side, clipped to the image.
 
+    Returns:
+        tuple: (subset, max_min_ids), the cropped view and its bounds as
+        [min_z, max_z, min_y, max_y, min_x, max_x] ([min_y, max_y, min_x, max_x] in 2D).
+    """
+    region = roi_core.foreground_region(image_3d, margin)
+    if region is None:
+        raise ValueError("The binary image has no foreground to crop to.")
+    max_min_ids = []
+    for axis_slice in region:
+        max_min_ids += [axis_slice.start, axis_slice.stop - 1]
+    return image_3d[region], max_min_ids
 
-def dilation_binary_img_on_sub(input, margin, kernal_size, is_round=True):
+
+def dilation_binary_img_on_sub(input, margin, kernal_size, is_round=True, backend=None):
     
     if margin <=kernal_size:
         margin = kernal_size + 1
     
+    # The dilation is written in place into the bounding box of the foreground
+    region = roi_core.foreground_region(input, margin)
+    if region is None:
+        return input
+    
     is_3d = (input.ndim == 3)
     if is_3d:
-        
-        if len(np.argwhere(input == True)) == 0:
-            return input
-        else:
-            subset_3d , max_min_ids= get_sub_binary_image_by_pos(input, margin = margin)
-            min_z, max_z, min_y ,max_y, min_x, max_x = max_min_ids
-
-            if is_round:
-                subset_3d = binary_dilation(subset_3d, ball(kernal_size))
-            else:
-                subset_3d = binary_dilation(subset_3d, cube(kernal_size))
-
-
-            input[min_z:max_z+1, min_y:max_y+1, min_x:max_x+1] = subset_3d
+        footprint = ball(kernal_size) if is_round else cube(kernal_size)
     else:
-        subset_2d , max_min_ids= get_sub_binary_image_by_pos(input, margin = margin)
-        min_y ,max_y, min_x, max_x = max_min_ids
-
-        if is_round:
-            subset_2d = binary_dilation(subset_2d, disk(kernal_size))
-        else:
-            subset_2d = binary_dilation(subset_2d, square(kernal_size))
-        input[min_y:max_y+1, min_x:max_x+1] = subset_2d
+        footprint = disk(kernal_size) if is_round else square(kernal_size)
+    backend = morph_core.get_backend(backend, 'ball' if is_round else 'cube', input.ndim)
+    # The work buffers are freed when the scope ends
+    with roi_core.work_buffer_scope():
+        backend.dilate(roi_core.crop_to_buffer(input, region), footprint, out=input[region])
     
     return input
 
-def erosion_binary_img_on_sub(input, kernal_size = 1, footprint='ball'):
+def erosion_binary_img_on_sub(input, kernal_size = 1, footprint='ball', backend=None, num_threads=1):
     
     if footprint == 'ball' or footprint == 'cube':
         assert type(kernal_size) is int
     
     is_3d = (input.ndim == 3)
     if is_3d:
-        if len(np.argwhere(input == True)) == 0:
-            return input
+        if footprint in composite_footprints:
+            # One pass per structure of the step, e.g. both ball_XZ erosions of '2XZ_1Y' at once
+            return erosion_binary_img_multi_step(input, [footprint], backend=backend,
+                                                 num_threads=num_threads)
+        if footprint == 'ball':
+            structure = ball(kernal_size)
+        elif footprint == 'cube':
+            structure = cube(kernal_size)
         else:
-            subset_3d , max_min_ids= get_sub_binary_image_by_pos(input, margin = 1)
-            min_z, max_z, min_y ,max_y, min_x, max_x = max_min_ids
-
-            if footprint == 'ball':
-                subset_3d = binary_erosion(subset_3d, ball(kernal_size))
-            elif footprint == 'cube':
-                subset_3d = binary_erosion(subset_3d, cube(kernal_size))
-            elif footprint =='ball_XY':
-                subset_3d = binary_erosion(subset_3d, ball_fp_XY)
-            elif footprint =='ball_XZ':
-                subset_3d = binary_erosion(subset_3d, ball_fp_XZ)
-            elif footprint =='ball_YZ':
-                subset_3d = binary_erosion(subset_3d, ball_fp_YZ)
-            elif footprint =='X':
-                subset_3d = binary_erosion(subset_3d, fp_X)
-            elif footprint =='Y':
-                subset_3d = binary_erosion(subset_3d, fp_Y)
-            elif footprint =='Z':
-                subset_3d = binary_erosion(subset_3d, fp_Z)
-            elif footprint =='2XZ_1Y':
-                subset_3d = binary_erosion(subset_3d, ball_fp_XZ)
-                subset_3d = binary_erosion(subset_3d, ball_fp_XZ)
-                subset_3d = binary_erosion(subset_3d, fp_Y)
-            elif footprint =='2XY_1Z':
-                subset_3d = binary_erosion(subset_3d, ball_fp_XY)
-                subset_3d = binary_erosion(subset_3d, ball_fp_XY)
-                subset_3d = binary_erosion(subset_3d, fp_Z)
-            elif footprint =='2YZ_1X':
-                subset_3d = binary_erosion(subset_3d, ball_fp_YZ)
-                subset_3d = binary_erosion(subset_3d, ball_fp_YZ)
-                subset_3d = binary_erosion(subset_3d, fp_X)
-
-            
-            input[min_z:max_z+1, min_y:max_y+1, min_x:max_x+1] = subset_3d
+            structure = {'ball_XY': ball_fp_XY, 'ball_XZ': ball_fp_XZ, 'ball_YZ': ball_fp_YZ,
+                         'X': fp_X, 'Y': fp_Y, 'Z': fp_Z}.get(footprint)
     else:
-        subset_2d , max_min_ids= get_sub_binary_image_by_pos(input, margin = 1)
-        min_y ,max_y, min_x, max_x = max_min_ids
-        
         if footprint == 'disk' or footprint == 'ball':
-            subset_2d = binary_erosion(subset_2d, disk(kernal_size))
+            structure = disk(kernal_size)
         elif footprint == 'square' or footprint == 'cube':
-            subset_2d = binary_erosion(subset_2d, square(kernal_size))
-        elif footprint =='X':
-            subset_2d = binary_erosion(subset_2d, fp_X_2d)
-        elif footprint =='Y':
-            subset_2d = binary_erosion(subset_2d, fp_Y_2d)
-            
-        input[min_y:max_y+1, min_x:max_x+1] = subset_2d
-        # input = binary_erosion(input, square(kernal_size))
+            structure = square(kernal_size)
+        else:
+            structure = {'X': fp_X_2d, 'Y': fp_Y_2d}.get(footprint)
+    
+    if structure is None:
+        return input
+    
+    # The erosion is written in place into the bounding box of the foreground
+    region = roi_core.foreground_region(input, 1)
+    if region is None:
+        return input
+    if input.dtype == bool and morph_core.planar_axis(structure) is not None:
+        # Planar footprints erode slice by slice, without a 3D copy of the region
+        morph_core.erode_slices(input[region], structure, backend=backend,
+                                num_threads=num_threads, footprint=footprint)
+        return input
+    backend = morph_core.get_backend(backend, footprint, input.ndim)
+    with roi_core.work_buffer_scope():
+        backend.erode(roi_core.crop_to_buffer(input, region), structure, out=input[region])
     
     return input
 
 
-def closing_binary_img_on_sub(input, margin, kernal_size, is_round=True):
+def get_erosion_structure(footprint, ndim):
+    """
+    Structuring element of one erosion step of erosion_binary_img_on_sub.
+
+    Args:
+        footprint (str): Footprint name.
+        ndim (int): Number of dimensions of the mask, 2 or 3.
+
+    Returns:
+        np.ndarray: Structure of size 3 along every axis, or None for footprints
+        that erode with several structures in one step (e.g. '2XZ_1Y').
+    """
+    if ndim == 3:
+        structures = {'ball': ball(1), 'cube': cube(1),
+                      'ball_XY': ball_fp_XY, 'ball_XZ': ball_fp_XZ, 'ball_YZ': ball_fp_YZ,
+                      'X': fp_X, 'Y': fp_Y, 'Z': fp_Z}
+    else:
+        structures = {'ball': disk(1), 'disk': disk(1), 'cube': square(1), 'square': square(1),
+                      'X': fp_X_2d, 'Y': fp_Y_2d}
+    structure = structures.get(footprint, None)
+    if structure is None:
+        return None
+    # cube(1) and square(1) are a single voxel
+    pad = [((3 - size) // 2, (3 - size) // 2) for size in structure.shape]
+    return np.pad(structure.astype(bool), pad)
+
+
+def erosion_distance(volume_label, footprint):
+    """
+    Number of erosion steps every voxel survives, with one distance transform.
+
+    Eroding `volume_label` k times with erosion_binary_img_on_sub and
+    `footprint` keeps exactly the voxels with ``distance > k``. The distance is
+    the chamfer distance with unit steps along the footprint, e.g. the taxicab
+    distance for 'ball', or the distance within each plane for 'ball_XY'.
+    As in the erosion, the outside of the volume counts as foreground, and
+    voxels that no background can reach along the footprint are never eroded.
+
+    Args:
+        volume_label (np.ndarray): Binary mask.
+        footprint (str): Footprint name used for every erosion step.
+
+    Returns:
+        np.ndarray: int32 distance, 0 on the background, or None if the
+        footprint has no distance transform (see get_erosion_structure).
+    """
+    structure = get_erosion_structure(footprint, volume_label.ndim)
+    if structure is None:
+        return None
+    if not volume_label.any():
+        return np.zeros(volume_label.shape, dtype=np.int32)
+    distance = distance_transform_cdt(volume_label, metric=structure)
+    distance[distance < 0] = np.iinfo(distance.dtype).max
+    return distance
+
+
+# Structures of one erosion step of the footprints that erode more than once per step
+composite_footprints = {'2XZ_1Y': ['ball_XZ', 'ball_XZ', 'Y'],
+                        '2XY_1Z': ['ball_XY', 'ball_XY', 'Z'],
+                        '2YZ_1X': ['ball_YZ', 'ball_YZ', 'X']}
+
+
+def plan_erosion(footprints, ndim):
+    """
+    Fuse a list of erosion steps into as few erosion passes as possible.
+
+    Composite footprints (e.g. '2XZ_1Y') are split into the structures they
+    erode with, and each structure becomes one pass with the number of times it
+    is used. Erosions by these flat structures commute, also at the border of
+    the volume, so the passes erode the same as the steps in their order.
+    Single-voxel structures ('cube' and 'square') keep the mask and are dropped.
+
+    Args:
+        footprints (list): Footprint name of every erosion step, as from
+            config_core.check_and_assign_footprint.
+        ndim (int): Number of dimensions of the mask, 2 or 3.
+
+    Returns:
+        list: (footprint, structure, iterations) of every pass.
+    """
+    counts = {}
+    for footprint in footprints:
+        parts = composite_footprints.get(footprint, [footprint]) if ndim == 3 else [footprint]
+        for part in parts:
+            counts[part] = counts.get(part, 0) + 1
+
+    passes = []
+    for part, iterations in counts.items():
+        structure = get_erosion_structure(part, ndim)
+        if structure is None:
+            raise ValueError(f"Footprint {part} is not supported for a {ndim}D mask.")
+        if structure.sum() > 1:
+            passes.append((part, structure, iterations))
+    return passes
+
+
+def erosion_binary_img_multi_step(input, footprints, backend=None, num_threads=1):
+    """
+    Erode a binary mask with several erosion steps in fused passes.
+
+    Same result as calling erosion_binary_img_on_sub once per footprint, for
+    when only the mask after the last step is needed. The steps are fused by
+    plan_erosion, and the bounding box of the mask is only computed once, as
+    erosion never grows it.
+
+    Args:
+        input (np.ndarray): Binary mask, modified in place.
+        footprints (list): Footprint name of every erosion step.
+        backend (str, optional): Morphology backend, see morph_core.get_backend.
+            Defaults to 'scipy', which runs the iterations of a pass in one call.
+        num_threads (int): Number of threads of the passes with a planar
+            structure (e.g. 'ball_XY' or 'Z'), which run slice by slice in
+            place (see morph_core.erode_slices).
+
+    Returns:
+        np.ndarray: Eroded mask.
+    """
+    passes = plan_erosion(footprints, input.ndim)
+    if not passes:
+        return input
+    region = roi_core.foreground_region(input, 1)
+    if region is None:
+        return input
+
+    # Passes with a planar structure erode the mask in place, slice by slice,
+    # after the others, as erosions commute
+    if input.dtype == bool:
+        sliced = [one_pass for one_pass in passes if morph_core.planar_axis(one_pass[1]) is not None]
+        passes = [one_pass for one_pass in passes if morph_core.planar_axis(one_pass[1]) is None]
+    else:
+        sliced = []
+
+    # Passes alternate between two work buffers, the last one writes into the mask
+    with roi_core.work_buffer_scope():
+        if passes:
+            subset = roi_core.crop_to_buffer(input, region)
+        for i_pass, (footprint, structure, iterations) in enumerate(passes):
+            if i_pass == len(passes) - 1:
+                output = input[region]
+            else:
+                output = roi_core.work_buffer(subset.shape, slot=(i_pass + 1) % 2)
+            morph_core.get_backend(backend, footprint, input.ndim, default='scipy').erode(
+                subset, structure, iterations=iterations, out=output)
+            subset = output
+    for footprint, structure, iterations in sliced:
+        morph_core.erode_slices(input[region], structure, iterations=iterations,
+                                backend=backend if backend else 'scipy', num_threads=num_threads,
+                                footprint=footprint)
+    return input
+
+
+def closing_binary_img_on_sub(input, margin, kernal_size, is_round=True, backend=None):
     if margin <=kernal_size:
         margin = kernal_size + 1
-        
+    
+    # The closing is written in place into the bounding box of the foreground
+    region = roi_core.foreground_region(input, margin)
+    if region is None:
+        return input
+    
     is_3d = (input.ndim == 3)
     if is_3d:
-        if len(np.argwhere(input == True)) == 0:
-            return input
-        else:
-        
-            subset_3d , max_min_ids= get_sub_binary_image_by_pos(input, margin = margin)
-            min_z, max_z, min_y ,max_y, min_x, max_x = max_min_ids
-
-            if is_round:
-                subset_3d = binary_closing(subset_3d, ball(kernal_size))
-            else:
-                subset_3d = binary_closing(subset_3d, cube(kernal_size))
-
-            # subset_3d = binary_closing(subset_3d, cube(kernal_size))
-            input[min_z:max_z+1, min_y:max_y+1, min_x:max_x+1] = subset_3d
+        footprint = ball(kernal_size) if is_round else cube(kernal_size)
     else:
-        subset_2d , max_min_ids= get_sub_binary_image_by_pos(input, margin = margin)
-        min_y ,max_y, min_x, max_x = max_min_ids
-        if is_round:
-            subset_2d = binary_closing(subset_2d, disk(kernal_size))
-        else:
-            subset_2d = binary_closing(subset_2d, square(kernal_size))
-        input[min_y:max_y+1, min_x:max_x+1] = subset_2d
+        footprint = disk(kernal_size) if is_round else square(kernal_size)
+    backend = morph_core.get_backend(backend, 'ball' if is_round else 'cube', input.ndim)
+    with roi_core.work_buffer_scope():
+        backend.close(roi_core.crop_to_buffer(input, region), footprint, out=input[region])
     
     return input
 
@@ -386,52 +497,58 @@ def keep_ccomps(input, top_n=None , threshold=0):
     else:
         largest_labels = component_labels
 
-    # Create an output image with only the desired components retained
-    output_sub = np.zeros_like(subset_3d)
-    for label in largest_labels:
-        output_sub[labeled_image == label] = 1
+    # Create an output image with only the desired components retained,
+    # with one lookup of the kept labels
+    keep_lut = np.zeros(int(labeled_image.max()) + 1, dtype=input.dtype)
+    keep_lut[largest_labels] = 1
         
     output = np.zeros_like(input)
-    output[min_z:max_z+1, min_y:max_y+1, min_x:max_x+1] = output_sub
+    output[min_z:max_z+1, min_y:max_y+1, min_x:max_x+1] = keep_lut[labeled_image]
     
     return output
 
 
-def get_ccomps_with_size_order(volume, segments=None, min_vol = None):
-    """Get the largest ccomp
+def get_ccomps_with_size_order(volume, segments=None, min_vol = None, backend=None):
+    """Get the largest ccomps, labelled by size
+
+    The components are counted with the labelling (one bincount, or the
+    component statistics of OpenCV), and the labels are remapped with one
+    lookup table pass.
 
     Args:
-        label (_type_): _description_
-        segments (_type_): _description_
+        volume (np.ndarray): Binary volume.
+        segments (int, optional): Number of components to keep. If None, keep all.
+        min_vol (int, optional): Minimum size of the components to keep.
+        backend (str, optional): Backend of the labelling, see morph_core.get_backend.
+            Defaults to 'skimage'.
 
     Returns:
-        _type_: _description_
+        tuple: (output, sizes). `output` labels the kept components from 1 for
+        the largest, in the smallest unsigned dtype that holds their number.
+        Components of the same size are in the order `np.argsort(sizes)[::-1]`
+        gives them.
+        `sizes` are their sizes, largest first.
     """
-    labeled_image = measure.label(volume, background=0, 
-                                  return_num=False)
-    component_sizes = np.bincount(labeled_image.ravel())[1:] 
-    
-    
+    labeled_image, label_sizes = morph_core.get_backend(backend, None, volume.ndim).label_with_sizes(volume)
     
-    component_labels = np.unique(labeled_image)[1:]
+    component_labels = np.arange(1, label_sizes.size)
+    component_sizes = label_sizes[1:]
     if min_vol is not None:
         valid_components = component_sizes >= min_vol
         component_labels = component_labels[valid_components]
         component_sizes = component_sizes[valid_components]
         
-    component_sizes_sorted = -np.sort(-component_sizes,)
-    if segments is None:
-        segments = len(component_sizes_sorted)
-    elif segments> len(component_sizes_sorted):
-        segments = len(component_sizes_sorted)
-    # props = measure.regionprops(label_image)
-    largest_labels = component_labels[np.argsort(component_sizes)[::-1][:segments]]
+    if segments is None or segments > len(component_sizes):
+        segments = len(component_sizes)
     
-    output = np.zeros_like(labeled_image)
-    for label_id, label in enumerate(largest_labels):
-        output[labeled_image == label] = label_id+1
+    # The same sort as before, so components of the same size are kept in the same order
+    order = np.argsort(component_sizes)[::-1][:segments]
     
-    return output, component_sizes_sorted[:segments]
+    lut = np.zeros(label_sizes.size, dtype=np.min_scalar_type(segments))
+    lut[component_labels[order]] = np.arange(1, segments + 1)
+    output = lut[labeled_image]
+    
+    return output, component_sizes[order]
 
 
 ## For junctions finding
@@ -730,52 +847,76 @@ def find_seed_by_ero_custom(volume_array, threshold , segments, ero_iter,
                     footprints = None,
                     upper_threshold = None,
                     boundary = None ,
-                    is_return_seeds = False):
+                    is_return_seeds = False,
+                    threshold_levels = None,
+                    erosion_mode = 'iterative',
+                    save_seeds = True,
+                    morph_backend = None,
+                    num_threads = 1):
      # Capture the start time
     start_time = datetime.now()
     
     seeds_dict = {}
+    if erosion_mode not in ('iterative', 'distance'):
+        raise ValueError(f"Unknown erosion_mode: {erosion_mode}. Must be 'iterative' or 'distance'.")
     
     # Thresholding 
-    if upper_threshold is None:
+    # threshold_levels (threshold_core.ThresholdLevels) replaces volume_array if given
+    if threshold_levels is not None:
+        volume_label = threshold_levels.mask(threshold, upper_threshold)
+    elif upper_threshold is None:
         volume_label = volume_array >= threshold
     else:
         volume_label = (volume_array>=threshold) & (volume_array<=upper_threshold)
     
     # Use boundary if provided.
     if boundary is not None:
-        boundary = check_and_cast_boundary(boundary)
+        boundary = config_core.check_and_cast_boundary(boundary)
         volume_label[boundary] = False
     
     # Logging
     log_dict = {"Method": "find_seed_by_ero_custom",
-                  "volume_array shape": list(volume_array.shape),
+                  "volume_array shape": list(volume_label.shape),
                   "threshold": threshold,
                   "upper threshold": upper_threshold,
                   "segments": segments,
                   "footprints": footprints,
+                  "erosion_mode": erosion_mode,
                   "Whole Volume": int(np.sum(volume_label)),
                   "seeds": []
                   }
     
+    # In distance mode, every erosion level is a threshold of one distance transform
+    distance = None
+    if erosion_mode == 'distance' and ero_iter > 0:
+        if len(set(footprints[:ero_iter])) == 1:
+            distance = erosion_distance(volume_label, footprints[0])
+        if distance is None:
+            print(f"No distance transform for the footprints {footprints}, eroding step by step")
 
     for i_iter in range(0,ero_iter+1):
         
-        if i_iter!=0:
+        if distance is not None:
+            volume_label = distance > i_iter
+        elif i_iter!=0:
             volume_label = erosion_binary_img_on_sub(volume_label, 
-                                                                   footprint = footprints[i_iter-1])
+                                                                   footprint = footprints[i_iter-1],
+                                                                   backend = morph_backend,
+                                                                   num_threads = num_threads)
                                                                 #    footprint='ball_YZ')      
 
         # Connected components
-        seed, ccomp_sizes = get_ccomps_with_size_order(volume_label,segments)
+        seed, ccomp_sizes = get_ccomps_with_size_order(volume_label,segments, backend=morph_backend)
         
         # Save seed from each threshold, ero combination
         seed_name = f"seed_ero_{i_iter}_thre{threshold}_{upper_threshold}_segs_{segments}.tif"
         seed_file = os.path.join(output_dir, 
                     seed_name)
 
-        tifffile.imwrite(seed_file, seed.astype('uint16'),
-                         compression ='zlib')
+        # Without saving, only the component sizes are logged (dry run)
+        if save_seeds:
+            tifffile.imwrite(seed_file, seed.astype('uint16'),
+                             compression ='zlib')
         
         if is_return_seeds:
             seeds_dict[os.path.basename(output_dir) + "_" +seed_name] = seed
@@ -788,7 +929,7 @@ def find_seed_by_ero_custom(volume_array, threshold , segments, ero_iter,
             'size_ccomp': ccomp_sizes.tolist(),
             'number_of_ccomps': len(ccomp_sizes.tolist()),
             'output_seed_dir': output_dir,
-            'output_path': os.path.abspath(seed_file)
+            'output_path': os.path.abspath(seed_file) if save_seeds else None
         }
         
         log_dict["seeds"].append(args_dict)
@@ -0,0 +1,155 @@
+import threading
+import numpy as np
+
+from sprout_core.mask_core import PackedMask
+
+
+def _lower_cut(value, dtype):
+    # Smallest value of the image dtype that passes `img >= value`
+    if np.issubdtype(dtype, np.integer):
+        return int(np.ceil(value))
+    # NumPy compares a float image with a Python float in the image dtype
+    return dtype.type(value)
+
+
+def _upper_cut(value, dtype):
+    # Smallest value of the image dtype that fails `img <= value`
+    if np.issubdtype(dtype, np.integer):
+        return int(np.floor(value)) + 1
+    return np.nextafter(dtype.type(value), dtype.type(np.inf))
+
+
+class ThresholdLevels:
+    """
+    Compact volume of threshold levels, shared by all thresholds of a run.
+
+    Every lower and upper threshold is turned into a cut value, and each voxel
+    stores how many of the sorted cuts it passes. Any configured threshold mask
+    is then a comparison on the uint8 (or uint16 for more than 255 cuts) level
+    volume, and the raw image is no longer needed.
+
+    Args:
+        img (np.ndarray): Input image.
+        thresholds (list): Lower thresholds.
+        upper_thresholds (list, optional): Upper thresholds, same length as
+            `thresholds`, entries can be None.
+        slab_size (int): Number of slices along the first axis processed at once.
+        cache_masks (bool): Keep every packed mask once built, for levels shared by
+            several runs (e.g. several seeds grown on one image).
+    """
+
+    def __init__(self, img, thresholds, upper_thresholds=None, slab_size=16, cache_masks=False):
+        if upper_thresholds is None:
+            upper_thresholds = [None] * len(thresholds)
+        self.cache_masks = cache_masks
+        self._packed_masks = {}
+        self._lock = threading.Lock()
+        self.img_dtype = img.dtype
+        self.shape = img.shape
+        self.ndim = img.ndim
+
+        cuts = [_lower_cut(t, img.dtype) for t in thresholds]
+        cuts += [_upper_cut(u, img.dtype) for u in upper_thresholds if u is not None]
+        cut_dtype = np.int64 if np.issubdtype(img.dtype, np.integer) else img.dtype
+        self.cuts = np.unique(np.array(cuts, dtype=cut_dtype))
+
+        level_dtype = np.uint8 if self.cuts.size <= np.iinfo(np.uint8).max else np.uint16
+        self.levels = np.empty(img.shape, dtype=level_dtype)
+        for start in range(0, img.shape[0], slab_size):
+            stop = min(start + slab_size, img.shape[0])
+            self.levels[start:stop] = np.searchsorted(self.cuts, img[start:stop], side='right')
+
+    def _level_of(self, cut):
+        position = int(np.searchsorted(self.cuts, cut))
+        if position >= self.cuts.size or self.cuts[position] != cut:
+            raise ValueError(f"Threshold cut {cut} was not used to build the threshold levels.")
+        return position + 1
+
+    def level(self, threshold):
+        """
+        Level of a lower threshold, ``img >= threshold`` is ``levels >= level``.
+
+        Args:
+            threshold (int or float): Lower threshold, one of the configured thresholds.
+
+        Returns:
+            int: Level of the threshold.
+        """
+        return self._level_of(_lower_cut(threshold, self.img_dtype))
+
+    def mask(self, threshold, upper_threshold=None):
+        """
+        Binary mask of ``(img >= threshold) & (img <= upper_threshold)``.
+
+        Args:
+            threshold (int or float): Lower threshold, one of the configured thresholds.
+            upper_threshold (int or float, optional): Upper threshold.
+
+        Returns:
+            np.ndarray: Boolean mask.
+        """
+        return self._mask_of_levels(self.levels, threshold, upper_threshold)
+
+    def packed_mask(self, threshold, upper_threshold=None, slab_size=16):
+        """
+        Same as `mask`, as a `mask_core.PackedMask` built slab by slab.
+
+        The boolean mask of the whole volume is never held in memory.
+
+        Args:
+            threshold (int or float): Lower threshold, one of the configured thresholds.
+            upper_threshold (int or float, optional): Upper threshold.
+            slab_size (int): Number of slices along the first axis processed at once.
+
+        Returns:
+            PackedMask: Packed boolean mask. With `cache_masks`, the same mask is
+            returned for every call, and must not be modified.
+        """
+        key = (threshold, upper_threshold)
+        if self.cache_masks:
+            with self._lock:
+                if key in self._packed_masks:
+                    return self._packed_masks[key]
+
+        packed = PackedMask(shape=self.shape)
+        for start in range(0, self.shape[0], slab_size):
+            stop = min(start + slab_size, self.shape[0])
+            packed[start:stop] = self._mask_of_levels(self.levels[start:stop],
+                                                      threshold, upper_threshold)
+        if self.cache_masks:
+            with self._lock:
+                packed = self._packed_masks.setdefault(key, packed)
+        return packed
+
+    def _mask_of_levels(self, levels, threshold, upper_threshold):
+        mask = levels >= self.level(threshold)
+        if upper_threshold is not None:
+            mask &= levels < self._level_of(_upper_cut(upper_threshold, self.img_dtype))
+        return mask
+
+    def exclude(self, boundary):
+        """
+        Exclude voxels from every threshold mask, e.g. a boundary.
+
+        Args:
+            boundary (np.ndarray): Boolean mask of the voxels to exclude.
+        """
+        self.levels[boundary] = 0
+        self._packed_masks = {}
+
+
+if __name__ == "__main__":
+    # The threshold masks must be the same as comparing the raw image, also for
+    # float images and thresholds that the image dtype can not represent
+    rng = np.random.default_rng(0)
+    for dtype in (np.float32, np.float64, np.uint8, np.uint16):
+        values = [0.1, 0.7, 1/3, 0.5, 2.0, 100.5]
+        img = np.concatenate([np.array(values, dtype=dtype),
+                              (rng.random(1000) * 200).astype(dtype)]).reshape(1, 1, -1)
+        lowers = [0.1, 0.7, 1/3, 100.5]
+        uppers = [0.7, None, 2.0, 150.25]
+        threshold_levels = ThresholdLevels(img, lowers, uppers)
+        for lower, upper in zip(lowers, uppers):
+            expected = img >= lower if upper is None else (img >= lower) & (img <= upper)
+            assert np.array_equal(threshold_levels.mask(lower, upper), expected), (dtype, lower, upper)
+    print("Threshold masks match the raw comparisons")
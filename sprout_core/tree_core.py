@@ -0,0 +1,199 @@
+import itertools
+
+import numpy as np
+from scipy import ndimage, sparse
+from scipy.sparse import csgraph
+from skimage import measure
+
+from sprout_core.sprout_core import get_erosion_structure
+
+
+def erode_levels(levels, footprint):
+    """
+    One erosion step of every threshold mask of a levels volume at once.
+
+    For a flat footprint, eroding ``levels >= k`` is the same as thresholding the
+    grey erosion of the levels, so ``erode_levels(levels, footprint) >= k`` is
+    ``sprout_core.erosion_binary_img_on_sub(levels >= k, footprint=footprint)``
+    for every level k, with the outside of the volume kept as foreground.
+
+    Args:
+        levels (np.ndarray): Levels volume (see threshold_core.ThresholdLevels).
+        footprint (str): Footprint name, see sprout_core.get_erosion_structure.
+
+    Returns:
+        np.ndarray: Eroded levels.
+    """
+    structure = get_erosion_structure(footprint, levels.ndim)
+    if structure is None:
+        raise ValueError(f"Footprint {footprint} is not supported for eroding threshold levels.")
+    return ndimage.grey_erosion(levels, footprint=structure, mode='constant',
+                                cval=np.iinfo(levels.dtype).max)
+
+
+class ComponentTree:
+    """
+    Components of every threshold of a levels volume, from its graph of flat zones.
+
+    The volume is split once into flat zones, the connected regions of voxels
+    with the same level, and the graph of touching zones is built once. The
+    components of ``levels >= k`` are the connected groups of zones with a level
+    of at least k, so each level is labelled with one connected components pass
+    over the zone graph (cached per level), not over the voxels. This is not a
+    max-tree built by union-find: the nesting of the components of two levels
+    is read with `parents`. Components use full connectivity, as in
+    `sprout_core.get_ccomps_with_size_order`, are numbered in labelling order,
+    and are ordered the same way, with ``np.argsort(sizes)[::-1]``.
+
+    The zone label of every voxel is kept, the rest is per zone.
+
+    Args:
+        levels (np.ndarray): Levels volume (see threshold_core.ThresholdLevels),
+            0 for voxels below every threshold.
+    """
+
+    def __init__(self, levels):
+        self.shape = levels.shape
+        # Zones are labelled in raster order, so the smallest zone of a component
+        # gives its labelling order
+        self.voxel_zone = measure.label(levels, background=0, connectivity=levels.ndim)
+        n_zones = int(self.voxel_zone.max()) + 1
+        self.zone_size = np.bincount(self.voxel_zone.ravel(), minlength=n_zones).astype(np.int64)
+        self.zone_level = np.zeros(n_zones, dtype=levels.dtype)
+        self.zone_level[self.voxel_zone.ravel()] = levels.ravel()
+
+        # Pairs of touching zones, from one shifted comparison per neighbour offset
+        pairs = []
+        for offset in itertools.product((-1, 0, 1), repeat=levels.ndim):
+            if offset <= (0,) * levels.ndim:
+                continue
+            source = tuple(slice(max(0, -d), size - max(0, d)) for d, size in zip(offset, levels.shape))
+            target = tuple(slice(max(0, d), size - max(0, -d)) for d, size in zip(offset, levels.shape))
+            zones_a = self.voxel_zone[source]
+            zones_b = self.voxel_zone[target]
+            touching = (zones_a != zones_b) & (zones_a != 0) & (zones_b != 0)
+            zones_a = zones_a[touching]
+            zones_b = zones_b[touching]
+            pairs.append(np.unique(np.minimum(zones_a, zones_b).astype(np.int64) * n_zones +
+                                   np.maximum(zones_a, zones_b)))
+        pairs = np.unique(np.concatenate(pairs)) if pairs else np.zeros(0, dtype=np.int64)
+        self.edges = np.stack([pairs // n_zones, pairs % n_zones])
+        self.edge_level = np.minimum(self.zone_level[self.edges[0]], self.zone_level[self.edges[1]])
+        self._components = {}
+
+    def _zone_components(self, level):
+        # Component of every zone at `level`, -1 for zones below it
+        if level not in self._components:
+            n_zones = self.zone_level.size
+            edges = self.edges[:, self.edge_level >= level]
+            graph = sparse.coo_matrix((np.ones(edges.shape[1], dtype=bool), (edges[0], edges[1])),
+                                      shape=(n_zones, n_zones))
+            _, zone_component = csgraph.connected_components(graph, directed=False)
+            above = self.zone_level >= level
+            above[0] = False
+            # Components numbered from 0, in the order of their smallest zone
+            ids, zone_component = np.unique(np.where(above, zone_component, -1), return_inverse=True)
+            zone_component = zone_component.astype(np.int64) - (ids[0] == -1)
+            self._components[level] = zone_component
+        return self._components[level]
+
+    def components(self, level, segments=None):
+        """
+        Largest components of ``levels >= level``.
+
+        Args:
+            level (int): Level, at least 1.
+            segments (int, optional): Number of components. If None, all of them.
+
+        Returns:
+            tuple: (components, sizes), the component ids at this level and their
+            sizes, largest first.
+        """
+        if level < 1:
+            raise ValueError(f"Level must be at least 1, got {level}.")
+        zone_component = self._zone_components(level)
+        above = zone_component >= 0
+        sizes = np.bincount(zone_component[above], weights=self.zone_size[above],
+                            minlength=int(zone_component.max()) + 1).astype(np.int64)
+        # The same sort as get_ccomps_with_size_order, so ties keep the same components
+        order = np.argsort(sizes)[::-1][:segments]
+        return order, sizes[order]
+
+    def parents(self, level):
+        """
+        Component of ``levels >= level - 1`` that holds each component of ``levels >= level``.
+
+        Args:
+            level (int): Level, at least 2.
+
+        Returns:
+            np.ndarray: Parent component id of every component id at `level`.
+        """
+        zone_component = self._zone_components(level)
+        parent_component = self._zone_components(level - 1)
+        parents = np.zeros(int(zone_component.max()) + 1, dtype=np.int64)
+        above = zone_component >= 0
+        parents[zone_component[above]] = parent_component[above]
+        return parents
+
+    def volume(self, level):
+        """Number of voxels of ``levels >= level``."""
+        return int(self.zone_size[1:][self.zone_level[1:] >= level].sum())
+
+    def seed(self, level, segments=None):
+        """
+        Seed of ``levels >= level``, as `sprout_core.get_ccomps_with_size_order` labels it.
+
+        Args:
+            level (int): Level, at least 1.
+            segments (int, optional): Number of components to keep. If None, keep all.
+
+        Returns:
+            tuple: (seed, sizes), the seed with the kept components labelled from 1
+            for the largest, and their sizes.
+        """
+        components, sizes = self.components(level, segments)
+        zone_component = self._zone_components(level)
+        lut = np.zeros(int(zone_component.max()) + 2, dtype=np.min_scalar_type(components.size))
+        lut[components + 1] = np.arange(1, components.size + 1)
+        return lut[zone_component + 1][self.voxel_zone], sizes
+
+
+if __name__ == "__main__":
+    # Seeds and logs of seed_engine 'component_tree' must be the same as 'label',
+    # also when components of the same size straddle the `segments` cut
+    import glob
+    import json
+    import os
+    import tempfile
+    import make_seeds
+
+    img = np.zeros((9, 40, 60), dtype=np.uint8)
+    for blob_id in range(16):
+        # Equal 3x3x3 cubes at three intensities, and a few larger blobs
+        y, x = 4 + 9 * (blob_id // 6), 4 + 9 * (blob_id % 6)
+        size = 5 if blob_id % 7 == 0 else 3
+        img[2:2 + size, y:y + size, x:x + size] = 100 + 50 * (blob_id % 3)
+
+    def run_engine(seed_engine, output_folder):
+        seeds, log = make_seeds.make_seeds(img=img, output_folder=output_folder, base_name="tied",
+                                           thresholds=[90, 140, 190], erosion_steps=1, segments=4,
+                                           footprints=['ball'], num_threads=1,
+                                           seed_engine=seed_engine, return_for_napari=True)
+        logs = []
+        for log_file in sorted(glob.glob(os.path.join(log["output_seed_sub_folders"][0], "seed_log_*.json"))):
+            with open(log_file) as file:
+                logs += json.load(file)
+        # Sizes and counts of every seed, by threshold
+        logs = {entry["threshold"]: [(seed["ero_iter"], seed["size_ccomp"], seed["number_of_ccomps"])
+                                     for seed in entry["seeds"]] for entry in logs}
+        return seeds, logs
+
+    with tempfile.TemporaryDirectory() as output_folder:
+        label_seeds, label_logs = run_engine('label', os.path.join(output_folder, "label"))
+        tree_seeds, tree_logs = run_engine('component_tree', os.path.join(output_folder, "tree"))
+    assert label_seeds.keys() == tree_seeds.keys()
+    for name in label_seeds:
+        assert np.array_equal(label_seeds[name], tree_seeds[name]), name
+    assert label_logs == tree_logs
+    print("Seeds and logs of the component_tree engine match the label engine")
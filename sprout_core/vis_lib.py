@@ -2,6 +2,7 @@
 import matplotlib.pyplot as plt
 
 from matplotlib.colors import Normalize
+from matplotlib.figure import Figure
 import matplotlib.cm as cm
 
 import json
@@ -99,9 +100,10 @@ def plot_seeds_log_json(data, fig_path):
     n_thres = len(data)
 
     fig_width = 6
-    fig, axes = plt.subplots(1, n_thres, 
-                            figsize=(fig_width*n_thres, fig_width), 
-                            sharey=True)
+    # A figure without pyplot, as the seeds can be made in a thread of the napari plugin
+    fig = Figure(figsize=(fig_width*n_thres, fig_width))
+    axes = fig.subplots(1, n_thres, sharey=True, squeeze=False)
+    axes = axes[0]
 
 
     for idx_thre, data_entry in enumerate(data):
@@ -136,10 +138,7 @@ def plot_seeds_log_json(data, fig_path):
     axes[0].set_ylabel('Volume')
     
     # Save the plot to a file
-    plt.savefig(fig_path)
-
-    # Close the plot to free memory and avoid displaying it
-    plt.close()
+    fig.savefig(fig_path)
 
 
 def merge_plots(plot_list, file_path):